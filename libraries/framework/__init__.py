@@ -1,3 +1,5 @@
 from .framework_logger import testcase_logger
 from .bip_files import *
-from .test_case_name_parser import *
\ No newline at end of file
+from .test_case_name_parser import *
+from .bip_dataset import BipDataset
+from .dataset_snapshot import DatasetSnapshot
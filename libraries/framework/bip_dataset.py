@@ -0,0 +1,120 @@
+import logging
+import os
+import re
+import sys
+import time
+from pathlib import Path
+import libraries.helper as helper
+from libraries.helper.file_cache import FileCache
+logger = logging.getLogger(__name__) #framework.libraries.helper
+
+CALL_FILE_PATTERN = re.compile(r'\.(?P<kind>[A-Za-z0-9]+)_call\b.*\.(tsv|csv)(\.gz|\.bgz|\.zst|\.zstd)?$')
+
+class BipDataset:
+    """
+    The call tables (snv_call, cnv_call, indel_call...) of a BIP output directory, queried together.
+    Files are found on first use and each one is parsed once, until it changes on disk.
+
+    :Usage:
+        dataset = BipDataset(test_case_directory)
+        dataset.tables                                   #{'A027954801.snv_call.hdr.tsv': 'snv', ...}
+        snv = dataset.table('snv', ['gene', 'mut_aa', 'call'])
+        genes = dataset.join({'snv': ['mut_aa', 'call'], 'bolts/csm/A027954801.cnv_call.hdr.tsv': ['copy_number']},
+                             on='gene', where={'snv': {'call': 1}})
+        dataset = BipDataset(test_case_directory, columns={'snv': ['gene', 'mut_aa', 'call']}) #parse only these
+    :Notes:
+        Tables are parsed whole unless columns lists the columns to parse for them (by path or kind). Asking a table
+        for a column it wasn't parsed with raises KeyError instead of reading the file again.
+    """
+
+    def __init__(self, directory: 'path', columns: dict = None):
+        self.directory = Path(directory)
+        self.columns = columns or {} #table name -> columns to parse, all of them for tables not listed
+        self._paths = None #relative path -> kind
+        #the racy mtime guard of FileCache re-reads a file patched in place within its mtime tick
+        self._loaded = FileCache(sys.maxsize)
+
+    @property
+    def tables(self) -> dict:
+        if self._paths is None:
+            self._paths = {}
+            for path in sorted(self.directory.rglob('*')):
+                match = CALL_FILE_PATTERN.search(path.name)
+                if match and path.is_file():
+                    self._paths[path.relative_to(self.directory).as_posix()] = match.group('kind')
+            logger.info('Found call tables {} in {}'.format(self._paths, self.directory))
+        return self._paths
+
+    def resolve(self, name: str) -> str:
+        """
+        Relative path of a table, from its path or its kind ('snv', 'cnv'...) when only one file has that kind.
+        """
+        if name in self.tables:
+            return name
+        candidates = [path for path, kind in self.tables.items() if kind == name]
+        if len(candidates) != 1:
+            raise ValueError("{} matches {} call tables in {}: {}".format(name, len(candidates), self.directory, candidates))
+        return candidates[0]
+
+    def table(self, name: str, columns: list = None) -> 'panda dataframe':
+        """
+        Columns of a call table. The file is parsed on the first call and again only after it changes.
+
+        :Returns:
+            a pandas dataframe of the columns in the order given, all the parsed columns for columns=None
+        """
+        relative_path = self.resolve(name)
+        path = self.directory / relative_path
+        file_stat = os.stat(path)
+        stat_key = (file_stat.st_ino, file_stat.st_mtime_ns, file_stat.st_size)
+        loaded = self._loaded.get(relative_path, stat_key)
+        if loaded is None:
+            parse_columns = self.columns.get(relative_path, self.columns.get(self.tables[relative_path]))
+            start = time.perf_counter()
+            loaded = helper.pandas_helper.read_columns(path, parse_columns)
+            self._loaded.put(relative_path, stat_key, loaded, 0, time.perf_counter() - start)
+        columns = list(loaded.columns) if columns is None else list(columns)
+        missing_columns = [column for column in columns if column not in loaded.columns]
+        if missing_columns:
+            raise KeyError("{} was parsed without columns {}, add them to BipDataset(columns=...)".format(relative_path, missing_columns))
+        table = loaded[columns]
+        table.name = str(path)
+        return table
+
+    def find(self, name: str, key_value: dict, columns: list = None) -> 'panda dataframe':
+        """
+        Rows of a call table matching every key, value pair, like helper.pandas_helper.get_entry_in_dataframe().
+
+        :Usage:
+            rows = dataset.find('snv', {'gene': 'KRAS', 'call': 1}, ['mut_aa', 'percentage'])
+        :Returns:
+            a pandas dataframe of the key columns and columns
+        """
+        table = self.table(name, list(dict.fromkeys(list(key_value) + list(columns or []))))
+        return table.iloc[helper.pandas_helper.find_rows(table, key_value)]
+
+    def join(self, tables: dict, on: 'str or list' = 'gene', how: str = 'inner', where: dict = None) -> 'panda dataframe':
+        """
+        Join call tables on shared columns, e.g. the snv and cnv calls of every gene.
+
+        :Usage:
+            genes = dataset.join({'snv': ['mut_aa', 'call'], 'indel': ['mut_aa', 'call']}, on=['run_sample_id', 'gene'],
+                                 how='outer', where={'snv': {'call': 1}})
+        :Returns:
+            a pandas dataframe of the join columns and '<name>.<column>' for the columns of each table
+        :Notes:
+            where filters a table before the join. Each table is parsed once however many joins and finds use it.
+        """
+        on = [on] if isinstance(on, str) else list(on)
+        where = where or {}
+        joined = None
+        for name, columns in tables.items():
+            key_value = where.get(name)
+            if key_value:
+                table = self.find(name, key_value, on + list(columns))
+            else:
+                table = self.table(name, list(dict.fromkeys(on + list(columns))))
+            table = table[on + list(columns)].rename(columns={column: "{}.{}".format(name, column) for column in columns})
+            joined = table if joined is None else joined.merge(table, how=how, on=on)
+        logger.info('Joined {} on {}: {} rows'.format(list(tables), on, len(joined)))
+        return joined.reset_index(drop=True)
@@ -1,10 +1,39 @@
+import hashlib
 import logging
+import mmap
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import libraries.helper as helper
+try:
+    import xxhash
+except ImportError: #optional, FAST_DIGEST falls back to hashlib
+    xxhash = None
 logger = logging.getLogger(__name__) #framework.libraries.helper
 
-def update_row_in_tsv(tsv_path: 'path', target_row_entry:dict, replacement_row_entry:dict):
-    helper.pandas_helper.update_row_entry_in_tsv_file(tsv_path, target_row_entry, replacement_row_entry)
+HASH_CHUNK_BYTES = 8 * 1024 * 1024 #bytes handed to the digest at a time, hashlib releases the GIL for each
+HASH_MMAP_MIN_BYTES = 64 * 1024 * 1024 #files this big are hashed through mmap instead of read()
+HASH_MAX_WORKERS = min(8, os.cpu_count() or 1) #files hash_files() hashes at the same time
+HASH_RACY_NS = 2 * 10**9 #files modified this close to being hashed are not cached, mtime may not change on the next write
+FAST_DIGEST = 'xxh3_128' if xxhash else 'sha1' #for change detection only, manifests need md5
+
+def update_row_in_tsv(tsv_path: 'path', target_row_entry:dict, replacement_row_entry:dict) -> list:
+    """
+    Replace values in the 1 row of a bip tsv that matches target_row_entry.
+
+    :Usage:
+        bip_files.update_row_in_tsv(snv_path, {'gene': 'TOPAZ1'}, {'gene': 'KEAP1', 'mut_aa': 'G31A'})
+    :Returns:
+        list of changed rows, see helper.pandas_helper.TsvEditor.commit()
+    :Notes:
+        Only the matching line is rewritten, the other rows keep their bytes so get_md5sum() only changes with the row.
+        To change several rows with one read and one write, use helper.pandas_helper.edit_tsv_file()
+    """
+    with helper.pandas_helper.edit_tsv_file(tsv_path) as editor:
+        editor.update(target_row_entry, replacement_row_entry)
+    return editor.changes
 
 def update_manifest_md5(manifest_path: str, file_name:str, new_md5: str, verbose=False) : # TODO group all md5 functions into seperate module
     """
@@ -18,6 +47,8 @@ def update_manifest_md5(manifest_path: str, file_name:str, new_md5: str, verbose
         bip_files.update_manifest_md5(manifest_path, file_name, "abc")
     :Returns:
         None
+    :Notes:
+        The manifest is updated in process and written back atomically, see json_helper.update_json_file_batch()
     :Example manifest.json:
         {
             "category": "full_bam", 
@@ -33,6 +64,49 @@ def update_manifest_md5(manifest_path: str, file_name:str, new_md5: str, verbose
     jamespath_search_expression = "elements[?file_name=='{}'].md5".format(file_name)
     helper.json_helper.update_json_file(manifest_path, jamespath_search_expression, new_md5, verbose)
 
+def refresh_manifest(manifest_path: 'path', file_paths: list = None, verbose=False) -> list:
+    """
+    Bring the md5 and file_size of manifest entries up to date with their files, reading and writing the manifest once.
+    Files are hashed in parallel and only when they changed since they were last hashed, see hash_files().
+
+    :Usage:
+        bip_files.refresh_manifest(test_case_directory / "manifest.boltons.json", [snv_path, cnv_path])
+        bip_files.refresh_manifest(test_case_directory / "manifest.boltons.json") #every entry whose file exists
+    :Returns:
+        list of the file_names whose entries changed
+    :Notes:
+        file_name in the manifest is relative to the manifest's directory, e.g. "bolts/csm/A027954801.cnv_call.hdr.tsv".
+        file_paths can be absolute or relative to the manifest's directory. The manifest is only written if an entry changed.
+    """
+    manifest_path = Path(manifest_path)
+    base_directory = Path(os.path.abspath(manifest_path)).parent #not resolve(), data files may be symlinks
+    manifest = helper.json_helper.get_json_file(manifest_path, verbose=verbose, cache=False)
+    entries = {element['file_name']: element for element in manifest['elements']}
+
+    if file_paths is None:
+        file_names = [file_name for file_name in entries if (base_directory / file_name).is_file()]
+    else:
+        file_names = [os.path.relpath(os.path.abspath(base_directory / file_path), base_directory).replace(os.sep, '/')
+                      for file_path in file_paths] #an absolute file_path replaces base_directory
+        unknown = [file_name for file_name in file_names if file_name not in entries]
+        if unknown:
+            raise ValueError("{} not in {}".format(unknown, manifest_path))
+
+    md5s = hash_files([base_directory / file_name for file_name in file_names])
+    changed = []
+    for file_name in file_names:
+        element = entries[file_name]
+        md5 = md5s[base_directory / file_name]
+        file_size = (base_directory / file_name).stat().st_size
+        if element.get('md5') != md5 or element.get('file_size') != file_size:
+            logger.info("{}: md5 {} -> {}, file_size {} -> {}".format(file_name, element.get('md5'), md5, element.get('file_size'), file_size))
+            element['md5'], element['file_size'] = md5, file_size
+            changed.append(file_name)
+    if changed:
+        helper.json_helper.write_json_file(manifest_path, manifest, atomic=True)
+    logger.info("Refreshed {} of {} entries in {}".format(len(changed), len(file_names), manifest_path))
+    return changed
+
 def get_md5sum(filepath: str) -> str: 
     """
     Returns the md5 of the file. 
@@ -42,8 +116,104 @@ def get_md5sum(filepath: str) -> str:
         snv_location = test_case_directory / snv_tsv
         snv_md5 = emerald.get_md5sum(snv_location)
     :Returns:
-        str: md5sum 
+        str: md5sum, empty if the file can't be read
+    :Notes:
+        Hashed in process and cached until the file changes, see hash_file()
+    """
+    try:
+        return hash_file(filepath)
+    except OSError as error: #md5sum | cut printed nothing for a missing file, keep returning ''
+        logger.error("error: md5sum: {}".format(error))
+        return ''
+
+_digest_cache = {} #(algorithm, st_dev, st_ino) -> (st_size, st_mtime_ns, digest)
+_digest_cache_lock = threading.Lock()
+_digest_cache_stats = {'hits': 0, 'misses': 0, 'bytes_hashed': 0}
+
+def _new_digest(algorithm: str):
+    if algorithm.startswith('xxh'):
+        if xxhash is None:
+            raise ValueError("{} needs the xxhash package".format(algorithm))
+        return getattr(xxhash, algorithm)()
+    return hashlib.new(algorithm)
+
+def _hash_open_file(input_file, size: int, algorithm: str) -> str:
+    digest = _new_digest(algorithm)
+    if size >= HASH_MMAP_MIN_BYTES:
+        with mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+            for start in range(0, len(view), HASH_CHUNK_BYTES):
+                digest.update(view[start:start + HASH_CHUNK_BYTES])
+    else:
+        buffer = bytearray(min(HASH_CHUNK_BYTES, max(size, 1)))
+        with memoryview(buffer) as view:
+            for length in iter(lambda: input_file.readinto(buffer), 0):
+                digest.update(view[:length])
+    return digest.hexdigest()
+
+def hash_file(filepath: 'path', algorithm: str = 'md5') -> str:
+    """
+    Returns the digest of a file, reading it again only if its device, inode, size or mtime changed since the last call.
+
+    :Usage:
+        md5 = bip_files.hash_file(test_case_directory / "A018659601.short.bwamem.cram")
+        changed = bip_files.hash_file(snv_path, bip_files.FAST_DIGEST) != before
+    :Returns:
+        str: hex digest
+    :Notes:
+        algorithm is any hashlib name, or xxh3_64/xxh3_128/xxh64 when xxhash is installed.
+        Use md5 for manifests and FAST_DIGEST when the digest only has to change with the content.
+    """
+    hashed_at = time.time_ns()
+    with open(filepath, 'rb') as input_file:
+        file_stat = os.fstat(input_file.fileno())
+        cache_key = (algorithm, file_stat.st_dev, file_stat.st_ino)
+        entry = _digest_cache.get(cache_key)
+        if entry is not None and entry[:2] == (file_stat.st_size, file_stat.st_mtime_ns):
+            with _digest_cache_lock:
+                _digest_cache_stats['hits'] += 1
+            return entry[2]
+        digest = _hash_open_file(input_file, file_stat.st_size, algorithm)
+    with _digest_cache_lock:
+        _digest_cache_stats['misses'] += 1
+        _digest_cache_stats['bytes_hashed'] += file_stat.st_size
+        if file_stat.st_mtime_ns < hashed_at - HASH_RACY_NS:
+            _digest_cache[cache_key] = (file_stat.st_size, file_stat.st_mtime_ns, digest)
+        else:
+            _digest_cache.pop(cache_key, None)
+    logger.info("{} of {} is {}".format(algorithm, filepath, digest))
+    return digest
+
+def hash_files(filepaths: list, algorithm: str = 'md5', max_workers: int = None) -> dict:
+    """
+    Returns the digests of many files, hashing the changed ones in parallel threads.
+
+    :Usage:
+        md5s = bip_files.hash_files([snv_path, cnv_path, cram_path])
+    :Returns:
+        dict: filepath -> hex digest, in the order of filepaths
+    """
+    with ThreadPoolExecutor(max_workers=max_workers or HASH_MAX_WORKERS) as executor:
+        digests = executor.map(hash_file, filepaths, [algorithm] * len(filepaths))
+        return dict(zip(filepaths, digests))
+
+def get_hash_cache_stats() -> dict:
+    """
+    Returns the hits, misses and bytes_hashed of hash_file() since the cache was cleared.
+
+    :Usage:
+        logger.info(bip_files.get_hash_cache_stats())
+    """
+    with _digest_cache_lock:
+        return dict(_digest_cache_stats, entries=len(_digest_cache))
+
+def clear_hash_cache():
+    """
+    Forget every digest hash_file() cached, e.g. after a file was changed without changing its size or mtime.
+
+    :Usage:
+        bip_files.clear_hash_cache()
     """
-    bash_command_for_md5 = "md5sum {} | cut -d ' ' -f1".format(str(filepath))
-    md5sum = helper.subprocess_helper.run(bash_command_for_md5)
-    return md5sum
+    with _digest_cache_lock:
+        _digest_cache.clear()
+        for name in _digest_cache_stats:
+            _digest_cache_stats[name] = 0
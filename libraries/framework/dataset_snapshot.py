@@ -0,0 +1,201 @@
+import fnmatch
+import logging
+import os
+import shutil
+import stat
+import tempfile
+from pathlib import Path
+try:
+    import fcntl
+except ImportError: #not on windows, files are always copied
+    fcntl = None
+logger = logging.getLogger(__name__) #framework.libraries.helper
+
+FICLONE = 0x40049409 #linux ioctl that makes destination share source's blocks (btrfs, xfs, overlayfs on top of them)
+WRITTEN_PATTERNS = ('*.json', '*.tsv', '*.csv') #files tests and the pipeline write, checkout() copies them instead of linking
+
+def _stat_key(file_stat: os.stat_result) -> tuple:
+    #ctime can't be set back by a test, so an edit that keeps size and mtime is still seen
+    return (file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ctime_ns, file_stat.st_ino)
+
+def _walk(directory: str) -> 'dict, set':
+    #relative path -> stat key of every file, and the relative paths of the directories under directory
+    files, directories = {}, set()
+    pending = ['']
+    while pending:
+        relative_directory = pending.pop()
+        with os.scandir(os.path.join(directory, relative_directory)) as entries:
+            for entry in entries:
+                relative_path = os.path.join(relative_directory, entry.name)
+                if entry.is_dir(follow_symlinks=False):
+                    directories.add(relative_path)
+                    pending.append(relative_path)
+                else:
+                    files[relative_path] = _stat_key(entry.stat(follow_symlinks=False))
+    return files, directories
+
+def _snapshot_key(file_stat: os.stat_result) -> tuple:
+    #hardlinking a snapshot file changes its ctime, a write changes its size or mtime
+    return (file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino, stat.S_IMODE(file_stat.st_mode))
+
+def _clone_file(source: str, destination: str, mode: int = None):
+    #a reflink costs no data blocks and no copy time, otherwise the bytes are copied. mode defaults to source's
+    with open(source, 'rb') as source_file, open(destination, 'wb') as destination_file:
+        try:
+            if fcntl is None:
+                raise OSError
+            fcntl.ioctl(destination_file.fileno(), FICLONE, source_file.fileno())
+            cloned = True
+        except OSError:
+            cloned = False
+    if not cloned:
+        shutil.copyfile(source, destination)
+    if mode is None:
+        shutil.copymode(source, destination)
+    else:
+        os.chmod(destination, mode)
+
+class DatasetSnapshot:
+    """
+    A pristine copy of a data directory taken once, that puts back only the files a test changed, added or deleted.
+    Changes are found by comparing size, mtime, ctime and inode against the copy, so restoring costs a stat of every
+    file plus a copy of the changed ones instead of a git checkout of the whole directory.
+
+    :Usage:
+        snapshot = framework.DatasetSnapshot(Path(__file__).parent.parent / "data")
+        ... #tests change files in the data directory
+        restored = snapshot.restore()
+        workspace = snapshot.checkout(tmp_path / "data") #or give each test its own copy, see checkout()
+        snapshot.close()
+    :Notes:
+        Files are copied with reflinks when the snapshot directory is on the same btrfs/xfs filesystem, else byte by byte.
+        restore() copies instead of hardlinking, the data directory is the git checkout and is edited with any tool.
+        Snapshot files are read-only, see checkout() and verify().
+    """
+
+    def __init__(self, data_path: 'path', snapshot_dir: 'path' = None):
+        self.data_path = Path(data_path)
+        self._owns_snapshot_dir = snapshot_dir is None
+        self.snapshot_dir = Path(snapshot_dir or tempfile.mkdtemp(prefix='xframework_snapshot_'))
+        self._files, self._directories = _walk(str(self.data_path))
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        for relative_directory in sorted(self._directories):
+            os.makedirs(self.snapshot_dir / relative_directory, exist_ok=True)
+        self._modes = {} #relative path -> mode of the file in the data directory
+        self._snapshot_keys = {}
+        for relative_path in self._files:
+            snapshot_path = str(self.snapshot_dir / relative_path)
+            self._modes[relative_path] = stat.S_IMODE(os.stat(self.data_path / relative_path).st_mode)
+            _clone_file(str(self.data_path / relative_path), snapshot_path)
+            #a write through a workspace hardlink then fails, except for root (e.g. a container), which verify() catches
+            os.chmod(snapshot_path, self._modes[relative_path] & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+            self._snapshot_keys[relative_path] = _snapshot_key(os.stat(snapshot_path))
+        logger.info("Captured {} files of {} in {}".format(len(self._files), self.data_path, self.snapshot_dir))
+
+    def changes(self) -> dict:
+        """
+        Files of the data directory that differ from the snapshot.
+
+        :Returns:
+            dict: 'modified', 'added' and 'deleted' relative paths, and 'added_directories'
+        """
+        files, directories = _walk(str(self.data_path))
+        return {
+            'modified': sorted(path for path, stat_key in files.items() if path in self._files and self._files[path] != stat_key),
+            'added': sorted(path for path in files if path not in self._files),
+            'deleted': sorted(path for path in self._files if path not in files),
+            'added_directories': sorted(directories - self._directories),
+        }
+
+    def restore(self) -> list:
+        """
+        Put the data directory back the way it was captured.
+
+        :Usage:
+            snapshot.restore()
+        :Returns:
+            list of the relative paths that were copied back or removed
+        """
+        changes = self.changes()
+        for relative_path in changes['added']:
+            os.unlink(self.data_path / relative_path)
+        for relative_directory in sorted(changes['added_directories'], reverse=True):
+            shutil.rmtree(self.data_path / relative_directory, ignore_errors=True)
+        for relative_directory in sorted(self._directories):
+            os.makedirs(self.data_path / relative_directory, exist_ok=True)
+        for relative_path in changes['modified'] + changes['deleted']:
+            destination = self.data_path / relative_path
+            file_descriptor, temp_path = tempfile.mkstemp(dir=destination.parent, prefix='.tmp_')
+            os.close(file_descriptor)
+            try:
+                _clone_file(str(self.snapshot_dir / relative_path), temp_path, self._modes[relative_path])
+                os.replace(temp_path, destination) #a reader of the old file keeps its inode
+            except:
+                os.unlink(temp_path)
+                raise
+            self._files[relative_path] = _stat_key(os.stat(destination))
+        restored = changes['modified'] + changes['deleted'] + changes['added']
+        logger.info("Restored {} files of {}: {}".format(len(restored), self.data_path, restored))
+        return restored
+
+    def checkout(self, workspace: 'path', written: tuple = WRITTEN_PATTERNS) -> Path:
+        """
+        A private writable copy of the snapshot for one test or one xdist worker, so tests never share files.
+
+        :Usage:
+            workspace = snapshot.checkout(tmp_path / "data")
+            titanite = Titanite_v1(workspace / "general_352")
+        :Returns:
+            Path: workspace
+        :Notes:
+            Files whose name matches a written pattern (json, tsv and csv by default) are copied, with reflinks where
+            the filesystem has them. The other files are hardlinked to the snapshot, so a workspace costs one directory
+            entry for each of them, and are read-only: open them with 'w', 'a' or 'r+' and the write fails, unless you
+            are root. verify() finds the snapshot files changed that way.
+            Files are cloned instead of hardlinked when the workspace is on another filesystem.
+        """
+        workspace = Path(workspace)
+        os.makedirs(workspace, exist_ok=True)
+        for relative_directory in sorted(self._directories):
+            os.makedirs(workspace / relative_directory, exist_ok=True)
+        linked = 0
+        for relative_path in self._files:
+            source, destination = str(self.snapshot_dir / relative_path), str(workspace / relative_path)
+            if any(fnmatch.fnmatch(os.path.basename(relative_path), pattern) for pattern in written):
+                _clone_file(source, destination, self._modes[relative_path])
+                continue
+            try:
+                os.link(source, destination)
+                linked += 1
+            except OSError: #another filesystem
+                _clone_file(source, destination, self._modes[relative_path])
+        logger.info("Checked out {} files ({} hardlinked) of {} in {}".format(len(self._files), linked, self.data_path, workspace))
+        return workspace
+
+    def verify(self) -> list:
+        """
+        Snapshot files that changed since they were captured, e.g. written through a workspace hardlink by root.
+
+        :Usage:
+            changed = dataset_snapshot.verify()
+            assert not changed, "snapshot files changed: {}".format(changed)
+        :Returns:
+            list of relative paths
+        """
+        changed = []
+        for relative_path, snapshot_key in self._snapshot_keys.items():
+            try:
+                if _snapshot_key(os.stat(self.snapshot_dir / relative_path)) != snapshot_key:
+                    changed.append(relative_path)
+            except FileNotFoundError:
+                changed.append(relative_path)
+        if changed:
+            logger.error("Snapshot files of {} changed: {}".format(self.data_path, changed))
+        return changed
+
+    def close(self):
+        """
+        Remove the snapshot directory if the snapshot created it.
+        """
+        if self._owns_snapshot_dir:
+            shutil.rmtree(self.snapshot_dir, ignore_errors=True)
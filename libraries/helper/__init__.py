@@ -1,4 +1,4 @@
-from .check_helper import equal, not_equal
+from .check_helper import equal, not_equal, no_differences
 from . import pandas_helper 
 from . import json_helper 
 from .docker_helper import DockerHelper as docker_helper
@@ -10,6 +10,10 @@ def not_equal(a,b):
     temp = _CheckHelper("not equal")
     temp.not_equal(a,b)
 
+def no_differences(differences, description=''):
+    temp = _CheckHelper("no differences")
+    temp.no_differences(differences, description)
+
 #Written this way to append Check failures to the log. 
 #One module method is one class so when it exits, __del__() is called and immediately appends to log
     #otherwise all failures will be appended at the end, instead of immediately after each check
@@ -60,6 +64,20 @@ class _CheckHelper:
         """
         self.check.not_equal(a,b)
 
+    @library_logger
+    def no_differences(self, differences: list, description: str = ''):
+        """
+        Check that a list of differences is empty. All differences are reported in a single failure.
+
+        :Usage:
+            differences = ["results[0].value: expected 'Detected', actual 'Not Detected'"]
+            helper.check_helper.no_differences(differences, "output.json")
+        :Returns:
+            None
+        """
+        message = "{} difference(s) in {}:\n{}".format(len(differences), description, "\n".join(str(difference) for difference in differences))
+        self.check.is_false(differences, message)
+
 
 
         
@@ -1,6 +1,6 @@
 import logging
 import docker
-from .logging_helper import library_logger
+from .logging_helper import library_logger, lazy_str
 
 logger = logging.getLogger(__name__) #framework.libraries.helper
 
@@ -55,5 +55,5 @@ class DockerHelper():
             return output[0] #just return stdout, stderr will be empty since exit code is 0. Parse this because it returns bytes or none
         else:
             logger.warning("bash run returned an error")
-            logger.info("stdout is: {}\n stderr is: {}".format(output[0], output[1]))
+            logger.info("stdout is: %s\n stderr is: %s", lazy_str(output[0]), lazy_str(output[1]))
             return exit_code, output
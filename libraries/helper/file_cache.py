@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import OrderedDict
+
+RACY_NS = 2 * 10**9 #files modified this close to being read are parsed again next time, like bip_files.HASH_RACY_NS
+
+class FileCache:
+    """
+    Parsed files kept in memory, shared by json_helper and pandas_helper. An entry is valid while the stat key the caller
+    took of the file (inode, mtime_ns, size) is unchanged. Least recently used entries are evicted once the sizes the
+    caller gave put() add up to more than max_bytes.
+
+    :Usage:
+        _document_cache = FileCache(JSON_CACHE_MAX_BYTES)
+        json_obj = _document_cache.get(path, stat_key)
+        _document_cache.put(path, stat_key, json_obj, stat_key[2], parse_seconds)
+    :Notes:
+        A file can be cached in several variants (e.g. pandas_helper's compact dataframes), invalidate() drops all of them.
+        extra_stats are counters the caller bumps with count(), they are reset by clear() and returned by get_stats().
+        Files modified less than racy_ns before they were read are not kept: a same size rewrite in the same mtime tick
+        would keep the stat key and the old value would be returned. racy_ns=None keeps them.
+    """
+
+    def __init__(self, max_bytes: int, extra_stats: tuple = (), racy_ns: int = RACY_NS):
+        self.max_bytes = max_bytes
+        self.racy_ns = racy_ns
+        self._entries = OrderedDict() #(path, variant) -> (stat_key, value, size, parse_seconds)
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'evictions': 0,
+                      'parse_seconds': 0.0, 'parse_seconds_saved': 0.0}
+        self.stats.update((name, 0) for name in extra_stats)
+
+    def count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def get(self, path: str, stat_key: tuple, variant=None):
+        key = (path, variant)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != stat_key:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            self.stats['parse_seconds_saved'] += entry[3]
+            return entry[1]
+
+    def put(self, path: str, stat_key: tuple, value, size: int, parse_seconds: float, variant=None):
+        key = (path, variant)
+        read_at = time.time_ns() - int(parse_seconds * 10**9)
+        with self._lock:
+            self.stats['parse_seconds'] += parse_seconds
+            self._discard(key)
+            if size > self.max_bytes:
+                return
+            if self.racy_ns is not None and stat_key[1] >= read_at - self.racy_ns:
+                return
+            self._entries[key] = (stat_key, value, size, parse_seconds)
+            self._bytes += size
+            self._evict()
+
+    def resize(self, max_bytes: int):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def invalidate(self, path: str):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == path]:
+                self._discard(key)
+                self.stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            for name in self.stats:
+                self.stats[name] = type(self.stats[name])()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats.update(entries=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes)
+            return stats
+
+    def _evict(self):
+        while self._bytes > self.max_bytes:
+            self._discard(next(iter(self._entries)))
+            self.stats['evictions'] += 1
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+        return entry is not None
@@ -1,11 +1,173 @@
 import json
 import logging
+import os
+import re
+import stat
+import tempfile
+import time
+from functools import lru_cache
 import jmespath
-import libraries.helper as helper
+from jmespath.parser import ParsedResult
+from jmespath.visitor import TreeInterpreter
+from .logging_helper import lazy_json, lazy_str
+from . import check_helper
+from .file_cache import FileCache
 
 logger = logging.getLogger(__name__) #framework.libraries.helper
 
-def get_json_file(path: str, mode: str = 'r', verbose=True) -> 'json obj':
+QUERY_CACHE_SIZE = 256 #number of compiled jmespath expressions kept in memory
+
+@lru_cache(maxsize=QUERY_CACHE_SIZE)
+def _compile_expression(jmespath_search_expression: str) -> 'jmespath ParsedResult':
+    return jmespath.compile(jmespath_search_expression)
+
+def compile_query(jmespath_search_expression: 'str or jmespath ParsedResult') -> 'jmespath ParsedResult':
+    """
+    Compile a jmespath expression once so it can be reused without being parsed again.
+    Compiled expressions are kept in a bounded LRU cache shared by get_json_value().
+
+    :Usage:
+        query = helper.json_helper.compile_query("results[?name=='MET'].value")
+        value = helper.json_helper.get_json_value(query, json_file)
+    :Returns:
+        a compiled jmespath expression. Call .search(json_obj) or pass it to get_json_value()
+    :Notes:
+        An already compiled expression is returned as is
+    """
+    if isinstance(jmespath_search_expression, ParsedResult):
+        return jmespath_search_expression
+    try:
+        return _compile_expression(jmespath_search_expression)
+    except jmespath.exceptions.JMESPathError:
+        logger.error("Could not compile jmespath expression {}".format(jmespath_search_expression), exc_info=1)
+        raise
+
+def get_query_cache_stats() -> dict:
+    """
+    Hit and miss counters of the compiled jmespath expression cache.
+
+    :Usage:
+        stats = helper.json_helper.get_query_cache_stats()
+        logger.info("jmespath cache: {}".format(stats))
+    :Returns:
+        dict with hits, misses, maxsize and currsize
+    """
+    return _compile_expression.cache_info()._asdict()
+
+def clear_query_cache():
+    """
+    Empty the compiled jmespath expression cache and reset its counters.
+
+    :Usage:
+        helper.json_helper.clear_query_cache()
+    :Returns:
+        None
+    """
+    _compile_expression.cache_clear()
+
+JSON_CACHE_MAX_BYTES = 256 * 1024 * 1024 #total size of the json files kept parsed in memory
+
+def _read_only(self, *args, **kwargs):
+    raise TypeError("json from get_json_file() is read-only. Use get_json_file(path, copy=True) to edit it")
+
+class _ReadOnlyDict(dict):
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self): #copy.deepcopy and pickle hand back a plain dict
+        return (dict, (dict(self),))
+
+class _ReadOnlyList(list):
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = pop = remove = reverse = sort = clear = _read_only
+
+    def __reduce__(self):
+        return (list, (list(self),))
+
+#jmespath functions such as length() check type(value).__name__ instead of isinstance()
+_ReadOnlyDict.__name__ = 'dict'
+_ReadOnlyList.__name__ = 'list'
+
+def _freeze(json_obj):
+    if isinstance(json_obj, dict):
+        return _ReadOnlyDict((key, _freeze(value)) for key, value in json_obj.items())
+    if isinstance(json_obj, list):
+        return _ReadOnlyList(_freeze(value) for value in json_obj)
+    return json_obj
+
+def _thaw(json_obj):
+    if isinstance(json_obj, dict):
+        return {key: _thaw(value) for key, value in json_obj.items()}
+    if isinstance(json_obj, list):
+        return [_thaw(value) for value in json_obj]
+    return json_obj
+
+_document_cache = FileCache(JSON_CACHE_MAX_BYTES)
+
+def _cache_path(path) -> str:
+    return os.path.realpath(str(path))
+
+def _load_json_file(path, mode: str, cache: bool) -> 'json obj':
+    if not cache:
+        with open(path, mode) as input_file:
+            return json.load(input_file)
+    cache_path = _cache_path(path)
+    file_stat = os.stat(cache_path)
+    stat_key = (file_stat.st_ino, file_stat.st_mtime_ns, file_stat.st_size)
+    input_json = _document_cache.get(cache_path, stat_key)
+    if input_json is None:
+        start = time.perf_counter()
+        with open(cache_path, mode) as input_file:
+            input_json = _freeze(json.load(input_file))
+        _document_cache.put(cache_path, stat_key, input_json, stat_key[2], time.perf_counter() - start)
+    return input_json
+
+def get_json_cache_stats() -> dict:
+    """
+    Counters of the parsed json file cache used by get_json_file().
+
+    :Usage:
+        stats = helper.json_helper.get_json_cache_stats()
+        logger.info("saved {} seconds of json parsing".format(stats['parse_seconds_saved']))
+    :Returns:
+        dict with hits, misses, invalidations, evictions, parse_seconds, parse_seconds_saved, entries, bytes and max_bytes
+    """
+    return _document_cache.get_stats()
+
+def set_json_cache_limit(max_bytes: int):
+    """
+    Change the total size of json files kept parsed in memory. 0 disables the cache.
+
+    :Usage:
+        helper.json_helper.set_json_cache_limit(64 * 1024 * 1024)
+    :Returns:
+        None
+    """
+    _document_cache.resize(max_bytes)
+
+def invalidate_json_cache(path: 'path'):
+    """
+    Drop a file from the parsed json cache. write_json_file() and update_json_file() call this for you.
+
+    :Usage:
+        helper.json_helper.invalidate_json_cache(test_case_directory / "output.json")
+    :Returns:
+        None
+    """
+    _document_cache.invalidate(_cache_path(path))
+
+def clear_json_cache():
+    """
+    Empty the parsed json cache and reset its counters.
+
+    :Usage:
+        helper.json_helper.clear_json_cache()
+    :Returns:
+        None
+    """
+    _document_cache.clear()
+
+def get_json_file(path: str, mode: str = 'r', verbose=True, copy=False, cache=True) -> 'json obj':
     """
     Convert a file that ends in .json and return it as a python object.
     https://docs.python.org/3/library/json.html
@@ -13,20 +175,26 @@ def get_json_file(path: str, mode: str = 'r', verbose=True) -> 'json obj':
     :Usage:
         json_file = helper.json_helper.get_json_file(test_case_directory / input_json)
         value = helper.json_helper.get_json_value(search_expression, json_file)
+        editable_json = helper.json_helper.get_json_file(test_case_directory / input_json, copy=True)
     :Returns:
         A python object
+    :Notes:
+        The parsed file is cached until its inode, mtime or size changes, so it is only parsed again when it is rewritten.
+        Files modified in the last 2 seconds are not cached, their mtime may not change on the next write.
+        The returned object is shared and read-only; pass copy=True for an editable copy or cache=False to skip the cache.
     """
     try:
-        with open(path, mode) as input_file:
-            input_json = json.load(input_file)
+        input_json = _load_json_file(path, mode, cache)
+        if copy and cache:
+            input_json = _thaw(input_json)
         if verbose:
-            logger.info("{} is: {}".format(path, json.dumps(input_json, indent=2)))
+            logger.info("%s is: %s", path, lazy_json(input_json))
         return input_json
     except:
         logger.error("Could not open json", exc_info=1)
         raise NameError
 
-def get_json_value(jmespath_search_expression: str, json_obj: 'json obj', verbose=True) -> 'json element':
+def get_json_value(jmespath_search_expression: 'str or compiled query', json_obj: 'json obj', verbose=True) -> 'json element':
     """
     Extract elements from a JSON obj
     jmespath: similar to xpath but for json. https://jmespath.org/tutorial.html
@@ -39,13 +207,197 @@ def get_json_value(jmespath_search_expression: str, json_obj: 'json obj', verbos
     :Notes:
         jmespath.search('foo.bar', {'foo': {'bar': 'baz'}})
         'baz'
+        The expression is compiled through compile_query() so repeated searches skip parsing
     """
-    value = jmespath.search(jmespath_search_expression, json_obj)
+    query = compile_query(jmespath_search_expression)
+    value = query.search(json_obj)
     if verbose:
-        logger.info('Found {} using {} in {}'.format(value, jmespath_search_expression, json.dumps(json_obj, indent=2)))
+        logger.info('Found %s using %s in %s', lazy_str(value), query.expression, lazy_json(json_obj))
     return value
 
-def write_json_file(destination: 'Path to output.json', json_obj: 'obj'):
+def verify_json_values(json_file: 'path or json obj', expected_values: dict, verbose=True) -> dict:
+    """
+    Check many jmespath expressions against their expected values in one pass over a json.
+    The file is parsed once and every mismatch is reported together through check_helper, so the test continues.
+
+    :Usage:
+        expected_values = {
+            "sampleid": "A027954801",
+            "results[?name=='Eligible MET Amplification'].value | [0]": "Detected",
+        }
+        mismatches = helper.json_helper.verify_json_values(test_case_directory / "output.json", expected_values)
+    :Returns:
+        dict of jmespath expression -> (actual, expected) for every mismatch
+    :Notes:
+        json_file can be a path or an already loaded json obj. Expressions are compiled through compile_query().
+        true and 1 (false and 0) are different values, as in diff_json().
+    """
+    if isinstance(json_file, (str, os.PathLike)):
+        description = str(json_file)
+        json_obj = get_json_file(json_file, verbose=False)
+    else:
+        description = "json obj"
+        json_obj = json_file
+
+    mismatches = {}
+    for jmespath_search_expression, expected_value in expected_values.items():
+        query = compile_query(jmespath_search_expression)
+        actual_value = query.search(json_obj)
+        if not _json_equal(actual_value, expected_value):
+            mismatches[query.expression] = (actual_value, expected_value)
+    if verbose:
+        logger.info("Verified %s values in %s, %s mismatches", len(expected_values), description, len(mismatches))
+
+    differences = ["{}: expected {!r}, actual {!r}".format(expression, expected_value, actual_value)
+                   for expression, (actual_value, expected_value) in mismatches.items()]
+    check_helper.no_differences(differences, description)
+    return mismatches
+
+_IDENTIFIER = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+def _path_pattern(patterns) -> 're.Pattern':
+    #jmespath-like path globs, * matches any run of characters: 'meta.*_time', 'results[*].confidence'
+    if not patterns:
+        return None
+    return re.compile("|".join("(?:{})".format(re.escape(pattern).replace(r'\*', '.*')) for pattern in patterns))
+
+def _child_path(path: str, key: str) -> str:
+    key = key if _IDENTIFIER.fullmatch(key) else json.dumps(key)
+    return "{}.{}".format(path, key) if path else key
+
+def _keyed_path(path: str, key_field: str, key_value, occurrence: int) -> str:
+    literal = "'{}'".format(key_value.replace("'", "\\'")) if isinstance(key_value, str) else "`{}`".format(json.dumps(key_value))
+    keyed = "{}[?{}=={}]".format(path, _child_path('', key_field), literal)
+    return keyed if occurrence == 0 else "{} | [{}]".format(keyed, occurrence)
+
+def _leaf_equal(actual, expected) -> bool:
+    #true and 1 are different json values even though python compares them equal
+    if (type(actual) is bool) != (type(expected) is bool):
+        return False
+    return actual == expected
+
+def _json_equal(actual, expected) -> bool:
+    #== that keeps true and 1 apart at every level of a list or object
+    if isinstance(actual, dict) and isinstance(expected, dict):
+        return actual.keys() == expected.keys() and all(_json_equal(actual[key], expected[key]) for key in actual)
+    if isinstance(actual, list) and isinstance(expected, list):
+        return len(actual) == len(expected) and all(map(_json_equal, actual, expected))
+    return _leaf_equal(actual, expected)
+
+def _key_groups(array: list, key_field: str) -> dict:
+    groups = {}
+    for element in array:
+        key_value = element.get(key_field) if isinstance(element, dict) else None
+        if isinstance(key_value, (dict, list)):
+            key_value = json.dumps(key_value, sort_keys=True)
+        groups.setdefault((type(key_value) is bool, key_value), []).append(element)
+    return groups
+
+def diff_json(actual: 'json obj', expected: 'json obj', ignore_paths: list = None, tolerances: 'float or dict' = None,
+              array_keys: dict = None, verbose=True) -> dict:
+    """
+    Structural diff of two json documents, e.g. output.json against a golden output.json.
+
+    :Usage:
+        diff = helper.json_helper.diff_json(
+            actual_json, expected_json,
+            ignore_paths=['meta.run_date', 'results[*].confidence'],
+            tolerances={'results[*].value': 0.001},   #or one number for every path
+            array_keys={'results': 'name'},           #match results elements by name instead of position
+        )
+    :Returns:
+        dict with 'added' {path: actual}, 'removed' {path: expected} and 'changed' {path: (actual, expected)}
+    :Notes:
+        Paths are jmespath, elements of keyed arrays are reported as results[?name=='MET'].
+        Path patterns in ignore_paths, tolerances and array_keys use * as a wildcard.
+        Runs in one pass over both documents, keyed arrays are matched through a dict.
+    """
+    ignore_pattern = _path_pattern(ignore_paths)
+    if isinstance(tolerances, dict):
+        tolerance_patterns = [(_path_pattern([pattern]), tolerance) for pattern, tolerance in tolerances.items()]
+    else:
+        tolerance_patterns = [(None, tolerances)] if tolerances else []
+    array_key_patterns = [(_path_pattern([pattern]), key_field) for pattern, key_field in (array_keys or {}).items()]
+
+    added, removed, changed = {}, {}, {}
+    stack = [("", actual, expected)]
+    while stack:
+        path, actual_value, expected_value = stack.pop()
+        if ignore_pattern and path and ignore_pattern.fullmatch(path):
+            continue
+        if isinstance(actual_value, dict) and isinstance(expected_value, dict):
+            for key, value in actual_value.items():
+                if key in expected_value:
+                    stack.append((_child_path(path, key), value, expected_value[key]))
+                else:
+                    added[_child_path(path, key)] = value
+            for key, value in expected_value.items():
+                if key not in actual_value:
+                    removed[_child_path(path, key)] = value
+        elif isinstance(actual_value, list) and isinstance(expected_value, list):
+            key_field = next((key_field for pattern, key_field in array_key_patterns if pattern.fullmatch(path)), None)
+            if key_field is None:
+                for position in range(max(len(actual_value), len(expected_value))):
+                    element_path = "{}[{}]".format(path, position)
+                    if position >= len(expected_value):
+                        added[element_path] = actual_value[position]
+                    elif position >= len(actual_value):
+                        removed[element_path] = expected_value[position]
+                    else:
+                        stack.append((element_path, actual_value[position], expected_value[position]))
+                continue
+            actual_groups = _key_groups(actual_value, key_field)
+            expected_groups = _key_groups(expected_value, key_field)
+            for group_key, actual_elements in actual_groups.items():
+                expected_elements = expected_groups.get(group_key, [])
+                for occurrence, element in enumerate(actual_elements):
+                    element_path = _keyed_path(path, key_field, group_key[1], occurrence)
+                    if occurrence < len(expected_elements):
+                        stack.append((element_path, element, expected_elements[occurrence]))
+                    else:
+                        added[element_path] = element
+            for group_key, expected_elements in expected_groups.items():
+                actual_count = len(actual_groups.get(group_key, []))
+                for occurrence in range(actual_count, len(expected_elements)):
+                    removed[_keyed_path(path, key_field, group_key[1], occurrence)] = expected_elements[occurrence]
+        elif not _leaf_equal(actual_value, expected_value):
+            numbers = all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in (actual_value, expected_value))
+            tolerance = next((tolerance for pattern, tolerance in tolerance_patterns if pattern is None or pattern.fullmatch(path)), None) if numbers else None
+            if tolerance is None or abs(actual_value - expected_value) > tolerance:
+                changed[path] = (actual_value, expected_value)
+
+    if verbose:
+        logger.info("json diff: %s added, %s removed, %s changed", len(added), len(removed), len(changed))
+    return {'added': added, 'removed': removed, 'changed': changed}
+
+def verify_json_matches(actual_json: 'path or json obj', expected_json: 'path or json obj', ignore_paths: list = None,
+                        tolerances: 'float or dict' = None, array_keys: dict = None, verbose=True) -> dict:
+    """
+    Compare a json against its golden copy with diff_json() and report every difference in a single check_helper failure.
+
+    :Usage:
+        diff = helper.json_helper.verify_json_matches(test_case_directory / "output.json", golden_directory / "output.json",
+                                                      ignore_paths=['meta.run_date'], array_keys={'results': 'name'})
+    :Returns:
+        dict from diff_json()
+    """
+    documents = []
+    for json_file in (actual_json, expected_json):
+        if isinstance(json_file, (str, os.PathLike)):
+            documents.append((str(json_file), get_json_file(json_file, verbose=False)))
+        else:
+            documents.append(("json obj", json_file))
+    (actual_description, actual_obj), (expected_description, expected_obj) = documents
+
+    diff = diff_json(actual_obj, expected_obj, ignore_paths, tolerances, array_keys, verbose)
+    differences = ["{}: added {!r}".format(path, value) for path, value in diff['added'].items()]
+    differences += ["{}: removed {!r}".format(path, value) for path, value in diff['removed'].items()]
+    differences += ["{}: expected {!r}, actual {!r}".format(path, expected_value, actual_value)
+                    for path, (actual_value, expected_value) in diff['changed'].items()]
+    check_helper.no_differences(differences, "{} vs {}".format(actual_description, expected_description))
+    return diff
+
+def write_json_file(destination: 'Path to output.json', json_obj: 'obj', atomic=False):
     """
     Write a json obj to a file.
     Wrapper for json.dump: https://docs.python.org/3/library/json.html
@@ -56,14 +408,332 @@ def write_json_file(destination: 'Path to output.json', json_obj: 'obj'):
         helper.json_helper.write_json_file(output_file, json)
     :Returns:
         None
+    :Notes:
+        atomic=True replaces an existing file through a temp file + rename, so readers never see half a file.
+        It keeps the indent of the file it replaces, otherwise files are written with indent=2.
+        A hardlinked file (e.g. in a DatasetSnapshot workspace) is unlinked first, so the other links keep their json.
     """
     try:
-        with open(str(destination), 'w') as outfile:
-            json.dump(json_obj, outfile, indent=2)
-        logger.info("generated {}. JSON: {}".format(destination,  json.dumps(json_obj, indent=2)))
+        if atomic:
+            _atomic_write_json(destination, json_obj)
+        else:
+            _unlink_if_hardlinked(destination)
+            with open(str(destination), 'w') as outfile:
+                json.dump(json_obj, outfile, indent=2)
+        logger.info("generated %s. JSON: %s", destination, lazy_json(json_obj))
     except:
         logger.error("Could not write to {}".format(destination), exc_info=1)
         raise NameError
+    finally:
+        invalidate_json_cache(destination)
+
+def _unlink_if_hardlinked(destination: 'path'):
+    #open('w') truncates the inode every link shares, a new file keeps the others as they are
+    try:
+        file_stat = os.stat(str(destination))
+    except FileNotFoundError:
+        return
+    if file_stat.st_nlink > 1:
+        os.unlink(str(destination))
+        os.close(os.open(str(destination), os.O_WRONLY | os.O_CREAT | os.O_EXCL))
+        os.chmod(str(destination), stat.S_IMODE(file_stat.st_mode) | stat.S_IWUSR) #the link may be read-only, the copy isn't
+
+def _jmespath_equals(a, b) -> bool:
+    #jmespath == : 0 and 1 never equal false and true, but 0.0 and 1.0 do
+    if type(a) is int and (a == 0 or a == 1) or type(b) is int and (b == 0 or b == 1):
+        if isinstance(a, bool) != isinstance(b, bool):
+            return False
+    return a == b
+
+def _needs_scan(key_value) -> bool:
+    #booleans and numbers equal to 0 or 1 don't follow python hashing equality in jmespath
+    if isinstance(key_value, (dict, list)):
+        return True
+    return isinstance(key_value, (bool, int, float)) and key_value in (0, 1)
+
+class JsonArrayIndex:
+    """
+    Hash index over the elements of a json array by one key field.
+    get(value) returns the same elements as array[?key_field==value] in O(1).
+    """
+
+    def __init__(self, array: list, key_field: str):
+        self.key_field = key_field
+        self.array = array
+        self._positions = {}
+        for position, element in enumerate(array):
+            key_value = element.get(key_field) if isinstance(element, dict) else None
+            try:
+                self._positions.setdefault(key_value, []).append(position)
+            except TypeError: #lists and objects can't be hashed, they are only found by a scan
+                pass
+
+    def positions(self, key_value) -> list:
+        if _needs_scan(key_value):
+            return [position for position, element in enumerate(self.array)
+                    if _jmespath_equals(element.get(self.key_field) if isinstance(element, dict) else None, key_value)]
+        return self._positions.get(key_value, [])
+
+    def get(self, key_value) -> list:
+        return [self.array[position] for position in self.positions(key_value)]
+
+    def __contains__(self, key_value) -> bool:
+        return bool(self.positions(key_value))
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+def index_by(json_obj: 'json obj', array_expression: str, key_field: str) -> JsonArrayIndex:
+    """
+    Build a hash index over a json array by a key field, so repeated filter lookups don't scan the array.
+
+    :Usage:
+        output_json = helper.json_helper.get_json_file(test_case_directory / "output.json")
+        results = helper.json_helper.index_by(output_json, 'results', 'name')
+        met = results.get('Eligible MET Amplification') #same as results[?name=='Eligible MET Amplification']
+    :Returns:
+        JsonArrayIndex, or None if array_expression is not an array
+    :Notes:
+        Indexes of json from get_json_file() are cached on the document. Writing the file gives a new document,
+        so the index is rebuilt after write_json_file() or update_json_file(). Editable json is indexed on every call.
+    """
+    array = compile_query(array_expression).search(json_obj)
+    if not isinstance(array, list):
+        return None
+    if not isinstance(json_obj, (_ReadOnlyDict, _ReadOnlyList)):
+        return JsonArrayIndex(array, key_field)
+    indexes = json_obj.__dict__.setdefault('_json_array_indexes', {})
+    key = (compile_query(array_expression).expression, key_field)
+    if key not in indexes:
+        indexes[key] = JsonArrayIndex(array, key_field)
+    return indexes[key]
+
+def lookup(json_obj: 'json obj', array_expression: str, key_field: str, key_value, value_expression: str = None, verbose=True) -> 'json element':
+    """
+    Indexed equivalent of get_json_value("array_expression[?key_field=='key_value'].value_expression", json_obj).
+
+    :Usage:
+        output_json = helper.json_helper.get_json_file(test_case_directory / "output.json")
+        values = helper.json_helper.lookup(output_json, 'results', 'name', 'Eligible MET Amplification', 'value')
+    :Returns:
+        list of matches, or None if array_expression is not an array
+    """
+    index = index_by(json_obj, array_expression, key_field)
+    if index is None:
+        return None
+    elements = index.get(key_value)
+    if value_expression is not None:
+        query = compile_query(value_expression)
+        elements = [value for value in map(query.search, elements) if value is not None]
+    if verbose:
+        logger.info("Found %s using %s[?%s==%r] in %s elements", lazy_str(elements), array_expression, key_field, key_value, len(index.array))
+    return elements
+
+def _equality_filter(condition: dict):
+    #(key_field, value) for [?key_field=='value'] style filters that an index can answer, otherwise None
+    if condition['type'] != 'comparator' or condition['value'] != 'eq':
+        return None
+    left, right = condition['children']
+    if left['type'] == 'literal':
+        left, right = right, left
+    if left['type'] == 'field' and right['type'] == 'literal':
+        return left['value'], right['value']
+    return None
+
+_interpreter = TreeInterpreter()
+
+def _is_true(value) -> bool:
+    #jmespath truthiness: empty strings, lists and objects are false
+    return not (value == '' or value == [] or value == {} or value is None or value is False)
+
+class _UnsupportedExpression(ValueError):
+    pass
+
+def _resolve_locations(node: dict, json_obj: 'json obj', indexes: dict = None) -> list:
+    """
+    Walk a parsed jmespath expression and return the (container, key) pairs holding the values it selects.
+    Supports fields, a.b sub expressions, [0] indexes and [*], [?filter] and * projections.
+    [?key=='value'] filters are answered from indexes, a dict of JsonArrayIndex reused across calls, when given.
+    """
+    node_type = node['type']
+    if node_type == 'field':
+        if isinstance(json_obj, dict) and node['value'] in json_obj:
+            return [(json_obj, node['value'])]
+        return []
+    if node_type == 'index_expression':
+        parent = _interpreter.visit(node['children'][0], json_obj)
+        index = node['children'][1]['value']
+        if isinstance(parent, list) and -len(parent) <= index < len(parent):
+            return [(parent, index % len(parent))]
+        return []
+    if node_type == 'subexpression':
+        *parent_nodes, last_node = node['children']
+        parent = json_obj
+        for parent_node in parent_nodes:
+            parent = _interpreter.visit(parent_node, parent)
+        return _resolve_locations(last_node, parent, indexes)
+    if node_type in ('projection', 'filter_projection', 'value_projection'):
+        parent = _interpreter.visit(node['children'][0], json_obj)
+        if node_type == 'value_projection':
+            elements = list(parent.items()) if isinstance(parent, dict) else []
+        else:
+            elements = list(enumerate(parent)) if isinstance(parent, list) else []
+        if node_type == 'filter_projection':
+            condition = node['children'][2]
+            equality_filter = _equality_filter(condition)
+            if indexes is not None and equality_filter and isinstance(parent, list):
+                key_field, key_value = equality_filter
+                index_key = (id(parent), key_field)
+                if index_key not in indexes:
+                    indexes[index_key] = JsonArrayIndex(parent, key_field)
+                elements = [(position, parent[position]) for position in indexes[index_key].positions(key_value)]
+            else:
+                elements = [(key, element) for key, element in elements if _is_true(_interpreter.visit(condition, element))]
+        right = node['children'][1]
+        if right['type'] == 'identity':
+            return [(parent, key) for key, _ in elements]
+        locations = []
+        for _, element in elements:
+            locations.extend(_resolve_locations(right, element, indexes))
+        return locations
+    raise _UnsupportedExpression("Unsupported jmespath expression for json update: {}".format(node_type))
+
+_INDENT = re.compile(r'\n([ \t]+)\S')
+
+class _JsonFloat(float):
+    #a float that is written back the way the file spelled it, e.g. 1.0e-5 instead of 1e-05
+    def __new__(cls, literal: str):
+        value = super().__new__(cls, literal)
+        value.literal = literal
+        return value
+
+_JsonFloat.__name__ = 'float' #see _ReadOnlyDict
+
+def _json_floatstr(value: float) -> str:
+    if isinstance(value, _JsonFloat):
+        return value.literal
+    if value != value:
+        return 'NaN'
+    if value in (float('inf'), float('-inf')):
+        return 'Infinity' if value > 0 else '-Infinity'
+    return float.__repr__(value)
+
+def _json_layout(text: str) -> 'indent, trailing newline, ensure_ascii':
+    #the indent of the file's first nested line, so a rewrite only changes the updated values in a diff.
+    #Non-ASCII text is kept as is unless the file escapes it (json.dump's default)
+    match = _INDENT.search(text, 0, 4096)
+    if match:
+        indent = match.group(1)
+    else:
+        indent = 2 if '\n' in text[:4096].rstrip('\n') or not text.strip() else None
+    return indent, text.endswith('\n'), text.isascii()
+
+def _atomic_write_json(destination: 'path', json_obj: 'json obj', text: str = None):
+    #text is the file's current content, read here when the caller doesn't already have it
+    destination = os.path.realpath(str(destination))
+    file_mode = stat.S_IMODE(os.stat(destination).st_mode)
+    if text is None:
+        with open(destination, 'r') as input_file:
+            text = input_file.read()
+    indent, trailing_newline, ensure_ascii = _json_layout(text)
+    if isinstance(indent, int):
+        indent = ' ' * indent
+    string_encoder = json.encoder.encode_basestring_ascii if ensure_ascii else json.encoder.encode_basestring
+    item_separator = ',' if indent is not None else ', '
+    #json.dump with a _floatstr that keeps the literals of _JsonFloat values
+    chunks = json.encoder._make_iterencode({}, json.JSONEncoder().default, string_encoder, indent, _json_floatstr,
+                                           ': ', item_separator, False, False, True)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(destination), prefix='.tmp_', suffix='.json')
+    try:
+        with os.fdopen(file_descriptor, 'w', encoding='utf-8') as outfile:
+            for chunk in chunks(json_obj, 0):
+                outfile.write(chunk)
+            if trailing_newline:
+                outfile.write('\n')
+        os.chmod(temp_path, file_mode)
+        os.replace(temp_path, destination)
+    except:
+        os.unlink(temp_path)
+        raise
+    finally:
+        invalidate_json_cache(destination)
+
+def _read_json_text(filepath: 'path') -> 'text, json obj':
+    #floats keep their literal so the values that aren't updated are written back unchanged
+    with open(str(filepath), 'r', encoding='utf-8') as input_file:
+        text = input_file.read()
+    return text, json.loads(text, parse_float=_JsonFloat)
+
+def update_json_file_batch(filepath: str, updates: dict, verbose=True):
+    """
+    Updates several values of a json file in one read and one write.
+    Each key is a jmespath expression that must match exactly 1 value.
+
+    :Usage:
+        updates = {
+            "elements[?file_name=='A027954801.snv_call.hdr.tsv'].md5": snv_md5,
+            "elements[?file_name=='A027954801.snv_call.hdr.tsv'].file_size": snv_size,
+        }
+        helper.json_helper.update_json_file_batch(manifest_path, updates)
+    :Returns:
+        None
+    :Notes:
+        Values are replaced in the parsed json and the file is written back atomically (temp file + rename),
+        with the file's own indent, float literals and non-ASCII text so only the updated lines change.
+        Nothing is written if any expression does not match exactly 1 value.
+        Expressions are fields, a.b, [0], [*], [?filter] and * projections. Pipes (a | [0]) and functions raise
+        ValueError, update_json_file() still takes them one at a time.
+    """
+    text, json_obj = _read_json_text(filepath)
+    if verbose:
+        logger.info("%s is: %s", filepath, lazy_json(json_obj))
+    locations = []
+    indexes = {} #all locations are resolved before any value changes, so array indexes stay valid for the batch
+    for key_to_update, new_value in updates.items():
+        query = compile_query(key_to_update)
+        matches = _resolve_locations(query.parsed, json_obj, indexes)
+        if len(matches) != 1:
+            logger.error("{} matched {} values in {}".format(query.expression, len(matches), filepath))
+            raise ValueError("Expected 1 match for {}, json update failed".format(query.expression))
+        container, key = matches[0]
+        if verbose:
+            logger.info("search results is: %s. Replacing with %s", lazy_str(container[key]), lazy_str(new_value))
+        locations.append((container, key, new_value))
+
+    for container, key, new_value in locations:
+        container[key] = new_value
+    _atomic_write_json(filepath, json_obj, text)
+    logger.info("Updated {} values in {}".format(len(locations), filepath))
+
+def _replace_json_string(filepath: str, key_to_update: str, new_value, verbose=True):
+    #expressions _resolve_locations() can't walk (pipes, functions) keep the old sed behaviour: the string they select
+    #is replaced where it first appears in the file
+    text, json_obj = _read_json_text(filepath)
+    search_results = get_json_value(key_to_update, json_obj, verbose)
+    if isinstance(search_results, list) and len(search_results) == 1:
+        search_results = search_results[0]
+    if not isinstance(search_results, str):
+        logger.error("search_results_filter is {}".format(search_results))
+        raise ValueError("Expected 1 string for {}, json update failed".format(key_to_update))
+    ensure_ascii = text.isascii()
+    old_literal = json.dumps(search_results, ensure_ascii=ensure_ascii)
+    if old_literal not in text:
+        raise ValueError("{} not found in {}, json update failed".format(old_literal, filepath))
+    text = text.replace(old_literal, json.dumps(new_value, ensure_ascii=ensure_ascii), 1)
+    destination = os.path.realpath(str(filepath))
+    file_mode = stat.S_IMODE(os.stat(destination).st_mode)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(destination), prefix='.tmp_', suffix='.json')
+    try:
+        with os.fdopen(file_descriptor, 'w', encoding='utf-8') as outfile:
+            outfile.write(text)
+        os.chmod(temp_path, file_mode)
+        os.replace(temp_path, destination)
+    except:
+        os.unlink(temp_path)
+        raise
+    finally:
+        invalidate_json_cache(destination)
+    logger.info("Replaced {} with {} in {}".format(old_literal, new_value, filepath))
 
 def update_json_file(filepath: str, key_to_update: 'jmespath expression', new_value:str, verbose=True):
     """
@@ -72,28 +742,274 @@ def update_json_file(filepath: str, key_to_update: 'jmespath expression', new_va
         See update_manifest_md5()
     :Returns:
     :Notes:
-        Does not update globally
+        Does not update globally. key_to_update must match exactly 1 value.
+        Use update_json_file_batch() to update several keys at once.
+        Pipes and functions, e.g. "results[?name=='MET'].value | [0]", must select 1 string. It is replaced where it first
+        appears in the file, as the sed this replaced did.
     """
-    json_obj = helper.json_helper.get_json_file(path=filepath, verbose=verbose)
-    search_results_filter = helper.json_helper.get_json_value(key_to_update, json_obj, verbose)
+    try:
+        update_json_file_batch(filepath, {key_to_update: new_value}, verbose)
+    except _UnsupportedExpression:
+        _replace_json_string(filepath, key_to_update, new_value, verbose)
 
-        #filter search results before sending to sed. we only want str or a list of length 1
-    if type(search_results_filter) == str:
-        search_results = search_results_filter
-    elif type(search_results_filter) == list:
-        if len(search_results_filter) == 1:
-            search_results = search_results_filter[0]
-        else:
-            logger.error("search_results_filter is{}".format(search_results_filter))
-            raise ValueError("More than 1 match, json update failed")
-    else:
-        raise ValueError("Unsupported type")
+STREAM_CHUNK_SIZE = 1024 * 1024 #characters read from disk at a time by stream_json_values()
+
+class _StreamDone(Exception):
+    pass
+
+class _StreamPath:
+    """
+    A jmespath expression split into the keys/indexes walked while streaming and an optional trailing projection.
+    """
+
+    def __init__(self, query):
+        self.expression = query.expression
+        self.steps, self.projection = self._plan(query.parsed)
+        self.resolved = False
+        self.value = None
+
+    @classmethod
+    def _plan(cls, node):
+        node_type = node['type']
+        if node_type in ('projection', 'filter_projection'):
+            return cls._static_steps(node['children'][0]), node
+        if node_type == 'subexpression':
+            steps = []
+            for child in node['children'][:-1]:
+                steps.extend(cls._static_steps(child))
+            last_steps, projection = cls._plan(node['children'][-1])
+            return steps + last_steps, projection
+        return cls._static_steps(node), None
+
+    @classmethod
+    def _static_steps(cls, node):
+        node_type = node['type']
+        if node_type == 'field':
+            return [node['value']]
+        if node_type == 'identity':
+            return []
+        if node_type == 'subexpression':
+            return [step for child in node['children'] for step in cls._static_steps(child)]
+        if node_type == 'index_expression' and node['children'][1]['value'] >= 0:
+            return cls._static_steps(node['children'][0]) + [node['children'][1]['value']]
+        raise ValueError("Unsupported jmespath expression for streaming: {}".format(node_type))
 
-    logger.info("search results is: {}".format(search_results_filter))
-    
-    bash_replace_command = "sed -i 's/{}/{}/' {}".format(search_results, new_value, filepath)
-    helper.subprocess_helper.run(bash_replace_command)
-        
+    def project(self, element):
+        #one array element through the trailing projection, None when it is filtered out
+        if self.projection['type'] == 'filter_projection':
+            if not _is_true(_interpreter.visit(self.projection['children'][2], element)):
+                return None
+        return _interpreter.visit(self.projection['children'][1], element)
 
-    
+    def finish(self, value, depth: int):
+        #complete the expression in memory from a value already read at steps[:depth]
+        for step in self.steps[depth:]:
+            if isinstance(step, str) and isinstance(value, dict):
+                value = value.get(step)
+            elif isinstance(step, int) and isinstance(value, list) and step < len(value):
+                value = value[step]
+            else:
+                value = None
+                break
+        if self.projection is not None:
+            if not isinstance(value, list):
+                return None
+            value = [result for result in map(self.project, value) if result is not None]
+        return value
 
+class _JsonStreamReader:
+    """
+    Pull parser over a json file that only keeps one chunk in memory.
+    Values that are not needed are skipped without being decoded.
+    """
+    _whitespace = re.compile(r'[ \t\n\r]*')
+    #strings and text between brackets in one C level match, so only brackets are handled in python
+    _skip = re.compile(r'(?:[^"\[\]{}]+|"[^"\\]*(?:\\.[^"\\]*)*")*')
+    _scalar = re.compile(r'[^,\]}\s]*')
+    _delimiters = ',]} \t\n\r'
+    _decoder = json.JSONDecoder()
+
+    def __init__(self, input_file, chunk_size: int, unresolved: int):
+        self.input_file = input_file
+        self.chunk_size = chunk_size
+        self.unresolved = unresolved
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def resolve(self, path: _StreamPath, value):
+        if path.resolved:
+            return
+        path.resolved = True
+        path.value = value
+        self.unresolved -= 1
+        if self.unresolved == 0:
+            raise _StreamDone
+
+    def _fill(self, size: int = 0) -> bool:
+        chunk = self.input_file.read(max(size, self.chunk_size))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            self.pos = self._whitespace.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of json file")
+
+    def _expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError("Expected {} at {!r}".format(char, self.buffer[self.pos:self.pos + 20]))
+        self.pos += 1
+
+    def _read_string(self) -> str:
+        while True:
+            try:
+                value, self.pos = json.decoder.scanstring(self.buffer, self.pos + 1)
+                return value
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+
+    def read_value(self) -> 'json obj':
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buffer, self.pos)
+                #a number is only complete once a delimiter follows it, "0." may continue as "0.987654" in the next chunk
+                is_number = isinstance(value, (int, float)) and not isinstance(value, bool)
+                if self.eof or (end < len(self.buffer) and (not is_number or self.buffer[end] in self._delimiters)):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill(len(self.buffer) - self.pos) #double the buffer so large values are not decoded over and over
+
+    def skip_value(self):
+        char = self.peek()
+        if char == '"':
+            self._read_string()
+            return
+        if char not in '{[':
+            while True:
+                self.pos = self._scalar.match(self.buffer, self.pos).end()
+                if self.pos < len(self.buffer) or not self._fill():
+                    return
+        self.pos += 1
+        depth = 1
+        while depth:
+            self.pos = self._skip.match(self.buffer, self.pos).end()
+            if self.pos >= len(self.buffer):
+                if not self._fill():
+                    raise ValueError("Unexpected end of json file")
+                continue
+            char = self.buffer[self.pos]
+            if char == '"': #string cut by the end of the buffer
+                self._read_string()
+                continue
+            depth += 1 if char in '{[' else -1
+            self.pos += 1
+
+    def iter_object(self):
+        self._expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            self.peek()
+            key = self._read_string()
+            self._expect(':')
+            yield key
+            if self.peek() == '}':
+                self.pos += 1
+                return
+            self._expect(',')
+
+    def iter_array(self):
+        self._expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        index = 0
+        while True:
+            yield index
+            index += 1
+            if self.peek() == ']':
+                self.pos += 1
+                return
+            self._expect(',')
+
+    def walk(self, paths: list, depth: int = 0):
+        ending = [path for path in paths if len(path.steps) == depth]
+        deeper = [path for path in paths if len(path.steps) > depth]
+        char = self.peek()
+        whole_value_needed = any(path.projection is None for path in ending)
+        if whole_value_needed or (ending and char != '['):
+            value = self.read_value()
+            for path in paths:
+                self.resolve(path, path.finish(value, depth))
+        elif ending: #projections: decode the array one element at a time
+            projected = {path: [] for path in ending}
+            for index in self.iter_array():
+                element = self.read_value()
+                for path in ending:
+                    result = path.project(element)
+                    if result is not None:
+                        projected[path].append(result)
+                for path in deeper:
+                    if path.steps[depth] == index:
+                        self.resolve(path, path.finish(element, depth + 1))
+            for path in paths:
+                self.resolve(path, projected.get(path))
+        elif char in '{[':
+            for key in (self.iter_object() if char == '{' else self.iter_array()):
+                matching = [path for path in deeper if path.steps[depth] == key and not path.resolved]
+                if matching:
+                    self.walk(matching, depth + 1)
+                else:
+                    self.skip_value()
+            for path in paths:
+                self.resolve(path, None)
+        else:
+            self.skip_value()
+            for path in paths:
+                self.resolve(path, None)
+
+def stream_json_values(filepath: 'path', jmespath_search_expressions: list, chunk_size: int = STREAM_CHUNK_SIZE, verbose=True) -> dict:
+    """
+    Extract values from a json file that is too large to load with get_json_file().
+    The file is read in chunks, only the matched values are decoded and reading stops once every expression is resolved.
+
+    :Usage:
+        expressions = ["meta.flowcell", "results[?name=='Eligible MET Amplification'].value"]
+        values = helper.json_helper.stream_json_values(test_case_directory / "output.json", expressions)
+        flowcell = values["meta.flowcell"]
+    :Returns:
+        dict of jmespath expression -> value, the same value get_json_value() returns for the expression
+    :Notes:
+        Supported expressions are fields, a.b sub expressions and [0] indexes, optionally followed by one [*] or [?filter]
+        projection eg. results[?name=='X'].value. Memory is bounded by chunk_size plus the largest matched value or
+        projected array element.
+    """
+    paths = [_StreamPath(compile_query(expression)) for expression in jmespath_search_expressions]
+    try:
+        with open(str(filepath), 'r') as input_file:
+            reader = _JsonStreamReader(input_file, chunk_size, len(paths))
+            if paths:
+                reader.walk(paths)
+    except _StreamDone:
+        pass
+    except:
+        logger.error("Could not stream json {}".format(filepath), exc_info=1)
+        raise
+    values = {path.expression: path.value for path in paths}
+    if verbose:
+        logger.info("Found %s in %s", lazy_str(values), filepath)
+    return values
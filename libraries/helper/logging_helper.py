@@ -1,6 +1,146 @@
 from functools import wraps
+import hashlib
+import json
 import logging
 
+LOG_PAYLOAD_MAX_CHARS = 10000 #payloads longer than this are truncated in the log. None logs everything
+
+def set_log_payload_limit(max_chars: int):
+    """
+    Change how many characters of a payload are written to the log.
+
+    :Usage:
+        helper.logging_helper.set_log_payload_limit(500)
+        helper.logging_helper.set_log_payload_limit(None) #log full payloads
+    :Returns:
+        None
+    """
+    global LOG_PAYLOAD_MAX_CHARS
+    LOG_PAYLOAD_MAX_CHARS = max_chars
+
+def _iter_repr(payload, active: set = None):
+    #repr() in chunks, containers are walked instead of being built as one string
+    payload_type = type(payload)
+    if payload_type.__repr__ not in (list.__repr__, tuple.__repr__, dict.__repr__):
+        yield repr(payload)
+        return
+    active = active if active is not None else set()
+    if id(payload) in active: #a container holding itself, repr() writes [...] too
+        yield '{...}' if isinstance(payload, dict) else '[...]'
+        return
+    active.add(id(payload))
+    if isinstance(payload, dict):
+        yield '{'
+        for position, (key, value) in enumerate(payload.items()):
+            if position:
+                yield ', '
+            yield from _iter_repr(key, active)
+            yield ': '
+            yield from _iter_repr(value, active)
+        yield '}'
+    else:
+        is_tuple = isinstance(payload, tuple)
+        yield '(' if is_tuple else '['
+        for position, item in enumerate(payload):
+            if position:
+                yield ', '
+            yield from _iter_repr(item, active)
+        yield (',)' if len(payload) == 1 else ')') if is_tuple else ']'
+    active.discard(id(payload))
+
+def _iter_str(payload):
+    if isinstance(payload, str):
+        yield payload
+    elif type(payload).__str__ is object.__str__: #str() of lists, tuples and dicts is their repr()
+        yield from _iter_repr(payload)
+    else:
+        yield str(payload)
+
+class LogPayload:
+    """
+    Defers formatting a log argument until a handler writes the record.
+    Pass it as a %s argument so nothing is rendered when the logger level filters the message out.
+    Output past LOG_PAYLOAD_MAX_CHARS is replaced by its length and md5.
+
+    :Usage:
+        logger.info("%s is: %s", path, LogPayload(json_obj, 'json'))
+    :Notes:
+        Payloads are rendered in chunks. Past max_chars the chunks are only hashed, the whole text is never held at once.
+    """
+    _renderers = {
+        'str': _iter_str,
+        'repr': _iter_repr,
+        'json': lambda payload: json.JSONEncoder(indent=2, default=str).iterencode(payload),
+    }
+
+    def __init__(self, payload, render: str = 'str', max_chars: int = None):
+        self.payload = payload
+        self.render = render
+        self.max_chars = max_chars
+        self._text = None
+
+    def __str__(self):
+        if self._text is None: #several handlers can emit the same record
+            self._text = self._render()
+        return self._text
+
+    def _render(self):
+        max_chars = self.max_chars if self.max_chars is not None else LOG_PAYLOAD_MAX_CHARS
+        chunks = self._renderers[self.render](self.payload)
+        if max_chars is None:
+            return ''.join(chunks)
+        head = []
+        head_chars = 0
+        omitted = None #md5 of the chunks past max_chars
+        omitted_chars = 0
+        for chunk in chunks:
+            if omitted is None:
+                if head_chars + len(chunk) <= max_chars:
+                    head.append(chunk)
+                    head_chars += len(chunk)
+                    continue
+                head.append(chunk[:max_chars - head_chars])
+                chunk = chunk[max_chars - head_chars:]
+                omitted = hashlib.md5()
+            omitted.update(chunk.encode('utf-8', 'replace'))
+            omitted_chars += len(chunk)
+        if omitted is None:
+            return ''.join(head)
+        return '{}... [{} more chars omitted, md5 {}]'.format(''.join(head), omitted_chars, omitted.hexdigest())
+
+def lazy_json(payload, max_chars: int = None) -> LogPayload:
+    """
+    Log argument rendered with json.dumps(indent=2) only when the record is written.
+
+    :Usage:
+        logger.info("generated %s. JSON: %s", destination, lazy_json(json_obj))
+    :Returns:
+        LogPayload
+    """
+    return LogPayload(payload, 'json', max_chars)
+
+def lazy_repr(payload, max_chars: int = None) -> LogPayload:
+    """
+    Log argument rendered with repr() only when the record is written.
+
+    :Usage:
+        logger.info("args: %s", lazy_repr(args))
+    :Returns:
+        LogPayload
+    """
+    return LogPayload(payload, 'repr', max_chars)
+
+def lazy_str(payload, max_chars: int = None) -> LogPayload:
+    """
+    Log argument rendered with str() only when the record is written.
+
+    :Usage:
+        logger.info("stdout is: %s", lazy_str(stdout))
+    :Returns:
+        LogPayload
+    """
+    return LogPayload(payload, 'str', max_chars)
+
 def library_logger(original_function):
     """
     Decorator. Records the original function in the log.
@@ -14,7 +154,7 @@ def library_logger(original_function):
     def wrapper(*args, **kwargs):
         logger = logging.getLogger(original_function.__module__) 
         logger.info(
-            'method: {} args: {}, and kwargs: {}'.format(original_function.__qualname__, args, kwargs))
+            'method: %s args: %s, and kwargs: %s', original_function.__qualname__, lazy_repr(args), lazy_repr(kwargs))
         return original_function(*args, **kwargs)
 
     return wrapper
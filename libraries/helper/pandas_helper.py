@@ -1,11 +1,81 @@
+import hashlib
 import logging
+import os
+import pickle
+import stat
+import tempfile
+import time
+from pathlib import Path
 import pandas
 import numpy
 import libraries.helper as helper
+from . import check_helper
+from .file_cache import FileCache
+try:
+    import zstandard
+except ImportError: #optional, only needed for .tsv.zst tables
+    zstandard = None
 
 logger = logging.getLogger(__name__) #framework.libraries.helper
 
-def update_row_entry_in_tsv_file(tsv_path: 'path', target_row_entry:dict, replacement_row_entry:dict, strict=True):
+DATAFRAME_CACHE_MAX_BYTES = 512 * 1024 * 1024 #total memory of the dataframes kept parsed
+SCAN_CHUNK_ROWS = 200000 #rows held in memory at a time by scan_tsv_file()
+SIDECAR_CACHE_DIR = None #directory of binary copies of parsed csv/tsv files, None turns them off
+COMPACT_CATEGORY_RATIO = 0.5 #string columns with fewer unique values per row than this become categoricals
+TABLE_REPORT_ROWS = 50 #differences of each kind listed by verify_tables_match(), the rest are counted
+CONTENT_HASH_RACY_NS = 2 * 10**9 #files modified this close to being hashed are not cached, like bip_files.HASH_RACY_NS
+
+_dataframe_cache = FileCache(DATAFRAME_CACHE_MAX_BYTES, extra_stats=('sidecar_hits', 'sidecar_writes')) #one entry per (path, compact)
+
+def get_dataframe_cache_stats() -> dict:
+    """
+    Counters of the parsed csv/tsv cache used by return_as_dataframe().
+
+    :Usage:
+        stats = helper.pandas_helper.get_dataframe_cache_stats()
+        logger.info("saved {} seconds of tsv parsing".format(stats['parse_seconds_saved']))
+    :Returns:
+        dict with hits, misses, invalidations, evictions, parse_seconds, parse_seconds_saved, sidecar_hits, sidecar_writes,
+        entries, bytes and max_bytes
+    """
+    return _dataframe_cache.get_stats()
+
+def set_dataframe_cache_limit(max_bytes: int):
+    """
+    Change the total memory of dataframes kept parsed. 0 disables the cache.
+
+    :Usage:
+        helper.pandas_helper.set_dataframe_cache_limit(128 * 1024 * 1024)
+    :Returns:
+        None
+    """
+    _dataframe_cache.resize(max_bytes)
+
+def invalidate_dataframe_cache(path: 'path'):
+    """
+    Drop a file from the parsed csv/tsv cache. update_row_entry_in_tsv_file() calls this for you.
+
+    :Usage:
+        helper.pandas_helper.invalidate_dataframe_cache(test_case_directory / "snv_call.hdr.tsv")
+    :Returns:
+        None
+    """
+    path_str = os.path.realpath(str(path))
+    _dataframe_cache.invalidate(path_str)
+    _content_hashes.pop(path_str, None)
+
+def clear_dataframe_cache():
+    """
+    Empty the parsed csv/tsv cache and reset its counters.
+
+    :Usage:
+        helper.pandas_helper.clear_dataframe_cache()
+    :Returns:
+        None
+    """
+    _dataframe_cache.clear()
+
+def update_row_entry_in_tsv_file(tsv_path: 'path', target_row_entry:dict, replacement_row_entry:dict, strict=True) -> list:
     """
     Update an existing row in a tsv. 
     :Usage:
@@ -13,32 +83,449 @@ def update_row_entry_in_tsv_file(tsv_path: 'path', target_row_entry:dict, replac
         replacement_row = [('gene', 'KEAP1'), ('mut_aa', 'G31A'), ('ldt_reportable',1), ('somatic_call', 'somatic')]
         topaz.update_row_entry_in_tsv_file(indel_path, target_row, replacement_row)
     :Returns:
-        None
+        list of changed rows, see TsvEditor.commit()
     :Notes:
         If strict option is true, there must be 1 and only 1 target row to be replaced. 
+        To change several rows with one read and one write, use edit_tsv_file().
     """
-
-    #get the row target row to be replaced:
-            #this is a pandas row
-            #we assert that it only matches 1 row
-            #replace this row
-    dataframe = return_as_dataframe(tsv_path)
-    rows = get_entry_in_dataframe(dataframe, target_row_entry)
-    rows_index = numpy.flatnonzero(rows)
-    if strict:
-        assert len(rows_index) == 1, "row index is {}".format(len(rows_index))
-
-    #unpack the list for the replacement row before updating
-    new_row_keys = list(replacement_row_entry.keys())
-    new_row_values = list(replacement_row_entry.values())
-    
-    #update the row
-    row_index = rows_index[0] #only update the first occurence
-    dataframe.loc[row_index, new_row_keys] = new_row_values 
-    dataframe.to_csv(tsv_path, sep = "\t", index=False)
+    with edit_tsv_file(tsv_path, strict) as editor:
+        editor.update(target_row_entry, replacement_row_entry)
     logger.info("Updating target row with {}".format(replacement_row_entry))
+    return editor.changes
+
+class TsvEditor:
+    """
+    Row updates, inserts and deletes on a tsv/csv, applied with one read and one atomic write.
+    Use edit_tsv_file() to create one.
+    """
+
+    def __init__(self, tsv_path: 'path', strict=True, in_place=True):
+        self.tsv_path = Path(tsv_path)
+        self.strict = strict
+        self.in_place = in_place
+        self.changes = []
+        self._operations = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+
+    def update(self, target_row_entry: dict, replacement_row_entry: dict) -> 'TsvEditor':
+        self._operations.append(('update', target_row_entry, replacement_row_entry))
+        return self
+
+    def insert(self, row_entry: dict) -> 'TsvEditor':
+        self._operations.append(('insert', None, row_entry))
+        return self
+
+    def delete(self, target_row_entry: dict) -> 'TsvEditor':
+        self._operations.append(('delete', target_row_entry, None))
+        return self
+
+    def commit(self) -> list:
+        """
+        Validate every operation and write the file once.
+
+        :Returns:
+            list of changes: {'action': 'update'|'insert'|'delete', 'row': row number, 'before': row dict, 'after': row dict}
+        :Notes:
+            Targets are matched against the file as it was read, so one update can't change what a later one matches.
+            Rows are numbered from 0 after the header, in the file before the edit (inserts: in the file after it).
+            Nothing is written if any target doesn't match exactly 1 row (strict) or at least 1 row.
+            With in_place, only the changed lines differ and every other byte of the file is copied as it was.
+            Either way the new file is written next to the old one and renamed over it.
+            Files _patch_lines() can't edit safely are written with to_csv.
+        """
+        operations, self._operations = self._operations, []
+        if not operations:
+            return self.changes
+        if _compression(os.path.realpath(str(self.tsv_path))):
+            raise ValueError("{} is compressed, decompress it before editing rows".format(self.tsv_path))
+        dataframe = return_as_dataframe(self.tsv_path)
 
-def return_as_dataframe(path: 'path') -> 'panda dataframe':
+        failures = []
+        resolved = []
+        for action, target_row_entry, row_entry in operations:
+            if action == 'insert':
+                resolved.append((action, None, row_entry))
+                continue
+            rows_index = find_rows(dataframe, target_row_entry)
+            if (self.strict and len(rows_index) != 1) or len(rows_index) == 0:
+                failures.append("{} {} matched {} rows".format(action, target_row_entry, len(rows_index)))
+                continue
+            resolved.append((action, rows_index[0], row_entry)) #only change the first occurence
+        deleted = {row_index for action, row_index, _ in resolved if action == 'delete'}
+        failures += ["row {} is deleted and updated".format(row_index) for action, row_index, _ in resolved
+                     if action == 'update' and row_index in deleted]
+        assert not failures, "{} not updated:\n{}".format(self.tsv_path, "\n".join(failures))
+
+        changes = _patch_lines(self.tsv_path, dataframe, resolved) if self.in_place else None
+        if changes is not None:
+            for change in changes:
+                logger.info("{} row {} in {}: {}".format(change['action'], change['row'], self.tsv_path, change['after'] or change['before']))
+            self.changes += changes
+            return changes
+
+        changes = []
+        for action, row_index, row_entry in resolved:
+            if action == 'update':
+                before = dataframe.iloc[row_index].to_dict()
+                dataframe.loc[dataframe.index[row_index], list(row_entry.keys())] = list(row_entry.values())
+                changes.append({'action': action, 'row': int(row_index), 'before': before, 'after': dataframe.iloc[row_index].to_dict()})
+            elif action == 'delete':
+                changes.append({'action': action, 'row': int(row_index), 'before': dataframe.iloc[row_index].to_dict(), 'after': None})
+        if deleted:
+            dataframe = dataframe.drop(index=dataframe.index[sorted(deleted)])
+        inserts = [row_entry for action, _, row_entry in resolved if action == 'insert']
+        if inserts:
+            first_row = len(dataframe)
+            dataframe = pandas.concat([dataframe, pandas.DataFrame(inserts)], ignore_index=True)
+            for offset in range(len(inserts)):
+                changes.append({'action': 'insert', 'row': first_row + offset, 'before': None, 'after': dataframe.iloc[first_row + offset].to_dict()})
+
+        _atomic_write_dataframe(self.tsv_path, dataframe)
+        for change in changes:
+            logger.info("{} row {} in {}: {}".format(change['action'], change['row'], self.tsv_path, change['after'] or change['before']))
+        self.changes += changes
+        return changes
+
+def edit_tsv_file(tsv_path: 'path', strict=True, in_place=True) -> TsvEditor:
+    """
+    Change many rows of a tsv/csv with one read and one write.
+
+    :Usage:
+        with helper.pandas_helper.edit_tsv_file(snv_path) as editor:
+            editor.update({'gene': 'TOPAZ1'}, {'gene': 'KEAP1', 'mut_aa': 'G31A'})
+            editor.update({'gene': 'ESR1'}, {'call': 1})
+            editor.insert({'gene': 'EGFR', 'mut_aa': 'L858R', 'call': 1})
+            editor.delete({'gene': 'APC'})
+        logger.info(editor.changes)
+    :Returns:
+        TsvEditor, the file is written when the with block exits without an exception, or by editor.commit()
+    :Notes:
+        If strict option is true, every update and delete target must match 1 and only 1 row.
+        in_place=True changes only the bytes of the changed lines, untouched rows keep theirs (and the file its md5).
+        The file is always replaced with a temp file + rename: readers never see half an edit and other hardlinks
+        to the file are never changed.
+        in_place=False writes the whole file back with to_csv.
+    """
+    return TsvEditor(tsv_path, strict, in_place)
+
+_line_indexes = {} #path -> (stat_key, line start offsets), kept up to date by _patch_lines()
+
+def _line_offsets(path_str: str, stat_key: tuple) -> 'numpy array':
+    entry = _line_indexes.get(path_str)
+    if entry is None or entry[0] != stat_key:
+        offsets = [numpy.zeros(1, dtype=numpy.int64)]
+        position = 0
+        with open(path_str, 'rb') as input_file:
+            for block in iter(lambda: input_file.read(8 * 1024 * 1024), b''):
+                offsets.append(numpy.flatnonzero(numpy.frombuffer(block, dtype=numpy.uint8) == ord('\n')) + position + 1)
+                position += len(block)
+        offsets = numpy.concatenate(offsets)
+        if offsets[-1] == position: #no line starts after the final newline
+            offsets = offsets[:-1]
+        entry = _line_indexes[path_str] = (stat_key, offsets)
+    return entry[1]
+
+def _format_cell(value) -> str:
+    if value is None or (isinstance(value, float) and numpy.isnan(value)):
+        return ''
+    return str(value)
+
+def _patch_lines(tsv_path: 'path', dataframe: 'panda dataframe', resolved: list) -> list:
+    #Rewrite only the lines of the resolved operations. Returns None when the file can't be patched as plain
+    #separated text: quoted cells, blank or multi-line rows, or new columns. The untouched bytes are copied around the
+    #new lines into a temp file that replaces the file, so readers never see half an edit and hardlinks keep their bytes.
+    path_str = os.path.realpath(str(tsv_path))
+    separator = _separator(path_str)
+    file_stat = os.stat(path_str)
+    offsets = _line_offsets(path_str, (file_stat.st_ino, file_stat.st_mtime_ns, file_stat.st_size))
+    if len(offsets) != len(dataframe) + 1:
+        return None
+    lengths = numpy.diff(numpy.append(offsets, file_stat.st_size))
+
+    def read_line(input_file, line_number):
+        input_file.seek(offsets[line_number])
+        return input_file.read(lengths[line_number])
+
+    with open(path_str, 'rb') as input_file:
+        header_line = read_line(input_file, 0)
+        line_end = b'\r\n' if header_line.endswith(b'\r\n') else b'\n'
+        header = header_line.rstrip(b'\r\n').decode(errors='surrogateescape').split(separator)
+        if header != [str(column) for column in dataframe.columns]:
+            return None
+        last_line = read_line(input_file, len(offsets) - 1)
+
+        new_lines = {} #line number -> cells, None for a deleted line
+        rows = {} #row number -> row after the updates so far
+        changes = []
+        for action, row_index, row_entry in resolved:
+            if action == 'insert':
+                continue
+            line_number = int(row_index) + 1
+            if line_number not in new_lines:
+                line = read_line(input_file, line_number)
+                cells = line.rstrip(b'\r\n').decode(errors='surrogateescape').split(separator)
+                if b'"' in line or len(cells) != len(header):
+                    return None
+                new_lines[line_number] = cells
+            before = rows[row_index] if row_index in rows else dataframe.iloc[row_index].to_dict()
+            if action == 'delete':
+                new_lines[line_number] = None
+                changes.append({'action': action, 'row': int(row_index), 'before': before, 'after': None})
+                continue
+            cells = new_lines[line_number]
+            for key, value in row_entry.items():
+                if key not in header:
+                    return None
+                cells[header.index(key)] = _format_cell(value)
+            rows[row_index] = {**before, **row_entry}
+            changes.append({'action': action, 'row': int(row_index), 'before': before, 'after': rows[row_index]})
+
+    inserts = [row_entry for action, _, row_entry in resolved if action == 'insert']
+    first_row = len(dataframe) - sum(cells is None for cells in new_lines.values())
+    inserted_lines = []
+    for offset, row_entry in enumerate(inserts):
+        if any(key not in header for key in row_entry):
+            return None
+        inserted_lines.append([_format_cell(row_entry.get(column)) for column in header])
+        changes.append({'action': 'insert', 'row': first_row + offset, 'before': None,
+                        'after': {column: row_entry.get(column) for column in header}})
+
+    if inserted_lines and not last_line.endswith(b'\n'):
+        return None
+    for cells in [cells for cells in new_lines.values() if cells is not None] + inserted_lines:
+        if any(character in cell for cell in cells for character in (separator, '\n', '\r', '"')):
+            return None #to_csv would quote these cells
+    encoded = {}
+    for line_number, cells in new_lines.items():
+        ending = b'' if line_number == len(offsets) - 1 and not last_line.endswith(b'\n') else line_end
+        encoded[line_number] = b'' if cells is None else separator.join(cells).encode(errors='surrogateescape') + ending
+    appended = b''.join(separator.join(cells).encode(errors='surrogateescape') + line_end for cells in inserted_lines)
+
+    file_mode = stat.S_IMODE(file_stat.st_mode)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path_str), prefix='.tmp_', suffix=path_str[-4:])
+    try:
+        with open(path_str, 'rb') as input_file, os.fdopen(file_descriptor, 'wb') as output_file:
+            position = 0
+            for line_number, line in sorted(encoded.items()):
+                output_file.write(input_file.read(offsets[line_number] - position)) #untouched bytes before the line
+                output_file.write(line)
+                input_file.seek(offsets[line_number] + lengths[line_number])
+                position = offsets[line_number] + lengths[line_number]
+            for block in iter(lambda: input_file.read(8 * 1024 * 1024), b''):
+                output_file.write(block)
+            output_file.write(appended)
+        os.chmod(temp_path, file_mode)
+        os.replace(temp_path, path_str)
+    except:
+        os.unlink(temp_path)
+        raise
+    finally:
+        invalidate_dataframe_cache(path_str)
+
+    for line_number, line in encoded.items():
+        lengths[line_number] = len(line)
+    lengths = numpy.append(lengths, numpy.array([len(separator.join(cells).encode(errors='surrogateescape') + line_end) for cells in inserted_lines], dtype=numpy.int64))
+    lengths = lengths[lengths > 0] #deleted lines
+    new_stat = os.stat(path_str)
+    _line_indexes[path_str] = ((new_stat.st_ino, new_stat.st_mtime_ns, new_stat.st_size), numpy.concatenate(([0], numpy.cumsum(lengths)[:-1])).astype(numpy.int64))
+    return changes
+
+def _atomic_write_dataframe(tsv_path: 'path', dataframe: 'panda dataframe'):
+    destination = os.path.realpath(str(tsv_path))
+    file_mode = stat.S_IMODE(os.stat(destination).st_mode)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(destination), prefix='.tmp_', suffix=destination[-4:])
+    try:
+        with os.fdopen(file_descriptor, 'w') as outfile:
+            dataframe.to_csv(outfile, sep=_separator(destination), index=False)
+        os.chmod(temp_path, file_mode)
+        os.replace(temp_path, destination)
+    except:
+        os.unlink(temp_path)
+        raise
+    finally:
+        invalidate_dataframe_cache(destination)
+
+COMPRESSION_SUFFIXES = ('.gz', '.bgz', '.zst', '.zstd')
+_COMPRESSION_MAGIC = ((b'\x1f\x8b', 'gzip'), (b'\x28\xb5\x2f\xfd', 'zstd')) #bgzip files are gzip members
+
+def _separator(path_str: str) -> str:
+    for suffix in COMPRESSION_SUFFIXES:
+        if path_str.endswith(suffix):
+            path_str = path_str[:-len(suffix)]
+            break
+    file_extension = path_str[-3:]
+    if file_extension == 'tsv':
+        return '\t'
+    elif file_extension == 'csv':
+        return ','
+    raise ValueError("{} is not a csv or tsv".format(path_str))
+
+def _compression(path_str: str) -> str:
+    #from the file's first bytes rather than its name, a .tsv that is really gzip still loads
+    with open(path_str, 'rb') as input_file:
+        magic = input_file.read(4)
+    return next((compression for prefix, compression in _COMPRESSION_MAGIC if magic.startswith(prefix)), None)
+
+def _read_csv(path_str: str, **kwargs) -> 'panda dataframe or reader':
+    #gzip, bgzip and zstd tables are decoded while pandas reads them
+    compression = _compression(path_str)
+    if compression != 'zstd':
+        return pandas.read_csv(path_str, sep=_separator(path_str), header=0, compression=compression, **kwargs)
+    #pandas only decodes zstd itself from 1.4, so the zstandard stream is handed to it instead
+    if zstandard is None:
+        raise ImportError("{} is zstd compressed, pip install zstandard to read it".format(path_str))
+    stream = zstandard.open(path_str, 'rb')
+    try:
+        result = pandas.read_csv(stream, sep=_separator(path_str), header=0, **kwargs)
+    except:
+        stream.close()
+        raise
+    if not isinstance(result, pandas.io.parsers.TextFileReader):
+        stream.close()
+        return result
+    close_reader = result.close
+    def close(): #a chunked reader keeps reading from the stream until it is closed
+        close_reader()
+        stream.close()
+    result.close = close
+    return result
+
+def set_sidecar_cache_dir(directory: 'path'):
+    """
+    Keep a binary copy of every csv/tsv parsed by return_as_dataframe() in directory, so later sessions and
+    other xdist workers load the pickle instead of parsing the text again. None turns the sidecars off.
+
+    :Usage:
+        helper.pandas_helper.set_sidecar_cache_dir(Path.home() / ".cache" / "xframework")
+    :Returns:
+        None
+    :Notes:
+        Sidecars are named by the md5 of the file's content, a changed file never loads an old sidecar.
+        A sidecar that doesn't match its file or can't be read is rebuilt.
+        Loading a pickle runs code, so the directory must be private: it is created (or set) to 0700 and must belong to
+        the current user, else PermissionError. Sidecars owned by someone else or writable by others are never loaded.
+    """
+    global SIDECAR_CACHE_DIR
+    if directory is not None:
+        directory = str(directory)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        if hasattr(os, 'getuid'): #not on windows
+            if os.stat(directory).st_uid != os.getuid():
+                raise PermissionError("Sidecar directory {} belongs to another user, use a directory of your own".format(directory))
+            os.chmod(directory, 0o700)
+    SIDECAR_CACHE_DIR = directory
+
+def _is_private(file_stat: os.stat_result) -> bool:
+    #written by this user and by nobody else, see set_sidecar_cache_dir()
+    if not hasattr(os, 'getuid'):
+        return True
+    return file_stat.st_uid == os.getuid() and not file_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+_content_hashes = {} #path -> (stat_key, md5), unchanged files are hashed once per process
+
+def _content_hash(path_str: str, stat_key: tuple) -> str:
+    entry = _content_hashes.get(path_str)
+    if entry is not None and entry[0] == stat_key:
+        return entry[1]
+    hashed_at = time.time_ns()
+    md5 = hashlib.md5()
+    with open(path_str, 'rb') as input_file:
+        for block in iter(lambda: input_file.read(1024 * 1024), b''):
+            md5.update(block)
+    #a same size write in the same mtime tick keeps stat_key, so files modified just now are hashed again next time
+    if stat_key[1] < hashed_at - CONTENT_HASH_RACY_NS:
+        _content_hashes[path_str] = (stat_key, md5.hexdigest())
+    else:
+        _content_hashes.pop(path_str, None)
+    return md5.hexdigest()
+
+def _read_dataframe(path_str: str, stat_key: tuple = None) -> 'panda dataframe':
+    if SIDECAR_CACHE_DIR is None or stat_key is None:
+        return _read_csv(path_str)
+
+    content_hash = _content_hash(path_str, stat_key)
+    #pickles are only read back by the pandas version that wrote them
+    sidecar_path = os.path.join(SIDECAR_CACHE_DIR, "{}.{}.pandas-{}.pkl".format(content_hash, 'tsv' if _separator(path_str) == '\t' else 'csv', pandas.__version__))
+    try:
+        with open(sidecar_path, 'rb') as sidecar:
+            if not _is_private(os.fstat(sidecar.fileno())):
+                raise PermissionError("{} is not private to this user".format(sidecar_path))
+            sidecar_hash, df = pickle.load(sidecar)
+        if sidecar_hash == content_hash:
+            _dataframe_cache.count('sidecar_hits')
+            return df
+        logger.warning("Sidecar {} doesn't match {}, rebuilding it".format(sidecar_path, path_str))
+    except FileNotFoundError:
+        pass
+    except Exception:
+        logger.warning("Could not read sidecar {}, rebuilding it".format(sidecar_path), exc_info=1)
+
+    df = _read_csv(path_str)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=SIDECAR_CACHE_DIR, prefix='.tmp_', suffix='.pkl')
+    try:
+        with os.fdopen(file_descriptor, 'wb') as sidecar:
+            pickle.dump((content_hash, df), sidecar, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, sidecar_path) #xdist workers may race to write the same sidecar, the last rename wins
+        _dataframe_cache.count('sidecar_writes')
+    except OSError:
+        logger.warning("Could not write sidecar {}".format(sidecar_path), exc_info=1)
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+    return df
+
+_compact_report = {} #path -> {'bytes_before': ..., 'bytes_after': ...}
+
+def compact_dataframe(df: 'panda dataframe', name: str = None) -> 'panda dataframe':
+    """
+    Shrink a dataframe of call data: low cardinality string columns become categoricals and integer columns
+    are downcast to the smallest type that holds them.
+
+    :Usage:
+        df = helper.pandas_helper.compact_dataframe(df, "A027954801.snv_call.hdr.tsv")
+    :Returns:
+        a pandas dataframe, the memory saved is logged and kept in get_compact_report()
+    :Notes:
+        == filters return the same rows as before. A value that isn't a category, like call == '', matches nothing.
+        Float columns keep 64 bits, numpy would round float literals to 32 bits when comparing.
+        Categorical columns can't take new values in place, edit tsv files with edit_tsv_file() instead.
+    """
+    bytes_before = int(df.memory_usage(deep=True).sum())
+    columns = {}
+    for column_name, column in df.items():
+        if column.dtype == object:
+            if pandas.api.types.infer_dtype(column, skipna=True) == 'string' and column.nunique() < COMPACT_CATEGORY_RATIO * len(column):
+                columns[column_name] = column.astype('category')
+        elif pandas.api.types.is_integer_dtype(column) and not pandas.api.types.is_bool_dtype(column):
+            columns[column_name] = pandas.to_numeric(column, downcast='integer')
+    compact = df.copy(deep=False)
+    for column_name, column in columns.items():
+        compact[column_name] = column
+    bytes_after = int(compact.memory_usage(deep=True).sum())
+
+    name = name or getattr(df, 'name', 'dataframe')
+    _compact_report[name] = {'bytes_before': bytes_before, 'bytes_after': bytes_after}
+    logger.info('Compact dtypes for {}: {:.1f} MB -> {:.1f} MB'.format(name, bytes_before / 2 ** 20, bytes_after / 2 ** 20))
+    return compact
+
+def get_compact_report() -> dict:
+    """
+    Memory saved by compact_dataframe() for every file loaded with return_as_dataframe(path, compact=True).
+
+    :Usage:
+        for path, report in helper.pandas_helper.get_compact_report().items():
+            logger.info("{} saved {} bytes".format(path, report['bytes_before'] - report['bytes_after']))
+    :Returns:
+        dict of path -> {'bytes_before': int, 'bytes_after': int}
+    """
+    return {name: dict(report) for name, report in _compact_report.items()}
+
+def return_as_dataframe(path: 'path', copy=True, cache=True, compact=False) -> 'panda dataframe':
     """
     Get a csv/tsv as a Pandas dataframe
     :Usage:
@@ -46,14 +533,36 @@ def return_as_dataframe(path: 'path') -> 'panda dataframe':
         dataframe = helper.pandas_helper.return_as_dataframe(test_case_directory / file_name)
     :Returns:
         a pandas dataframe
+    :Notes:
+        Parsed files are cached until the file changes on disk, see get_dataframe_cache_stats(). Files modified in the
+        last 2 seconds are not cached, their mtime may not change on the next write.
+        A copy is returned, so editing it never changes the cache. copy=False is still accepted and also copies: pandas
+        can't compare read-only object columns, so the cached dataframe can't be handed out safely. The copy only
+        duplicates the column arrays, the strings are shared. cache=False always reads the file.
+        Parsing can also be skipped across sessions, see set_sidecar_cache_dir().
+        compact=True stores repeated strings as categoricals and downcasts integers, see compact_dataframe().
+        Compressed tables (.tsv.gz, bgzip, .tsv.zst) are decoded while they are read, no need to decompress them first.
+        .tsv.zst needs the zstandard package.
     """
     try:
         path_str = str(path.resolve())
-        file_extension = path_str[-3:]
-        if file_extension == 'tsv':
-            df = pandas.read_csv(path_str, sep='\t', header=0) 
-        elif file_extension == 'csv':
-            df = pandas.read_csv(path_str, sep=',', header=0)
+        if not cache:
+            df = _read_dataframe(path_str)
+            if compact:
+                df = compact_dataframe(df, path_str)
+        else:
+            file_stat = os.stat(path_str)
+            stat_key = (file_stat.st_ino, file_stat.st_mtime_ns, file_stat.st_size)
+            df = _dataframe_cache.get(path_str, stat_key, variant=compact)
+            if df is None:
+                start = time.perf_counter()
+                df = _read_dataframe(path_str, stat_key)
+                if compact:
+                    df = compact_dataframe(df, path_str)
+                #deep memory_usage() visits every string, the file size stands in for the text held by object columns
+                size = int(df.memory_usage(deep=False).sum()) + stat_key[2]
+                _dataframe_cache.put(path_str, stat_key, df, size, time.perf_counter() - start, variant=compact)
+            df = df.copy()
         df.name = path_str
         logger.info('Returning file as panda data frame {}'.format(path)) 
         return df
@@ -61,19 +570,61 @@ def return_as_dataframe(path: 'path') -> 'panda dataframe':
         logger.error("Not csv or tsv", exc_info=1)
         raise Exception
 
-def get_entry_in_dataframe(df: 'Pandas dataframe', key_value: dict) -> 'panda dataframe': 
+def _row_index(df: 'Pandas dataframe', columns: tuple) -> dict:
+    #{(value, ...): row positions} for the columns, built once per dataframe.
+    #Rows with an empty value are left out, the same as df[column] == value never matching NaN
+    indexes = df.__dict__.setdefault('_row_indexes', {})
+    if columns not in indexes:
+        groups = df.groupby(list(columns), sort=False, observed=True).indices
+        if len(columns) == 1:
+            groups = {(key,): positions for key, positions in groups.items()}
+        indexes[columns] = groups
+    return indexes[columns]
+
+def find_rows(df: 'Pandas dataframe', key_value: dict) -> 'numpy array':
+    """
+    Row positions matching every key, value pair, answered from a hash index over the keys' columns.
+    The index is built on the first lookup and reused by every later lookup on the same columns.
+
+    :Usage:
+        dataframe = helper.pandas_helper.return_as_dataframe(test_case_directory / snv_tsv)
+        for variant in expected_variants:
+            rows = helper.pandas_helper.find_rows(dataframe, {'gene': variant.gene, 'mut_aa': variant.mut_aa, 'call': 1})
+    :Returns:
+        numpy array of row positions
+    :Notes:
+        The index assumes the dataframe isn't changed after the first lookup.
+    """
+    if not key_value:
+        raise ValueError('Empty dictionary')
+    columns = tuple(key_value)
+    try:
+        return _row_index(df, columns).get(tuple(key_value.values()), numpy.empty(0, dtype=numpy.intp))
+    except TypeError: #unhashable values are never equal to a tsv cell
+        return numpy.empty(0, dtype=numpy.intp)
+
+def get_entry_in_dataframe(df: 'Pandas dataframe', key_value: dict, indexed=False) -> 'panda dataframe': 
     """
     Helper for update_row_entry_in_tsv_file()
     :Usage:
         N/A, use update_row_entry_in_tsv_file()
     :Returns:
         a pandas dataframe 
+    :Notes:
+        indexed=True looks the row up with find_rows() instead of comparing every row.
     """
 
     #Handle case when list is 0
     if not key_value:
         raise ValueError('Empty dictionary')
 
+    if indexed:
+        filtered = numpy.zeros(len(df), dtype=bool)
+        filtered[find_rows(df, key_value)] = True
+        filtered = pandas.Series(filtered, index=df.index)
+        logger.info('{}. Key, Value {} in {}: '.format(filtered.any(), key_value, df.name))
+        return filtered
+
     #key, value = key_value[0] #don't use pop b/c it destroys the data for debugging
     keys = list(key_value.keys())
     values = list(key_value.values())
@@ -86,10 +637,10 @@ def get_entry_in_dataframe(df: 'Pandas dataframe', key_value: dict) -> 'panda da
         return (df[key] == value)
 
     #Handle the case when list > 1
-    filtered = (df[keys[0]] == values[0]) #dummy head. 
-    
+    filtered = None
     for key, value in key_value.items(): 
-        filtered = filtered & (df[key] == value) #use dummy head as initial filter. 
+        matches = (df[key] == value)
+        filtered = matches if filtered is None else filtered & matches
         #This pattern used instead of filtered &= filtered. The latter one breaks check_entry_in_dataframe() on empty results
         if not filtered.any():
             logger.warning('Search chain stopped at Key: {} Value: {}. Actual is {}'.format(key, value, df.get(key)[0]))
@@ -99,7 +650,7 @@ def get_entry_in_dataframe(df: 'Pandas dataframe', key_value: dict) -> 'panda da
 
     return filtered 
 
-def check_entry_in_dataframe(df: 'Pandas dataframe', key_value_list: list) -> bool:
+def check_entry_in_dataframe(df: 'Pandas dataframe', key_value_list: list, indexed=False) -> bool:
     """
     Check for a row entry inside the dataframe. Return boolean if found or not.
     Solves the same problem as ((data_frame['gene'] == 'ESR1') & (data_frame['call'] == 0) &... ).any()
@@ -109,7 +660,214 @@ def check_entry_in_dataframe(df: 'Pandas dataframe', key_value_list: list) -> bo
         assert isFound == True, "{} was not found in t{}".format(pairs, file_name)
     :Returns:
         bool 
-        
+    :Notes:
+        indexed=True answers from find_rows(), repeated checks on the same columns don't rescan the dataframe.
+    """
+    if indexed:
+        isFound = len(find_rows(df, key_value_list)) > 0
+        logger.info('{}. Key, Value {} in {}: '.format(isFound, key_value_list, df.name))
+        return isFound
+
+    return get_entry_in_dataframe(df, key_value_list).any()
+
+def check_entries(df: 'Pandas dataframe', key_value_list: list) -> list:
+    """
+    Check many row entries at once. Entries with the same keys are answered together, with one pass over those
+    columns of the dataframe.
+
+    :Usage:
+        expected_variants = [{'gene': 'ESR1', 'mut_aa': 'D538G', 'call': 1}, {'gene': 'PIK3CA', 'mut_aa': 'H1047R', 'call': 1}]
+        found = helper.pandas_helper.check_entries(dataframe, expected_variants)
+        missing = [entry for entry, isFound in zip(expected_variants, found) if not isFound]
+    :Returns:
+        list of bool, one per entry
+    :Notes:
+        Matches are the same as find_rows(): an empty cell matches nothing.
+    """
+    found = [False] * len(key_value_list)
+    groups = {} #key columns -> [(entry number, values)]
+    for entry_number, key_value in enumerate(key_value_list):
+        if not key_value:
+            raise ValueError('Empty dictionary')
+        values = tuple(key_value.values())
+        try:
+            hash(values)
+        except TypeError: #unhashable values are never equal to a tsv cell
+            continue
+        groups.setdefault(tuple(key_value), []).append((entry_number, values))
+    for columns, entries in groups.items():
+        present = pandas.MultiIndex.from_frame(df[list(columns)].dropna())
+        expected = pandas.MultiIndex.from_tuples([values for _, values in entries], names=list(columns))
+        for (entry_number, _), isFound in zip(entries, expected.isin(present)):
+            found[entry_number] = bool(isFound)
+    logger.info('Found {} of {} entries in {}'.format(sum(found), len(found), getattr(df, 'name', 'dataframe')))
+    return found
+
+def read_columns(path: 'path', columns: list = None) -> 'panda dataframe':
+    """
+    Get only some columns of a csv/tsv as a Pandas dataframe. The other columns are skipped by the parser,
+    columns=None reads them all.
+
+    :Usage:
+        df = helper.pandas_helper.read_columns(test_case_directory / snv_tsv, ['gene', 'mut_aa', 'call'])
+    :Returns:
+        a pandas dataframe with the columns in the order given
+    :Notes:
+        Not cached, see return_as_dataframe() for whole files or libraries.framework.BipDataset for call tables.
+    """
+    path_str = os.path.realpath(str(path))
+    if columns is None:
+        df = _read_csv(path_str)
+    else:
+        df = _read_csv(path_str, usecols=list(columns))[list(columns)]
+    df.name = path_str
+    logger.info('Returning columns {} of {} as panda data frame'.format(list(df.columns), path))
+    return df
+
+def scan_tsv_file(path: 'path', key_value: dict, columns: list = None, chunk_rows: int = SCAN_CHUNK_ROWS, first_only=False) -> 'panda dataframe':
+    """
+    Rows of a csv/tsv matching every key, value pair, read chunk by chunk instead of loading the whole file.
+    Only the key columns and the requested columns are parsed.
+
+    :Usage:
+        snv_path = test_case_directory / "A027954801.snv_call.hdr.tsv"
+        rows = helper.pandas_helper.scan_tsv_file(snv_path, {'gene': 'ESR1', 'call': 1}, columns=['mut_aa', 'percentage'])
+    :Returns:
+        a pandas dataframe of the matching rows, indexed by row number in the file
+    :Notes:
+        Memory is bounded by chunk_rows. first_only=True stops reading at the first chunk with a match.
+        Matches are the same as get_entry_in_dataframe() on return_as_dataframe(), as long as a key column
+        doesn't change type part way through the file (e.g. numbers, then text).
+        Compressed tables are decoded chunk by chunk as well.
+    """
+    if not key_value:
+        raise ValueError('Empty dictionary')
+    path_str = os.path.realpath(str(path))
+    usecols = list(dict.fromkeys(list(key_value) + list(columns or [])))
+    found = []
+    rows_read = 0
+    with _read_csv(path_str, usecols=usecols, chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            rows_read += len(chunk)
+            filtered = None
+            for key, value in key_value.items():
+                matches = (chunk[key] == value)
+                filtered = matches if filtered is None else filtered & matches
+            if filtered.any():
+                found.append(chunk[filtered])
+                if first_only:
+                    break
+    rows = pandas.concat(found) if found else pandas.DataFrame(columns=usecols)
+    rows = rows[columns] if columns is not None else rows
+    logger.info('{} rows with Key, Value {} in {} ({} rows read)'.format(len(rows), key_value, path, rows_read))
+    return rows
+
+def check_entry_in_file(path: 'path', key_value: dict, chunk_rows: int = SCAN_CHUNK_ROWS) -> bool:
+    """
+    Check for a row entry inside a csv/tsv without loading the whole file. Reading stops at the first match.
+    Solves the same problem as check_entry_in_dataframe(return_as_dataframe(path), key_value)
+
+    :Usage:
+        isFound = helper.pandas_helper.check_entry_in_file(test_case_directory / snv_tsv, {'gene': 'ESR1', 'call': 0})
+    :Returns:
+        bool
+    """
+    return len(scan_tsv_file(path, key_value, chunk_rows=chunk_rows, first_only=True)) > 0
+
+def _as_dataframe(table: 'path or panda dataframe') -> 'panda dataframe':
+    if isinstance(table, pandas.DataFrame):
+        return table
+    return return_as_dataframe(Path(table))
+
+def diff_tables(actual: 'path or panda dataframe', expected: 'path or panda dataframe', key_columns: list,
+                columns: list = None, tolerances: 'float or dict' = None, verbose=True) -> dict:
+    """
+    Compare two csv/tsv tables row by row, matching rows on key columns instead of position.
+
+    :Usage:
+        diff = helper.pandas_helper.diff_tables(test_case_directory / snv_tsv, golden_directory / snv_tsv,
+                                                key_columns=['gene', 'position', 'mut_nt'],
+                                                tolerances={'percentage': 0.01, 'zscore': 0.5})
+    :Returns:
+        dict with 'missing' (expected rows not in actual), 'extra' (actual rows not in expected),
+        'changed' (key columns + column, actual, expected), 'missing_columns' and 'extra_columns'
+    :Notes:
+        Rows are joined on the key columns in one hash join, and every column is compared at once.
+        Rows with the same key are paired in file order. Empty cells are equal to each other.
+        tolerances is one number for every numeric column or a dict of column -> allowed absolute difference.
+        columns limits the comparison to those columns.
+    """
+    actual_df, expected_df = _as_dataframe(actual), _as_dataframe(expected)
+    key_columns = list(key_columns)
+    if columns is None:
+        columns = [column for column in expected_df.columns if column not in key_columns and column in actual_df.columns]
+    missing_columns = [column for column in expected_df.columns if column not in actual_df.columns]
+    extra_columns = [column for column in actual_df.columns if column not in expected_df.columns]
+
+    #number repeated keys so duplicates pair up 1:1 instead of multiplying in the join
+    sides = []
+    for df in (actual_df, expected_df):
+        side = df[key_columns + columns].copy(deep=False)
+        side['_occurrence'] = side.groupby(key_columns, sort=False, dropna=False, observed=True).cumcount()
+        sides.append(side)
+    join_columns = key_columns + ['_occurrence']
+    merged = sides[0].merge(sides[1], how='outer', on=join_columns, suffixes=('_actual', '_expected'), indicator=True)
+
+    in_actual = merged['_merge'] == 'left_only'
+    in_expected = merged['_merge'] == 'right_only'
+    both = merged[merged['_merge'] == 'both']
+    extra = merged.loc[in_actual, key_columns + ["{}_actual".format(column) for column in columns]].set_axis(key_columns + columns, axis=1)
+    missing = merged.loc[in_expected, key_columns + ["{}_expected".format(column) for column in columns]].set_axis(key_columns + columns, axis=1)
+
+    changed = []
+    for column in columns:
+        actual_values = both["{}_actual".format(column)]
+        expected_values = both["{}_expected".format(column)]
+        if isinstance(actual_values.dtype, pandas.CategoricalDtype) or isinstance(expected_values.dtype, pandas.CategoricalDtype):
+            actual_values, expected_values = actual_values.astype(object), expected_values.astype(object)
+        equal = (actual_values == expected_values) | (actual_values.isna() & expected_values.isna())
+        tolerance = tolerances.get(column) if isinstance(tolerances, dict) else tolerances
+        if tolerance is not None and pandas.api.types.is_numeric_dtype(actual_values) and pandas.api.types.is_numeric_dtype(expected_values):
+            equal |= (actual_values - expected_values).abs() <= tolerance
+        if not equal.all():
+            different = ~equal
+            changed.append(both.loc[different, key_columns].assign(column=column, actual=actual_values[different], expected=expected_values[different]))
+    changed = pandas.concat(changed, ignore_index=True) if changed else pandas.DataFrame(columns=key_columns + ['column', 'actual', 'expected'])
+
+    if verbose:
+        logger.info('table diff on {}: {} missing rows, {} extra rows, {} changed values, {} missing columns, {} extra columns'.format(
+            key_columns, len(missing), len(extra), len(changed), len(missing_columns), len(extra_columns)))
+    return {'missing': missing.reset_index(drop=True), 'extra': extra.reset_index(drop=True), 'changed': changed,
+            'missing_columns': missing_columns, 'extra_columns': extra_columns}
+
+def verify_tables_match(actual: 'path or panda dataframe', expected: 'path or panda dataframe', key_columns: list,
+                        columns: list = None, tolerances: 'float or dict' = None, verbose=True) -> dict:
+    """
+    Compare a csv/tsv against its golden copy with diff_tables() and report the differences in a single check_helper failure.
+
+    :Usage:
+        diff = helper.pandas_helper.verify_tables_match(test_case_directory / snv_tsv, golden_directory / snv_tsv,
+                                                        key_columns=['gene', 'position', 'mut_nt'], tolerances={'percentage': 0.01})
+    :Returns:
+        dict from diff_tables()
+    :Notes:
+        The first TABLE_REPORT_ROWS differences of each kind are listed, the rest are counted.
     """
+    diff = diff_tables(actual, expected, key_columns, columns, tolerances, verbose)
+    differences = ["missing column {}".format(column) for column in diff['missing_columns']]
+    differences += ["extra column {}".format(column) for column in diff['extra_columns']]
+    for kind in ('missing', 'extra'):
+        rows = diff[kind]
+        differences += ["{} row {}".format(kind, row) for row in rows.head(TABLE_REPORT_ROWS).to_dict('records')]
+        if len(rows) > TABLE_REPORT_ROWS:
+            differences.append("... {} more {} rows".format(len(rows) - TABLE_REPORT_ROWS, kind))
+    changed = diff['changed']
+    for row in changed.head(TABLE_REPORT_ROWS).to_dict('records'):
+        keys = {key: row[key] for key in key_columns}
+        differences.append("{} {}: expected {!r}, actual {!r}".format(keys, row['column'], row['expected'], row['actual']))
+    if len(changed) > TABLE_REPORT_ROWS:
+        differences.append("... {} more changed values".format(len(changed) - TABLE_REPORT_ROWS))
 
-    return get_entry_in_dataframe(df, key_value_list).any()
\ No newline at end of file
+    descriptions = [str(table) if not isinstance(table, pandas.DataFrame) else getattr(table, 'name', 'dataframe') for table in (actual, expected)]
+    check_helper.no_differences(differences, "{} vs {}".format(*descriptions))
+    return diff
@@ -1,5 +1,6 @@
 import textract
 import logging
+from .logging_helper import lazy_str
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +21,6 @@ class PdfHelper:
             method = 'pdfminer'
         text = textract.process(pdf_path, method='pdfminer')
         if verbose:
-            logger.info("pdf {} has the following text:\n {} ".format(pdf_path, text))
+            logger.info("pdf %s has the following text:\n %s ", pdf_path, lazy_str(text))
         return text
         
\ No newline at end of file
@@ -1,5 +1,6 @@
 import requests
 import logging
+from .logging_helper import lazy_str
 
 
 class RequestHelper:
@@ -14,8 +15,8 @@ class RequestHelper:
         :Returns:
             the response data from the get request
         """
-        self.logger.info("Sending get request to url: " + url +
-                         " with the following arguments: " + str(args) + " " + str(kwargs))
+        self.logger.info("Sending get request to url: %s with the following arguments: %s %s",
+                         url, lazy_str(args), lazy_str(kwargs))
         return requests.get(url, *args, **kwargs)
 
     def post(self, url, *args, **kwargs):
@@ -26,8 +27,8 @@ class RequestHelper:
         :Returns:
             the response data from the post request
         """
-        self.logger.info("Sending post request to url: " + url +
-                         " with the following arguments: " + str(args) + " " + str(kwargs))
+        self.logger.info("Sending post request to url: %s with the following arguments: %s %s",
+                         url, lazy_str(args), lazy_str(kwargs))
         return requests.post(url, *args, **kwargs)
 
     def put(self, url, *args, **kwargs):
@@ -40,8 +41,8 @@ class RequestHelper:
         :Returns:
             the response data from the put request
         """
-        self.logger.info("Sending put request to url: " + url +
-                         " with the following arguments: " + str(args) + " " + str(kwargs))
+        self.logger.info("Sending put request to url: %s with the following arguments: %s %s",
+                         url, lazy_str(args), lazy_str(kwargs))
         return requests.put(url, *args, **kwargs)
 
     def patch(self, url: object, *args: object, **kwargs: object) -> object:
@@ -53,8 +54,8 @@ class RequestHelper:
         :Returns:
             the response data from the patch request
         """
-        self.logger.info("Sending patch request to url: " + url +
-                         " with the following arguments: " + str(args) + " " + str(kwargs))
+        self.logger.info("Sending patch request to url: %s with the following arguments: %s %s",
+                         url, lazy_str(args), lazy_str(kwargs))
         return requests.patch(url, *args, **kwargs)
 
     def delete(self, url, *args, **kwargs):
@@ -66,8 +67,8 @@ class RequestHelper:
         :Returns:
             the response data from the delete request
         """
-        self.logger.info("Sending delete request to url: " + url +
-                         " with the following arguments: " + str(args) + " " + str(kwargs))
+        self.logger.info("Sending delete request to url: %s with the following arguments: %s %s",
+                         url, lazy_str(args), lazy_str(kwargs))
         return requests.delete(url, *args, **kwargs)
 
     def check_response_code(self, response, expectation):
@@ -1,8 +1,43 @@
+import asyncio
+import atexit
+import os
+import re
+import selectors
+import shlex
+import signal
 import subprocess
 import logging
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from .logging_helper import lazy_str
 
 logger = logging.getLogger(__name__) 
 
+RUN_MANY_MAX_WORKERS = 8 #commands run_many() runs at the same time unless max_workers is given
+STREAM_TAIL_LINES = 1000 #lines of stdout and of stderr run_streaming() keeps in memory
+USE_SHELL_SESSION = False #run() sends commands to a long lived shell instead of starting one per call
+
+def set_shell_session(enabled: bool):
+    """
+    Send run() commands to one long lived /bin/sh per process instead of starting a new shell for every call.
+    Saves the process start up of every small command in fixtures and helpers like bip_files.get_md5sum().
+
+    :Usage:
+        helper.subprocess_helper.set_shell_session(True)
+    :Returns:
+        None
+    :Notes:
+        Calls with extra subprocess.run arguments (cwd, env, timeout...) still start their own shell.
+        Like a new shell, a command runs in python's current directory and sees os.environ as it is when run() is called:
+        each command cd's to os.getcwd() first, and the session shell is started again after os.environ changed.
+    """
+    global USE_SHELL_SESSION
+    USE_SHELL_SESSION = enabled
+
 def run(input: str, verbose=True, *args, **kwargs):
     """
     Run a bash command and return the output
@@ -13,22 +48,277 @@ def run(input: str, verbose=True, *args, **kwargs):
     :Returns:
         the output of the command
     """
-    p1 = subprocess.run(input, shell=True, capture_output=True, text=True, *args, **kwargs)
+    if USE_SHELL_SESSION and not args and not kwargs:
+        p1 = get_shell_session().run(input)
+    else:
+        p1 = subprocess.run(input, shell=True, capture_output=True, text=True, *args, **kwargs)
     #default drectory is in /CSRM-Emerald/test/framework/
     #shell to pass args as str
     #capture_output so we can log the results of the command in p1.stdout
     #text so it doesn't have to be decoded
-    if verbose:
-        logger.info("running bash command: {}".format(input))
-        logger.info("stdout is: {}".format(p1.stdout))
+    _log_result(p1, verbose)
     if p1.returncode: #return code is 0 if successful and non-zero otherwise
-        logger.error("error: {}, p1.returncode: {}".format(p1.stderr, p1.returncode))
         return p1.returncode
     return p1.stdout.rstrip('\n')
 
+class ShellSession:
+    """
+    One /bin/sh kept running to execute commands sent over its stdin, so a command costs a fork inside the shell
+    instead of starting a new shell from python. The output of each command ends with a random sentinel followed
+    by the return code. The shell is started again if it died or a command timed out.
+
+    :Usage:
+        session = helper.subprocess_helper.ShellSession()
+        result = session.run("md5sum {} | cut -d ' ' -f1".format(str(filepath)), timeout=60)
+        md5sum = result.stdout.rstrip('\n')
+    :Notes:
+        Commands run in a subshell with stdin from /dev/null, so cd, exit and exported variables don't leak between them.
+        Each command starts in os.getcwd() of the python process, and the shell is started again if os.environ changed
+        since it was started, so os.chdir() and os.environ edits (e.g. monkeypatch) are seen like with subprocess.run().
+    """
+
+    def __init__(self, shell: str = '/bin/sh'):
+        self.shell = shell
+        self.process = None
+        self._sentinel = None
+        self._environ = None #os.environ the shell was started with
+        self._lock = threading.Lock()
+
+    def _start(self):
+        self.close()
+        self._sentinel = uuid.uuid4().hex.encode()
+        self._returncode_pattern = re.compile(re.escape(self._sentinel) + rb' (\d+)\n')
+        self._environ = dict(os.environ)
+        self.process = subprocess.Popen([self.shell], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                        start_new_session=True)
+        logger.info("started shell session {} with pid {}".format(self.shell, self.process.pid))
+
+    def close(self):
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            _kill_process_group(self.process)
+        self.process.wait()
+        for pipe in (self.process.stdin, self.process.stdout, self.process.stderr):
+            pipe.close()
+        self.process = None
+
+    def run(self, command: str, timeout: float = None) -> subprocess.CompletedProcess:
+        """
+        Run a command in the session.
+
+        :Returns:
+            a subprocess.CompletedProcess like run_many(), returncode -9 if the command timed out
+        """
+        with self._lock:
+            if self.process is None or self.process.poll() is not None or self._environ != os.environ:
+                self._start()
+            script = "( cd {} && eval {} ) </dev/null; printf '%s %d\\n' {sentinel} $?; printf '%s\\n' {sentinel} >&2\n".format(
+                shlex.quote(os.getcwd()), shlex.quote(command), sentinel=self._sentinel.decode())
+            try:
+                self.process.stdin.write(script.encode())
+                self.process.stdin.flush()
+            except BrokenPipeError:
+                self._start()
+                self.process.stdin.write(script.encode())
+                self.process.stdin.flush()
+            return self._read_result(command, timeout)
+
+    def _read_result(self, command: str, timeout: float) -> subprocess.CompletedProcess:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        stdout, stderr = bytearray(), bytearray()
+        returncode_match = None
+        searched = 0
+        stderr_done = False
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.process.stdout, selectors.EVENT_READ, stdout)
+            selector.register(self.process.stderr, selectors.EVENT_READ, stderr)
+            while returncode_match is None or not stderr_done:
+                wait = None if deadline is None else deadline - time.monotonic()
+                events = selector.select(wait) if wait is None or wait > 0 else []
+                if not events:
+                    self.close()
+                    return _timed_out(command, timeout, stdout.decode(errors='replace'), stderr.decode(errors='replace'))
+                for key, _ in events:
+                    chunk = os.read(key.fileobj.fileno(), 65536)
+                    if not chunk: #the shell died, the next run() starts a new one
+                        returncode = self.process.wait()
+                        self.close()
+                        return subprocess.CompletedProcess(command, returncode or -1, stdout.decode(errors='replace'),
+                                                           stderr.decode(errors='replace'))
+                    key.data.extend(chunk)
+                if returncode_match is None: #only the new bytes and a possibly split sentinel are searched
+                    returncode_match = self._returncode_pattern.search(stdout, max(0, searched - len(self._sentinel) - 24))
+                    searched = len(stdout)
+                if not stderr_done:
+                    stderr_done = stderr.endswith(self._sentinel + b'\n')
+        returncode = int(returncode_match.group(1))
+        stdout = stdout[:returncode_match.start()]
+        stderr = stderr[:-len(self._sentinel) - 1]
+        return subprocess.CompletedProcess(command, returncode, stdout.decode(errors='replace'), stderr.decode(errors='replace'))
+
+_shell_sessions = {} #pid -> ShellSession, so a forked xdist worker or Pool child never writes to its parent's shell
+
+def get_shell_session() -> ShellSession:
+    """
+    The ShellSession of this process, started on first use.
+
+    :Usage:
+        result = helper.subprocess_helper.get_shell_session().run("ls {}".format(test_case_directory), timeout=10)
+    :Returns:
+        a ShellSession
+    """
+    session = _shell_sessions.get(os.getpid())
+    if session is None:
+        session = _shell_sessions.setdefault(os.getpid(), ShellSession())
+    return session
+
+@atexit.register
+def _close_shell_sessions():
+    session = _shell_sessions.pop(os.getpid(), None)
+    if session is not None:
+        session.close()
+
+def run_streaming(input: str, timeout: float = None, tail_lines: int = None, tee: 'path' = None, verbose=True, **kwargs):
+    """
+    Run a long bash command, logging its output line by line while it runs instead of once it finishes.
+    Only the last tail_lines lines are kept in memory, so commands with huge output don't fill the memory.
+
+    :Usage:
+        bash = "bip_pipeline --config {}".format(config_path)
+        last_lines = helper.subprocess_helper.run_streaming(bash, timeout=1800, tee=test_case_directory / "pipeline.log")
+    :Returns:
+        the last tail_lines lines of stdout like run(), or the return code if the command failed or timed out
+    :Notes:
+        tee writes the full stdout and stderr to a file as they arrive.
+        On timeout the shell and everything it started are killed and -9 is returned.
+        kwargs go to subprocess.Popen, e.g. cwd, env.
+    """
+    tail_lines = tail_lines or STREAM_TAIL_LINES
+    stdout_tail, stderr_tail = deque(maxlen=tail_lines), deque(maxlen=tail_lines)
+    tee_lock = threading.Lock()
+    if verbose:
+        logger.info("running bash command: {}".format(input))
+    with open(tee, 'w') if tee else nullcontext() as tee_file:
+        def forward(pipe, tail, name, level):
+            for line in pipe:
+                tail.append(line)
+                if verbose:
+                    logger.log(level, "%s: %s", name, line.rstrip('\n'))
+                if tee_file:
+                    with tee_lock:
+                        tee_file.write(line)
+
+        with subprocess.Popen(input, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, errors='replace',
+                              start_new_session=True, **kwargs) as process:
+            readers = [threading.Thread(target=forward, args=(process.stdout, stdout_tail, 'stdout', logging.INFO), daemon=True),
+                       threading.Thread(target=forward, args=(process.stderr, stderr_tail, 'stderr', logging.WARNING), daemon=True)]
+            for reader in readers:
+                reader.start()
+            try:
+                returncode = process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                _kill_process_group(process)
+                process.wait()
+                returncode = -signal.SIGKILL
+                stderr_tail.append("timed out after {}s".format(timeout))
+            for reader in readers:
+                reader.join()
+    if returncode: #return code is 0 if successful and non-zero otherwise
+        logger.error("error: %s, p1.returncode: %s", lazy_str(''.join(stderr_tail)), returncode)
+        return returncode
+    return ''.join(stdout_tail).rstrip('\n')
+
+def _log_result(p1: subprocess.CompletedProcess, verbose: bool):
+    if verbose:
+        logger.info("running bash command: {}".format(p1.args))
+        logger.info("stdout is: %s", lazy_str(p1.stdout))
+    if p1.returncode: #return code is 0 if successful and non-zero otherwise
+        logger.error("error: %s, p1.returncode: %s", lazy_str(p1.stderr), p1.returncode)
+
+def _kill_process_group(process):
+    #the shell and everything it started share a process group because of start_new_session
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+def _timed_out(command: str, timeout: float, stdout: str, stderr: str) -> subprocess.CompletedProcess:
+    stderr = "{}timed out after {}s".format(stderr + '\n' if stderr else '', timeout)
+    return subprocess.CompletedProcess(command, -signal.SIGKILL, stdout, stderr)
 
+def _run_one(command: str, timeout: float, kwargs: dict) -> subprocess.CompletedProcess:
+    with subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                          start_new_session=True, **kwargs) as process:
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            _kill_process_group(process)
+            stdout, stderr = process.communicate()
+            return _timed_out(command, timeout, stdout, stderr)
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
 
-        
+async def _run_one_async(command: str, timeout: float, kwargs: dict, semaphore: asyncio.Semaphore) -> subprocess.CompletedProcess:
+    async with semaphore:
+        process = await asyncio.create_subprocess_shell(command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                                                        start_new_session=True, **kwargs)
+        communicate = asyncio.ensure_future(process.communicate())
+        try:
+            stdout, stderr = await asyncio.wait_for(asyncio.shield(communicate), timeout)
+        except asyncio.TimeoutError:
+            _kill_process_group(process)
+            stdout, stderr = await communicate
+            return _timed_out(command, timeout, stdout.decode(errors='replace'), stderr.decode(errors='replace'))
+    return subprocess.CompletedProcess(command, process.returncode, stdout.decode(errors='replace'), stderr.decode(errors='replace'))
 
-    
+def _timeouts(commands: list, timeout) -> list:
+    if isinstance(timeout, (list, tuple)):
+        if len(timeout) != len(commands):
+            raise ValueError("{} timeouts for {} commands".format(len(timeout), len(commands)))
+        return list(timeout)
+    return [timeout] * len(commands)
+
+def run_many(commands: list, max_workers: int = None, timeout=None, backend: str = 'thread', verbose=True, **kwargs) -> list:
+    """
+    Run bash commands at the same time, at most max_workers at once, and wait for all of them.
 
+    :Usage:
+        bash = ["md5sum {} | cut -d ' ' -f1".format(str(filepath)) for filepath in filepaths]
+        results = helper.subprocess_helper.run_many(bash, max_workers=4, timeout=60)
+        md5sums = [result.stdout.rstrip('\\n') for result in results]
+    :Returns:
+        a subprocess.CompletedProcess (args, returncode, stdout, stderr) per command, in the order of commands
+    :Notes:
+        timeout is seconds for every command or a list with one entry per command, None waits forever.
+        A command that times out is killed with everything it started; its returncode is -9 and stderr says it timed out.
+        backend='asyncio' runs the commands on an event loop instead of threads, from a coroutine use run_many_async().
+        kwargs go to subprocess.Popen for the thread backend and asyncio.create_subprocess_shell for asyncio, e.g. cwd, env.
+    """
+    max_workers = max_workers or RUN_MANY_MAX_WORKERS
+    timeouts = _timeouts(commands, timeout)
+    if backend == 'thread':
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_run_one, commands, timeouts, [kwargs] * len(commands)))
+    elif backend == 'asyncio':
+        return asyncio.run(run_many_async(commands, max_workers, timeout, verbose, **kwargs))
+    else:
+        raise ValueError("backend must be 'thread' or 'asyncio', not {}".format(backend))
+    for result in results:
+        _log_result(result, verbose)
+    return results
+
+async def run_many_async(commands: list, max_workers: int = None, timeout=None, verbose=True, **kwargs) -> list:
+    """
+    Coroutine version of run_many() for code already running an event loop.
+
+    :Usage:
+        results = await helper.subprocess_helper.run_many_async(bash, max_workers=4, timeout=60)
+    :Returns:
+        a subprocess.CompletedProcess per command, in the order of commands
+    """
+    semaphore = asyncio.Semaphore(max_workers or RUN_MANY_MAX_WORKERS)
+    results = await asyncio.gather(*[_run_one_async(command, command_timeout, kwargs, semaphore)
+                                     for command, command_timeout in zip(commands, _timeouts(commands, timeout))])
+    for result in results:
+        _log_result(result, verbose)
+    return list(results)
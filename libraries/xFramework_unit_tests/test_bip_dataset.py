@@ -0,0 +1,130 @@
+from libraries.framework.bip_dataset import BipDataset
+import libraries.helper as helper
+from pathlib import Path
+import pytest
+import os
+
+path_to_folder = Path(__file__).parent
+
+
+def test_NEW_bip_dataset_join(tmp_path):
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    snv_path = tmp_path / "A027954801.snv_call.hdr.tsv"
+    snv_path.write_text((path_to_folder / "unit_test_data/pandas_data.tsv").read_text())
+    cnv_path = tmp_path / "bolts" / "csm" / "A027954801.cnv_call.hdr.tsv"
+    cnv_path.parent.mkdir(parents=True)
+    cnv_path.write_text("run_sample_id\tgene\tcopy_number\tcall\n"
+                        "A027954801\tALK\t2.5\t0\n"
+                        "A027954801\tKRAS\t1.7\t0\n")
+    (tmp_path / "bip_config.json").write_text("{}")
+    for path in (snv_path, cnv_path):
+        os.utime(path, ns=(10**9, 10**9)) #modified long ago so the parsed tables are kept
+    dataset = BipDataset(tmp_path)
+    assert dataset.tables == {'A027954801.snv_call.hdr.tsv': 'snv', 'bolts/csm/A027954801.cnv_call.hdr.tsv': 'cnv'}
+
+    expected = helper.pandas_helper.return_as_dataframe(snv_path)
+    snv = dataset.table('snv', ['gene', 'mut_aa'])
+    assert list(snv.columns) == ['gene', 'mut_aa']
+    assert snv['mut_aa'].equals(expected['mut_aa'])
+
+    rows = dataset.find('snv', {'gene': 'ALK'}, ['position'])
+    assert list(rows['position']) == list(expected.loc[expected['gene'] == 'ALK', 'position'])
+
+    joined = dataset.join({'snv': ['position'], 'cnv': ['copy_number']}, on='gene')
+    assert list(joined.columns) == ['gene', 'snv.position', 'cnv.copy_number']
+    assert set(joined['gene']) == {'ALK'}
+    assert (joined['cnv.copy_number'] == 2.5).all()
+    assert len(joined) == (expected['gene'] == 'ALK').sum()
+
+    #a changed file is parsed again
+    cnv_path.write_text("run_sample_id\tgene\tcopy_number\tcall\nA027954801\tALK\t4.0\t1\n")
+    os.utime(cnv_path, ns=(0, 0))
+    assert list(dataset.find('cnv', {'call': 1}, ['copy_number'])['copy_number']) == [4.0]
+
+
+def test_NEW_bip_dataset_parses_once(tmp_path, monkeypatch):
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    snv_path = tmp_path / "A027954801.snv_call.hdr.tsv"
+    snv_path.write_text((path_to_folder / "unit_test_data/pandas_data.tsv").read_text())
+    cnv_path = tmp_path / "A027954801.cnv_call.hdr.tsv"
+    cnv_path.write_text("run_sample_id\tgene\tcopy_number\tcall\nA027954801\tALK\t2.5\t0\n")
+    for path in (snv_path, cnv_path):
+        os.utime(path, ns=(10**9, 10**9))
+    parsed = []
+    read_columns = helper.pandas_helper.read_columns
+    monkeypatch.setattr(helper.pandas_helper, "read_columns", lambda path, columns=None: parsed.append(Path(path).name) or read_columns(path, columns))
+
+    dataset = BipDataset(tmp_path)
+    dataset.table('snv', ['gene'])
+    dataset.find('snv', {'gene': 'ALK'}, ['mut_aa', 'position'])
+    dataset.join({'snv': ['call'], 'cnv': ['copy_number']}, on='gene', where={'snv': {'call': 0}})
+    dataset.join({'snv': ['percentage'], 'cnv': ['call']}, on=['run_sample_id', 'gene'])
+    assert sorted(parsed) == ["A027954801.cnv_call.hdr.tsv", "A027954801.snv_call.hdr.tsv"]
+
+    #only the declared columns are parsed, asking for another one doesn't read the file again
+    dataset = BipDataset(tmp_path, columns={'snv': ['gene', 'mut_aa']})
+    assert list(dataset.table('snv').columns) == ['gene', 'mut_aa']
+    with pytest.raises(KeyError):
+        dataset.table('snv', ['position'])
+    assert parsed.count("A027954801.snv_call.hdr.tsv") == 2
+
+    #a same size rewrite in the same mtime tick is parsed again, the mtime is too recent to be trusted
+    snv_path.write_text(snv_path.read_text().replace('ALK', 'ROS'))
+    file_stat = snv_path.stat()
+    assert 'ROS' in set(dataset.table('snv')['gene'])
+    snv_path.write_text(snv_path.read_text().replace('ROS', 'RET'))
+    os.utime(snv_path, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns))
+    assert 'RET' in set(dataset.table('snv')['gene'])
+
+
+def test_NEW_bip_dataset_ambiguous_table(tmp_path):
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    for relative_path in ["A027954801.cnv_call.hdr.tsv", "bolts/csm/A027954801.cnv_call.hdr.tsv"]:
+        (tmp_path / relative_path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / relative_path).write_text("gene\tcopy_number\nALK\t2.0\n")
+    dataset = BipDataset(tmp_path)
+    with pytest.raises(ValueError):
+        dataset.table('cnv')
+    assert list(dataset.table('bolts/csm/A027954801.cnv_call.hdr.tsv')['copy_number']) == [2.0]
@@ -1,8 +1,10 @@
 from libraries.framework.bip_files import update_row_in_tsv, update_manifest_md5, get_md5sum
+import libraries.framework.bip_files as bip_files
 import libraries.helper as helper
 from pathlib import Path
 import pytest
 import json
+import os
 
 path_to_folder = Path(__file__).parent
 
@@ -182,3 +184,102 @@ def test_gid_204893_get_md5sum_negative():
     """
     test_json_path = path_to_folder / "unit_test_data/nonexistent_file"
     get_md5sum(test_json_path)
+
+
+def test_NEW_hash_files(tmp_path):
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    tsv_path = tmp_path / "pandas_data.tsv"
+    tsv_path.write_bytes((path_to_folder / "unit_test_data/pandas_data.tsv").read_bytes())
+    os.utime(tsv_path, ns=(10**9, 10**9)) #modified long ago so the digest is cached
+    empty_path = tmp_path / "empty.tsv"
+    empty_path.write_bytes(b"")
+    expected = {path: helper.subprocess_helper.run("md5sum {} | cut -d ' ' -f1".format(path)) for path in (tsv_path, empty_path)}
+    bip_files.clear_hash_cache()
+    assert bip_files.hash_files([tsv_path, empty_path]) == expected
+    assert get_md5sum(tsv_path) == expected[tsv_path]
+    assert bip_files.get_hash_cache_stats()['hits'] == 1
+    assert bip_files.hash_file(tsv_path, 'sha256') == helper.subprocess_helper.run("sha256sum {} | cut -d ' ' -f1".format(tsv_path))
+    assert len(bip_files.hash_file(tsv_path, bip_files.FAST_DIGEST)) >= 32
+
+    #big files go through mmap
+    big_path = tmp_path / "big.bin"
+    big_path.write_bytes(bytes(range(256)) * 5000)
+    hash_mmap_min_bytes = bip_files.HASH_MMAP_MIN_BYTES
+    bip_files.HASH_MMAP_MIN_BYTES = 1000
+    try:
+        assert bip_files.hash_file(big_path) == helper.subprocess_helper.run("md5sum {} | cut -d ' ' -f1".format(big_path))
+    finally:
+        bip_files.HASH_MMAP_MIN_BYTES = hash_mmap_min_bytes
+
+    #a file changed right after it was hashed is hashed again even if its size and mtime look the same
+    changed_path = tmp_path / "changed.tsv"
+    changed_path.write_text("gene\tcall\nKRAS\t0\n")
+    os.utime(changed_path, ns=(10**9, 10**9))
+    before = bip_files.hash_file(changed_path)
+    changed_path.write_text("gene\tcall\nKRAS\t1\n")
+    os.utime(changed_path, ns=(10**9, 10**9))
+    bip_files.clear_hash_cache() #same size and mtime, only clearing the cache can notice it
+    assert bip_files.hash_file(changed_path) != before
+    recent_path = tmp_path / "recent.tsv"
+    recent_path.write_text("gene\tcall\nKRAS\t0\n")
+    before = bip_files.hash_file(recent_path)
+    recent_path.write_text("gene\tcall\nKRAS\t1\n")
+    assert bip_files.hash_file(recent_path) != before
+
+
+def test_NEW_refresh_manifest(tmp_path):
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    snv_path = tmp_path / "A027954801.snv_call.hdr.tsv"
+    snv_path.write_bytes((path_to_folder / "unit_test_data/pandas_data.tsv").read_bytes())
+    cnv_path = tmp_path / "bolts" / "csm" / "A027954801.cnv_call.hdr.tsv"
+    cnv_path.parent.mkdir(parents=True)
+    cnv_path.write_text("gene\tcopy_number\nKRAS\t1.7\n")
+    manifest_path = tmp_path / "manifest.boltons.json"
+    elements = [{"file_name": "A027954801.snv_call.hdr.tsv", "md5": "abc", "file_size": 1, "category": "snv_call"},
+                {"file_name": "bolts/csm/A027954801.cnv_call.hdr.tsv", "md5": get_md5sum(cnv_path),
+                 "file_size": cnv_path.stat().st_size, "category": "cnv_call"},
+                {"file_name": "A027954801.short.bwamem.cram", "md5": "def", "file_size": 2}]
+    manifest_path.write_text(json.dumps({"meta": {}, "elements": elements}))
+
+    assert bip_files.refresh_manifest(manifest_path, [snv_path, "bolts/csm/A027954801.cnv_call.hdr.tsv"]) == ["A027954801.snv_call.hdr.tsv"]
+    refreshed = json.loads(manifest_path.read_text())["elements"]
+    assert refreshed[0] == dict(elements[0], md5=get_md5sum(snv_path), file_size=snv_path.stat().st_size)
+    assert refreshed[1:] == elements[1:]
+
+    update_row_in_tsv(cnv_path, {'gene': 'KRAS'}, {'copy_number': 3.5})
+    modified = manifest_path.stat().st_mtime_ns
+    assert bip_files.refresh_manifest(manifest_path, [snv_path]) == []
+    assert manifest_path.stat().st_mtime_ns == modified #nothing changed, nothing written
+    assert bip_files.refresh_manifest(manifest_path) == ["bolts/csm/A027954801.cnv_call.hdr.tsv"] #the cram doesn't exist
+    assert json.loads(manifest_path.read_text())["elements"][1]["md5"] == get_md5sum(cnv_path)
+
+    with pytest.raises(ValueError):
+        bip_files.refresh_manifest(manifest_path, [tmp_path / "not_in_manifest.tsv"])
@@ -0,0 +1,157 @@
+from libraries.framework.dataset_snapshot import DatasetSnapshot
+import libraries.helper as helper
+from pathlib import Path
+import pytest
+import stat
+import os
+
+path_to_folder = Path(__file__).parent
+
+
+def test_NEW_dataset_snapshot_restore(tmp_path):
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    data_path = tmp_path / "data"
+    (data_path / "general_352" / "bolts" / "csm").mkdir(parents=True)
+    snv_path = data_path / "general_352" / "A027954801.snv_call.hdr.tsv"
+    snv_path.write_bytes((path_to_folder / "unit_test_data/pandas_data.tsv").read_bytes())
+    cnv_path = data_path / "general_352" / "bolts" / "csm" / "A027954801.cnv_call.hdr.tsv"
+    cnv_path.write_text("gene\tcopy_number\nKRAS\t1.7\n")
+    manifest_path = data_path / "general_352" / "manifest.boltons.json"
+    manifest_path.write_text('{"elements": []}')
+    original = {path: path.read_bytes() for path in (snv_path, cnv_path, manifest_path)}
+
+    snapshot = DatasetSnapshot(data_path, tmp_path / "snapshot")
+    assert snapshot.restore() == []
+
+    #same size, mtime set back, only ctime shows the change
+    snv_stat = snv_path.stat()
+    with open(snv_path, 'r+b') as snv_file:
+        snv_file.write(b'R')
+    os.utime(snv_path, ns=(snv_stat.st_atime_ns, snv_stat.st_mtime_ns))
+    cnv_path.unlink()
+    (data_path / "general_352" / "output.json").write_text("{}")
+    (data_path / "general_352" / "results").mkdir()
+    (data_path / "general_352" / "results" / "report.pdf").write_text("pdf")
+    unchanged_inode = manifest_path.stat().st_ino
+
+    assert sorted(snapshot.restore()) == sorted([os.path.join("general_352", "A027954801.snv_call.hdr.tsv"),
+                                                 os.path.join("general_352", "bolts", "csm", "A027954801.cnv_call.hdr.tsv"),
+                                                 os.path.join("general_352", "output.json"),
+                                                 os.path.join("general_352", "results", "report.pdf")])
+    assert {path: path.read_bytes() for path in original} == original
+    assert snv_path.stat().st_mode & stat.S_IWUSR #restored with its own mode, not the read-only snapshot's
+    assert not (data_path / "general_352" / "output.json").exists()
+    assert not (data_path / "general_352" / "results").exists()
+    assert manifest_path.stat().st_ino == unchanged_inode #untouched files are not copied
+    assert snapshot.restore() == []
+
+    snapshot.close()
+    assert (tmp_path / "snapshot").exists() #the caller's directory is left alone
+
+
+def test_NEW_dataset_snapshot_checkout(tmp_path):
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    data_path = tmp_path / "data"
+    (data_path / "general_352" / "bolts" / "csm").mkdir(parents=True)
+    snv_path = data_path / "general_352" / "A027954801.snv_call.hdr.tsv"
+    snv_path.write_bytes((path_to_folder / "unit_test_data/pandas_data.tsv").read_bytes())
+    json_path = data_path / "general_352" / "input.json"
+    json_path.write_text('{"sample": "A027954801"}')
+    snapshot = DatasetSnapshot(data_path, tmp_path / "snapshot")
+    try:
+        first = snapshot.checkout(tmp_path / "gw0" / "data", written=())
+        second = snapshot.checkout(tmp_path / "gw1" / "data", written=())
+        assert (first / "general_352" / "bolts" / "csm").is_dir()
+        for relative_path in ["general_352/A027954801.snv_call.hdr.tsv", "general_352/input.json"]:
+            assert (first / relative_path).stat().st_nlink == 3 #snapshot and both workspaces
+
+        #a same size tsv edit and a plain json write replace the link instead
+        helper.pandas_helper.update_row_entry_in_tsv_file(first / "general_352" / "A027954801.snv_call.hdr.tsv",
+                                                          {'gene': 'CSRM1'}, {'gene': 'KRAS1'})
+        helper.json_helper.write_json_file(first / "general_352" / "input.json", {"sample": "changed"})
+        assert b'KRAS1' in (first / "general_352" / "A027954801.snv_call.hdr.tsv").read_bytes()
+        assert (second / "general_352" / "A027954801.snv_call.hdr.tsv").read_bytes() == snv_path.read_bytes()
+        assert (second / "general_352" / "input.json").read_text() == '{"sample": "A027954801"}'
+        assert (second / "general_352" / "input.json").stat().st_nlink == 2
+        assert snapshot.restore() == [] #workspaces don't touch the data directory
+        assert snapshot.verify() == []
+    finally:
+        snapshot.close()
+    assert snapshot.snapshot_dir.exists() #given by the caller, so not removed
+
+
+def test_NEW_dataset_snapshot_checkout_write_through(tmp_path):
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    data_path = tmp_path / "data" / "general_352"
+    data_path.mkdir(parents=True)
+    (data_path / "A027954801.snv_call.hdr.tsv").write_text("gene\tcall\nKRAS\t1\n")
+    (data_path / "manifest.boltons.json").write_text('{"elements": []}')
+    (data_path / "A027954801.cram").write_bytes(b'reads')
+    snapshot = DatasetSnapshot(tmp_path / "data", tmp_path / "snapshot")
+    try:
+        first = snapshot.checkout(tmp_path / "gw0" / "data") / "general_352"
+        second = snapshot.checkout(tmp_path / "gw1" / "data") / "general_352"
+
+        #files tests and the pipeline write are copies, writing through them changes nothing else
+        for file_name in ["A027954801.snv_call.hdr.tsv", "manifest.boltons.json"]:
+            assert (first / file_name).stat().st_nlink == 1
+            with open(first / file_name, 'a') as outfile:
+                outfile.write("written by the container\n")
+            assert (second / file_name).read_text() == (data_path / file_name).read_text()
+            assert (snapshot.snapshot_dir / "general_352" / file_name).read_text() == (data_path / file_name).read_text()
+        assert snapshot.verify() == []
+
+        #the other files are read-only hardlinks, a write fails, or is found by verify() when root makes it
+        cram_path = first / "A027954801.cram"
+        assert cram_path.stat().st_nlink == 3
+        if os.geteuid() != 0:
+            with pytest.raises(PermissionError):
+                open(cram_path, 'r+b')
+        else:
+            with open(cram_path, 'r+b') as outfile:
+                outfile.write(b'R')
+            assert snapshot.verify() == [os.path.join("general_352", "A027954801.cram")]
+    finally:
+        snapshot.close()
@@ -1,7 +1,12 @@
 import pytest
 import json
+import os
 from pathlib import Path
 from libraries.helper.json_helper import get_json_file, get_json_value, write_json_file, update_json_file
+from libraries.helper.json_helper import compile_query, get_query_cache_stats, get_json_cache_stats
+from libraries.helper.json_helper import update_json_file_batch, stream_json_values, verify_json_values
+from libraries.helper.json_helper import index_by, lookup, diff_json, verify_json_matches
+from libraries.helper import check_helper
 
 path_to_folder = Path(__file__).parent
 default_test_json = {"test": "Hello from json"}
@@ -207,3 +212,564 @@ def test_gid_204912_update_json_file_negatives():
 
     with pytest.raises(Exception):
         update_json_file(test_json_path, "nonexistent_key", "testing update_json_file()")
+
+
+def test_NEW_compile_query():
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    query = compile_query("elements[?file_name=='test_json.json'].md5")
+    hits = get_query_cache_stats()['hits']
+    assert compile_query("elements[?file_name=='test_json.json'].md5") is query
+    assert compile_query(query) is query
+    assert get_query_cache_stats()['hits'] == hits + 1
+
+    json_object = {"elements": [{"file_name": "test_json.json", "md5": "abc"}]}
+    assert get_json_value(query, json_object) == ["abc"]
+    assert get_json_value("elements[?file_name=='test_json.json'].md5", json_object) == ["abc"]
+
+
+def test_NEW_compile_query_negative():
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    with pytest.raises(Exception):
+        compile_query("elements[?file_name==")
+
+
+def test_NEW_get_json_file_cache():
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    test_json_path = path_to_folder / "unit_test_data/test_json.json"
+    reset_json_file(test_json_path)
+    os.utime(test_json_path, ns=(10**9, 10**9)) #modified long ago so the parsed file is cached
+    json_object = get_json_file(test_json_path)
+    hits = get_json_cache_stats()['hits']
+    assert get_json_file(test_json_path) is json_object
+    assert get_json_cache_stats()['hits'] == hits + 1
+    assert get_json_value('length(test)', json_object) == len(default_test_json["test"])
+
+    # write_json_file invalidates the cached file
+    json_object_write = {"test": "testing get_json_file() cache"}
+    write_json_file(test_json_path, json_object_write)
+    assert get_json_file(test_json_path) == json_object_write
+
+    reset_json_file(test_json_path)
+    assert get_json_file(test_json_path) == default_test_json
+
+
+def test_NEW_get_json_file_cache_racy(tmp_path):
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    json_path = tmp_path / "output.json"
+    json_path.write_text('{"value": "Detected"}')
+    file_stat = json_path.stat()
+    assert get_json_file(json_path) == {"value": "Detected"}
+
+    # a same size rewrite in the same mtime tick keeps inode, mtime and size
+    with open(json_path, 'r+') as outfile:
+        outfile.write('{"value": "Detectex"}')
+    os.utime(json_path, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns))
+    assert get_json_file(json_path) == {"value": "Detectex"}
+
+
+def test_NEW_get_json_file_cache_read_only():
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    test_json_path = path_to_folder / "unit_test_data/test_json.json"
+    reset_json_file(test_json_path)
+    json_object = get_json_file(test_json_path)
+    with pytest.raises(TypeError):
+        json_object["test"] = "edited"
+
+    json_copy = get_json_file(test_json_path, copy=True)
+    json_copy["test"] = "edited"
+    assert get_json_file(test_json_path) == default_test_json
+
+
+def test_NEW_update_json_file_batch():
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    test_json_path = path_to_folder / "unit_test_data/test_json.json"
+    json_object_write = {
+        "elements": [
+            {"file_name": "a.tsv", "md5": "same", "file_size": 1},
+            {"file_name": "b.tsv", "md5": "same", "file_size": 1}
+        ]
+    }
+    write_json_file(test_json_path, json_object_write)
+
+    updates = {
+        "elements[?file_name=='b.tsv'].md5": "new",
+        "elements[?file_name=='b.tsv'].file_size": 2
+    }
+    update_json_file_batch(test_json_path, updates)
+    json_object = get_json_file(test_json_path)
+    assert json_object["elements"][0] == {"file_name": "a.tsv", "md5": "same", "file_size": 1}
+    assert json_object["elements"][1] == {"file_name": "b.tsv", "md5": "new", "file_size": 2}
+
+    reset_json_file(test_json_path)
+
+
+def test_NEW_update_json_file_batch_keeps_indent(tmp_path):
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    test_manifest_path = tmp_path / "test_manifest.json"
+    original = (path_to_folder / "unit_test_data/test_manifest.json").read_text()
+    test_manifest_path.write_text(original)
+    update_json_file(test_manifest_path, "elements[?file_name=='test_json.json'].md5", "new_md5")
+    changed_lines = [line for line, new_line in zip(original.splitlines(), test_manifest_path.read_text().splitlines()) if line != new_line]
+    assert len(original.splitlines()) == len(test_manifest_path.read_text().splitlines())
+    assert len(changed_lines) == 1 and '"md5"' in changed_lines[0] #4 space indent kept, only the md5 line differs
+
+    compact_path = tmp_path / "compact.json"
+    compact_path.write_text('{"elements": [{"file_name": "a.tsv", "md5": "old"}]}')
+    update_json_file(compact_path, "elements[?file_name=='a.tsv'].md5", "new")
+    assert compact_path.read_text() == '{"elements": [{"file_name": "a.tsv", "md5": "new"}]}'
+
+
+def test_NEW_update_json_file_keeps_values(tmp_path):
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    output_path = tmp_path / "output.json"
+    original = ('{\n'
+                '  "sample": "Müller-Lüdenscheid",\n'
+                '  "vaf": 1.0e-5,\n'
+                '  "coverage": 1.50,\n'
+                '  "results": [\n'
+                '    {\n'
+                '      "name": "MET",\n'
+                '      "value": "Detected"\n'
+                '    }\n'
+                '  ]\n'
+                '}\n')
+    output_path.write_text(original, encoding='utf-8')
+    update_json_file(output_path, "sample", "Müller")
+    changed_lines = [line for line, new_line in zip(original.splitlines(), output_path.read_text(encoding='utf-8').splitlines())
+                     if line != new_line]
+    assert changed_lines == ['  "sample": "Müller-Lüdenscheid",']
+    assert '"vaf": 1.0e-5,' in output_path.read_text(encoding='utf-8')
+
+    # pipes and functions replace the string they select in the file
+    update_json_file(output_path, "results[?name=='MET'].value | [0]", "Not Detected")
+    assert get_json_file(output_path)["results"][0]["value"] == "Not Detected"
+    assert '"vaf": 1.0e-5,' in output_path.read_text(encoding='utf-8')
+
+
+def test_NEW_update_json_file_batch_negative():
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    test_json_path = path_to_folder / "unit_test_data/test_json.json"
+    reset_json_file(test_json_path)
+
+    updates = {"test": "updated", "nonexistent_key": "updated"}
+    with pytest.raises(ValueError):
+        update_json_file_batch(test_json_path, updates)
+    assert get_json_file(test_json_path) == default_test_json
+
+
+def test_NEW_stream_json_values():
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    test_manifest_path = path_to_folder / "unit_test_data/test_manifest.json"
+    expressions = ["meta.flowcell", "elements[?file_name=='test_json.json'].md5", "elements[0].file_name", "meta.nonexistent_key"]
+    values = stream_json_values(test_manifest_path, expressions, chunk_size=16)
+
+    json_object = get_json_file(test_manifest_path)
+    for expression in expressions:
+        assert values[expression] == get_json_value(expression, json_object)
+
+
+def test_NEW_stream_json_values_chunk_boundary(tmp_path):
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    json_text = '{"a": 0.987654, "b": [1e+21, -12345, true], "c": 2}'
+    json_path = tmp_path / "numbers.json"
+    json_path.write_text(json_text)
+    expressions = ["a", "b", "c"]
+    for chunk_size in range(1, len(json_text) + 1): #every split point, including "0." | "987654"
+        values = stream_json_values(json_path, expressions, chunk_size=chunk_size, verbose=False)
+        assert values == {"a": 0.987654, "b": [1e+21, -12345, True], "c": 2}, chunk_size
+
+
+def test_NEW_stream_json_values_negative():
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    test_manifest_path = path_to_folder / "unit_test_data/test_manifest.json"
+    with pytest.raises(ValueError):
+        stream_json_values(test_manifest_path, ["length(elements)"])
+
+    with pytest.raises(Exception):
+        stream_json_values("/nonexistent_path", ["meta.flowcell"])
+
+
+def test_NEW_verify_json_values():
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    test_manifest_path = path_to_folder / "unit_test_data/test_manifest.json"
+    expected_values = {
+        "meta.flowcell": "12345_12345_12345_ABCDEFGHIJK",
+        "meta.bip_version": "1.2.3",
+        "elements[0].file_name": "test_json.json"
+    }
+    assert verify_json_values(test_manifest_path, expected_values) == {}
+    assert verify_json_values(get_json_file(test_manifest_path), expected_values) == {}
+
+
+# Expecting this to Fail
+@pytest.mark.xfail(strict=True)
+def test_NEW_verify_json_values_negative():
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) This unit test results with xFail
+            ER: This unit test results with xFail
+            Notes: This unit test is expected to result with a failure as pytest_check will \
+            allow the test to continue it's logic but result the test case itself in a failure. \
+            We cannot do a pytest.raises since the failure will not be raised due to pytest_check logic.
+
+    Projects: BI Internal SW Tools
+    """
+    json_object = {"meta": {"flowcell": "A"}, "results": [{"name": "MET", "value": "Detected"}]}
+    expected_values = {
+        "meta.flowcell": "B",
+        "results[0].value": "Not Detected",
+        "results[0].name": "MET"
+    }
+    verify_json_values(json_object, expected_values)
+
+
+def test_NEW_verify_json_values_mismatches(monkeypatch):
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    reported = []
+    monkeypatch.setattr(check_helper, "no_differences", lambda differences, description='': reported.append(differences))
+    json_object = {"meta": {"flowcell": "A"}, "results": [{"name": "MET", "value": "Detected"}]}
+    expected_values = {
+        "meta.flowcell": "B",
+        "results[0].value": "Not Detected",
+        "results[0].name": "MET"
+    }
+    mismatches = verify_json_values(json_object, expected_values)
+    assert mismatches == {"meta.flowcell": ("A", "B"), "results[0].value": ("Detected", "Not Detected")}
+    assert len(reported) == 1 and reported[0]
+
+    # a bool that became an int, or the other way round, is a mismatch
+    json_object = {"reportable": 1, "calls": [True, 0], "count": 1.0}
+    mismatches = verify_json_values(json_object, {"reportable": True, "calls": [1, False], "count": 1})
+    assert mismatches == {"reportable": (1, True), "calls": ([True, 0], [1, False])}
+
+
+def test_NEW_index_by():
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    json_object = {"results": [{"name": "MET", "value": 1}, {"name": "EGFR", "value": 2}, {"name": "MET", "value": 3}, "text"]}
+    index = index_by(json_object, "results", "name")
+    assert index.get("MET") == get_json_value("results[?name=='MET']", json_object)
+    assert "EGFR" in index
+    assert "KRAS" not in index
+    assert index_by(json_object, "results[0]", "name") is None
+
+
+def test_NEW_lookup():
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    json_object = {"results": [{"name": "MET", "value": 1}, {"name": True, "value": 2}, {"name": 1, "value": 3}, {"name": 1.0, "value": 4}]}
+    assert lookup(json_object, "results", "name", "MET", "value") == [1]
+    assert lookup(json_object, "results", "name", True, "value") == get_json_value("results[?name==`true`].value", json_object)
+    assert lookup(json_object, "results", "name", 1, "value") == get_json_value("results[?name==`1`].value", json_object)
+    assert lookup(json_object, "results", "name", "KRAS") == []
+    assert lookup(json_object, "missing", "name", "MET") is None
+
+
+def test_NEW_diff_json():
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    actual = {"meta": {"run_date": "today", "flowcell": "A"}, "results": [{"name": "MET", "value": 1.0004}, {"name": "EGFR", "value": True}, {"name": "ESR1"}]}
+    expected = {"meta": {"run_date": "yesterday", "flowcell": "B"}, "results": [{"name": "EGFR", "value": 1}, {"name": "MET", "value": 1.0}, {"name": "KRAS"}]}
+    diff = diff_json(actual, expected, ignore_paths=["meta.run_date"], tolerances={"results[*].value": 0.001}, array_keys={"results": "name"})
+    assert diff == {
+        "added": {"results[?name=='ESR1']": {"name": "ESR1"}},
+        "removed": {"results[?name=='KRAS']": {"name": "KRAS"}},
+        "changed": {"meta.flowcell": ("A", "B"), "results[?name=='EGFR'].value": (True, 1)}
+    }
+    assert diff_json(actual, actual) == {"added": {}, "removed": {}, "changed": {}}
+    assert diff_json([1, 2], [1, 2, 3])["removed"] == {"[2]": 3}
+
+
+# Expecting this to Fail
+@pytest.mark.xfail(strict=True)
+def test_NEW_verify_json_matches_negative():
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) This unit test results with xFail
+            ER: This unit test results with xFail
+            Notes: This unit test is expected to result with a failure as pytest_check will \
+            allow the test to continue it's logic but result the test case itself in a failure. \
+            We cannot do a pytest.raises since the failure will not be raised due to pytest_check logic.
+
+    Projects: BI Internal SW Tools
+    """
+    test_manifest_path = path_to_folder / "unit_test_data/test_manifest.json"
+    expected_json = get_json_file(test_manifest_path, copy=True)
+    expected_json["meta"]["flowcell"] = "B"
+    verify_json_matches(test_manifest_path, expected_json)
+
+
+def test_NEW_verify_json_matches_differences(monkeypatch):
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    reported = []
+    monkeypatch.setattr(check_helper, "no_differences", lambda differences, description='': reported.append(differences))
+    test_manifest_path = path_to_folder / "unit_test_data/test_manifest.json"
+    expected_json = get_json_file(test_manifest_path, copy=True)
+    expected_json["meta"]["flowcell"] = "B"
+    diff = verify_json_matches(test_manifest_path, expected_json)
+    assert list(diff["changed"]) == ["meta.flowcell"]
+    assert not diff["added"] and not diff["removed"]
+    assert len(reported) == 1 and reported[0]
@@ -0,0 +1,73 @@
+import hashlib
+import json
+import logging
+from libraries.helper.logging_helper import LogPayload, lazy_json, lazy_repr
+
+
+class _RenderCounter:
+    renders = 0
+
+    def __repr__(self):
+        _RenderCounter.renders += 1
+        return "_RenderCounter()"
+
+
+def test_NEW_log_payload_lazy():
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    logger = logging.getLogger("test_NEW_log_payload_lazy")
+    logger.setLevel(logging.WARNING)
+    logger.info("payload: %s", lazy_repr(_RenderCounter()))
+    assert _RenderCounter.renders == 0
+
+    payload = lazy_repr(_RenderCounter())
+    assert str(payload) == "_RenderCounter()"
+    assert str(payload) == "_RenderCounter()"
+    assert _RenderCounter.renders == 1
+
+
+def test_NEW_log_payload_truncated():
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    json_obj = {"results": ["value"] * 1000}
+    rendered = str(lazy_json(json_obj, max_chars=50))
+    assert rendered.startswith('{\n  "results": [')
+    assert "more chars omitted, md5" in rendered
+    assert len(rendered) < 150
+
+    assert str(LogPayload("short", max_chars=50)) == "short"
+
+    # rendered in chunks, the same text and md5 as rendering the whole payload
+    full_text = json.dumps(json_obj, indent=2)
+    expected = '{}... [{} more chars omitted, md5 {}]'.format(full_text[:50], len(full_text) - 50,
+                                                             hashlib.md5(full_text[50:].encode()).hexdigest())
+    assert rendered == expected
+    nested = ({"a": [1, (2,), "x" * 100]}, None, 1.5)
+    assert str(lazy_repr(nested, max_chars=1000)) == repr(nested)
+    assert str(LogPayload([nested], max_chars=1000)) == str([nested])
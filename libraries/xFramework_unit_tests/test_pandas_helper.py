@@ -1,7 +1,11 @@
 import libraries.helper as helper
 from pathlib import Path
 import pandas
+import numpy
 import pytest
+import gzip
+import os
+import stat
 
 
 def test_gid_204914_return_as_dataframe_tsv():
@@ -193,3 +197,532 @@ def test_gid_204921_update_row_entry_in_tsv_file_success():
     replacement_row = {'gene': 'CSRM1'}
     helper.pandas_helper.update_row_entry_in_tsv_file(tsv_path, target_row, replacement_row)
 
+
+
+def test_NEW_return_as_dataframe_cache():
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    tsv_path = Path(__file__).parent / "unit_test_data/pandas_data.tsv"
+    os.utime(tsv_path, ns=(10**9, 10**9)) #modified long ago so the parsed file is cached
+    helper.pandas_helper.clear_dataframe_cache()
+    first = helper.pandas_helper.return_as_dataframe(tsv_path)
+    first.loc[0, 'gene'] = 'edited_gene'
+    second = helper.pandas_helper.return_as_dataframe(tsv_path)
+    assert second.loc[0, 'gene'] != 'edited_gene'
+    stats = helper.pandas_helper.get_dataframe_cache_stats()
+    assert stats['misses'] == 1 and stats['hits'] == 1 and stats['entries'] == 1
+
+    target_row = {'gene': 'CSRM1'}
+    helper.pandas_helper.update_row_entry_in_tsv_file(tsv_path, target_row, {'gene': 'replaced_gene'})
+    assert helper.pandas_helper.get_dataframe_cache_stats()['invalidations'] == 1
+    df = helper.pandas_helper.return_as_dataframe(tsv_path)
+    assert helper.pandas_helper.check_entry_in_dataframe(df, {'gene': 'replaced_gene'}) == True
+    helper.pandas_helper.update_row_entry_in_tsv_file(tsv_path, {'gene': 'replaced_gene'}, target_row)
+
+
+def test_NEW_return_as_dataframe_copy(tmp_path):
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    tsv_path = tmp_path / "snv_call.hdr.tsv"
+    tsv_path.write_text("gene\tcall\tvaf\nKRAS\t0\t0.5\nALK\t1\t0.1\n")
+    os.utime(tsv_path, ns=(10**9, 10**9)) #modified long ago so the parsed file is cached
+    expected = helper.pandas_helper.return_as_dataframe(tsv_path)
+    for compact in (False, True):
+        for copy in (True, False):
+            dataframe = helper.pandas_helper.return_as_dataframe(tsv_path, copy=copy, compact=compact)
+            dataframe.loc[0, 'gene'] = 'BRAF'
+            dataframe.loc[0, 'vaf'] = 0.9
+            assert helper.pandas_helper.check_entries(dataframe, [{'gene': 'BRAF'}]) == [True]
+    cached = helper.pandas_helper.return_as_dataframe(tsv_path)
+    assert cached.equals(expected)
+    assert helper.pandas_helper.check_entries(cached, [{'gene': 'KRAS'}, {'gene': 'BRAF'}]) == [True, False]
+
+
+def test_NEW_return_as_dataframe_cache_racy(tmp_path):
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    tsv_path = tmp_path / "cnv_call.hdr.tsv"
+    tsv_path.write_text("gene\tcall\nKRAS\t0\n")
+    file_stat = tsv_path.stat()
+    assert list(helper.pandas_helper.return_as_dataframe(tsv_path)['call']) == [0]
+
+    #a same size rewrite in the same mtime tick keeps inode, mtime and size
+    with open(tsv_path, 'r+') as outfile:
+        outfile.write("gene\tcall\nKRAS\t1\n")
+    os.utime(tsv_path, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns))
+    assert list(helper.pandas_helper.return_as_dataframe(tsv_path)['call']) == [1]
+
+
+def test_NEW_find_rows():
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    tsv_path = Path(__file__).parent / "unit_test_data/pandas_data.tsv"
+    df = helper.pandas_helper.return_as_dataframe(tsv_path)
+    key_value = {'gene': 'ALK', 'mut_aa': 'I1461V', 'call': 0}
+    rows = helper.pandas_helper.find_rows(df, key_value)
+    assert list(rows) == list(numpy.flatnonzero(helper.pandas_helper.get_entry_in_dataframe(df, key_value)))
+    assert helper.pandas_helper.get_entry_in_dataframe(df, key_value, indexed=True).equals(helper.pandas_helper.get_entry_in_dataframe(df, key_value))
+    assert helper.pandas_helper.check_entry_in_dataframe(df, {'gene': 'ALK', 'call': 1}, indexed=True) == False
+
+
+def test_NEW_check_entries():
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    tsv_path = Path(__file__).parent / "unit_test_data/pandas_data.tsv"
+    df = helper.pandas_helper.return_as_dataframe(tsv_path)
+    entries = [{'gene': 'ALK', 'mut_aa': 'I1461V'}, {'gene': 'ALK', 'mut_aa': 'NOT_A_MUTATION'}, {'gene': 'APC'}]
+    assert helper.pandas_helper.check_entries(df, entries) == [True, False, True]
+
+    #the same answers as one find_rows() per entry, in any order of keys and values
+    entries = [{'gene': gene, 'position': position} for gene, position in zip(df['gene'], df['position'])]
+    entries += [{'position': 0, 'gene': 'ALK'}, {'gene': ['ALK']}, {'mut_aa': float('nan')}, {'gene': 'ALK', 'position': float(df['position'][0])}]
+    assert helper.pandas_helper.check_entries(df, entries) == [len(helper.pandas_helper.find_rows(df, entry)) > 0 for entry in entries]
+    assert helper.pandas_helper.check_entries(df, entries)[-4:] == [False, False, False, True]
+
+
+def test_NEW_edit_tsv_file():
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    tsv_path = Path(__file__).parent / "unit_test_data/pandas_data.tsv"
+    original = tsv_path.read_text()
+    row_count = len(helper.pandas_helper.return_as_dataframe(tsv_path))
+    try:
+        with helper.pandas_helper.edit_tsv_file(tsv_path) as editor:
+            editor.update({'gene': 'CSRM1'}, {'gene': 'replaced_gene'})
+            editor.update({'gene': 'ALK', 'mut_aa': 'I1461V'}, {'call': 1})
+            editor.insert({'gene': 'inserted_gene', 'call': 1})
+            editor.delete({'gene': 'APC', 'mut_aa': 'Y486Y'})
+        assert [change['action'] for change in editor.changes] == ['update', 'update', 'delete', 'insert']
+        assert editor.changes[0]['before']['gene'] == 'CSRM1' and editor.changes[0]['after']['gene'] == 'replaced_gene'
+
+        df = helper.pandas_helper.return_as_dataframe(tsv_path)
+        assert len(df) == row_count
+        assert helper.pandas_helper.check_entries(df, [{'gene': 'replaced_gene'}, {'gene': 'inserted_gene'}, {'gene': 'APC', 'mut_aa': 'Y486Y'}]) == [True, True, False]
+    finally:
+        tsv_path.write_text(original)
+
+
+def test_NEW_edit_tsv_file_negative():
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    tsv_path = Path(__file__).parent / "unit_test_data/pandas_data.tsv"
+    original = tsv_path.read_text()
+    editor = helper.pandas_helper.edit_tsv_file(tsv_path)
+    editor.update({'gene': 'CSRM1'}, {'gene': 'replaced_gene'})
+    editor.update({'gene': 'ALK'}, {'call': 1}) #matches several rows
+    with pytest.raises(AssertionError):
+        editor.commit()
+    assert tsv_path.read_text() == original
+
+
+def test_NEW_scan_tsv_file():
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    tsv_path = Path(__file__).parent / "unit_test_data/pandas_data.tsv"
+    key_value = {'gene': 'ALK', 'call': 0}
+    df = helper.pandas_helper.return_as_dataframe(tsv_path)
+    expected = df[helper.pandas_helper.get_entry_in_dataframe(df, key_value)][['mut_aa', 'position']]
+    rows = helper.pandas_helper.scan_tsv_file(tsv_path, key_value, columns=['mut_aa', 'position'], chunk_rows=2)
+    assert rows.equals(expected)
+    assert len(helper.pandas_helper.scan_tsv_file(tsv_path, key_value, chunk_rows=2, first_only=True)) <= 2
+    assert helper.pandas_helper.check_entry_in_file(tsv_path, {'gene': 'APC', 'mut_aa': 'Y486Y'}, chunk_rows=2) == True
+    assert helper.pandas_helper.check_entry_in_file(tsv_path, {'gene': 'NOT_A_GENE'}, chunk_rows=2) == False
+
+
+def test_NEW_return_as_dataframe_sidecar(tmp_path):
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    tsv_path = tmp_path / "pandas_data.tsv"
+    tsv_path.write_text((Path(__file__).parent / "unit_test_data/pandas_data.tsv").read_text())
+    sidecar_dir = tmp_path / "sidecars"
+    helper.pandas_helper.set_sidecar_cache_dir(sidecar_dir)
+    try:
+        helper.pandas_helper.clear_dataframe_cache()
+        text_df = helper.pandas_helper.return_as_dataframe(tsv_path)
+        helper.pandas_helper.clear_dataframe_cache()
+        sidecar_df = helper.pandas_helper.return_as_dataframe(tsv_path)
+        assert sidecar_df.equals(text_df)
+        assert helper.pandas_helper.get_dataframe_cache_stats()['sidecar_hits'] == 1
+
+        #sidecars are pickles, only a private directory and private files are loaded
+        assert stat.S_IMODE(sidecar_dir.stat().st_mode) == 0o700
+        for sidecar in sidecar_dir.iterdir():
+            sidecar.chmod(0o666)
+        helper.pandas_helper.clear_dataframe_cache()
+        assert helper.pandas_helper.return_as_dataframe(tsv_path).equals(text_df)
+        stats = helper.pandas_helper.get_dataframe_cache_stats()
+        assert stats['sidecar_hits'] == 0 and stats['sidecar_writes'] == 1
+        assert all(stat.S_IMODE(sidecar.stat().st_mode) == 0o600 for sidecar in sidecar_dir.iterdir())
+
+        #a corrupt sidecar is rebuilt
+        for sidecar in sidecar_dir.iterdir():
+            sidecar.write_bytes(b'not a pickle')
+        helper.pandas_helper.clear_dataframe_cache()
+        assert helper.pandas_helper.return_as_dataframe(tsv_path).equals(text_df)
+        assert helper.pandas_helper.get_dataframe_cache_stats()['sidecar_writes'] == 1
+
+        #a changed file gets a new sidecar
+        helper.pandas_helper.update_row_entry_in_tsv_file(tsv_path, {'gene': 'CSRM1'}, {'gene': 'replaced_gene'})
+        helper.pandas_helper.clear_dataframe_cache()
+        df = helper.pandas_helper.return_as_dataframe(tsv_path)
+        assert helper.pandas_helper.check_entry_in_dataframe(df, {'gene': 'replaced_gene'}) == True
+        assert helper.pandas_helper.get_dataframe_cache_stats()['sidecar_writes'] == 1
+        assert len(list(sidecar_dir.iterdir())) == 2
+
+        #a same size write that keeps inode and mtime, as an in place edit within one mtime tick does
+        def rewrite_keeping_stat(old, new):
+            file_stat = tsv_path.stat()
+            tsv_path.write_text(tsv_path.read_text().replace(old, new))
+            os.utime(tsv_path, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns))
+        rewrite_keeping_stat('replaced_gene', 'racy___gene__')
+        helper.pandas_helper.clear_dataframe_cache()
+        df = helper.pandas_helper.return_as_dataframe(tsv_path)
+        assert helper.pandas_helper.check_entry_in_dataframe(df, {'gene': 'racy___gene__'}) == True
+
+        #an old mtime is trusted until the file is invalidated
+        file_stat = tsv_path.stat()
+        os.utime(tsv_path, ns=(file_stat.st_atime_ns, 10**9))
+        helper.pandas_helper.clear_dataframe_cache()
+        helper.pandas_helper.return_as_dataframe(tsv_path)
+        rewrite_keeping_stat('racy___gene__', 'invalidated__')
+        helper.pandas_helper.invalidate_dataframe_cache(tsv_path)
+        df = helper.pandas_helper.return_as_dataframe(tsv_path)
+        assert helper.pandas_helper.check_entry_in_dataframe(df, {'gene': 'invalidated__'}) == True
+    finally:
+        helper.pandas_helper.set_sidecar_cache_dir(None)
+
+
+def test_NEW_return_as_dataframe_compact():
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    tsv_path = Path(__file__).parent / "unit_test_data/pandas_data.tsv"
+    df = helper.pandas_helper.return_as_dataframe(tsv_path)
+    compact_df = helper.pandas_helper.return_as_dataframe(tsv_path, compact=True)
+    assert str(compact_df['run_sample_id'].dtype) == 'category'
+    assert compact_df['call'].dtype.itemsize < df['call'].dtype.itemsize
+
+    for key_value in ({'gene': 'ALK', 'call': 0}, {'gene': 'ALK', 'call': ''}, {'gene': '', 'call': 1}, {'mut_aa': 'I1461V'}):
+        expected = helper.pandas_helper.get_entry_in_dataframe(df, key_value)
+        assert (helper.pandas_helper.get_entry_in_dataframe(compact_df, key_value) == expected).all()
+        assert (helper.pandas_helper.get_entry_in_dataframe(compact_df, key_value, indexed=True) == expected).all()
+
+    report = helper.pandas_helper.get_compact_report()[str(tsv_path.resolve())]
+    assert report['bytes_after'] < report['bytes_before']
+
+
+def test_NEW_edit_tsv_file_in_place(tmp_path):
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    original = (Path(__file__).parent / "unit_test_data/pandas_data.tsv").read_bytes()
+    tsv_path = tmp_path / "pandas_data.tsv"
+    tsv_path.write_bytes(original)
+
+    with helper.pandas_helper.edit_tsv_file(tsv_path) as editor:
+        editor.update({'gene': 'CSRM1'}, {'gene': 'KRAS', 'call': 1})
+        editor.delete({'gene': 'APC', 'mut_aa': 'Y486Y'})
+    changed_lines = [line for line in tsv_path.read_bytes().splitlines() if line not in original.splitlines()]
+    assert len(changed_lines) == 1 and b'\tKRAS\t' in changed_lines[0]
+    assert len(tsv_path.read_bytes().splitlines()) == len(original.splitlines()) - 1
+
+    #changing a row back gives back the exact same file
+    tsv_path.write_bytes(original)
+    helper.pandas_helper.update_row_entry_in_tsv_file(tsv_path, {'gene': 'CSRM1'}, {'gene': 'KRAS'})
+    helper.pandas_helper.update_row_entry_in_tsv_file(tsv_path, {'gene': 'KRAS'}, {'gene': 'CSRM1'})
+    assert tsv_path.read_bytes() == original
+
+    #a same size edit replaces the file too, a reader that opened it before sees the old bytes
+    with open(tsv_path, 'rb') as reader:
+        helper.pandas_helper.update_row_entry_in_tsv_file(tsv_path, {'gene': 'CSRM1'}, {'gene': 'CSRM2'})
+        assert reader.read() == original
+    assert len(tsv_path.read_bytes()) == len(original) and b'\tCSRM2\t' in tsv_path.read_bytes()
+
+
+def test_NEW_return_as_dataframe_compressed(tmp_path):
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    tsv_path = Path(__file__).parent / "unit_test_data/pandas_data.tsv"
+    lines = tsv_path.read_bytes().splitlines(keepends=True)
+    gzip_path = tmp_path / "pandas_data.tsv.gz"
+    gzip_path.write_bytes(gzip.compress(b''.join(lines)))
+    bgzip_path = tmp_path / "pandas_data.tsv.bgz"
+    bgzip_path.write_bytes(gzip.compress(b''.join(lines[:5])) + gzip.compress(b''.join(lines[5:]))) #bgzip writes many gzip members
+
+    df = helper.pandas_helper.return_as_dataframe(tsv_path)
+    assert helper.pandas_helper.return_as_dataframe(gzip_path).equals(df)
+    assert helper.pandas_helper.return_as_dataframe(bgzip_path).equals(df)
+    key_value = {'gene': 'ALK', 'call': 0}
+    assert helper.pandas_helper.scan_tsv_file(bgzip_path, key_value, chunk_rows=2).equals(helper.pandas_helper.scan_tsv_file(tsv_path, key_value))
+    with pytest.raises(ValueError):
+        helper.pandas_helper.update_row_entry_in_tsv_file(gzip_path, {'gene': 'CSRM1'}, {'gene': 'replaced_gene'})
+
+
+def test_NEW_return_as_dataframe_zstd(tmp_path):
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    zstandard = pytest.importorskip("zstandard")
+    tsv_path = Path(__file__).parent / "unit_test_data/pandas_data.tsv"
+    zstd_path = tmp_path / "pandas_data.tsv.zst"
+    zstd_path.write_bytes(zstandard.ZstdCompressor().compress(tsv_path.read_bytes()))
+
+    df = helper.pandas_helper.return_as_dataframe(tsv_path)
+    assert helper.pandas_helper.return_as_dataframe(zstd_path).equals(df)
+    assert helper.pandas_helper.read_columns(zstd_path, ['gene', 'call']).equals(df[['gene', 'call']])
+    key_value = {'gene': 'ALK', 'call': 0}
+    assert helper.pandas_helper.scan_tsv_file(zstd_path, key_value, chunk_rows=2).equals(helper.pandas_helper.scan_tsv_file(tsv_path, key_value))
+
+
+def test_NEW_diff_tables():
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    tsv_path = Path(__file__).parent / "unit_test_data/pandas_data.tsv"
+    expected = helper.pandas_helper.return_as_dataframe(tsv_path)
+    actual = expected.sample(frac=1, random_state=0) #row order doesn't matter
+    actual.loc[actual['mut_aa'] == 'I1461V', 'percentage'] += 0.001
+    actual.loc[actual['mut_aa'] == 'I1461V', 'call'] = 1
+    actual = actual[actual['mut_aa'] != 'Y486Y']
+    key_columns = ['gene', 'position']
+
+    diff = helper.pandas_helper.diff_tables(actual, expected, key_columns, tolerances={'percentage': 0.01})
+    assert diff['missing'][key_columns].to_dict('records') == [{'gene': 'APC', 'position': 112162854}]
+    assert len(diff['extra']) == 0
+    assert diff['changed'][['gene', 'column', 'actual', 'expected']].to_dict('records') == [{'gene': 'ALK', 'column': 'call', 'actual': 1, 'expected': 0}]
+    assert len(helper.pandas_helper.diff_tables(actual, expected, key_columns)['changed']) == 2
+    assert len(helper.pandas_helper.diff_tables(tsv_path, tsv_path, key_columns)['changed']) == 0
+
+
+# Expecting this to Fail
+@pytest.mark.xfail(strict=True)
+def test_NEW_verify_tables_match_negative():
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) This unit test results with xFail
+            ER: This unit test results with xFail
+            Notes: This unit test is expected to result with a failure as pytest_check will \
+            allow the test to continue it's logic but result the test case itself in a failure. \
+            We cannot do a pytest.raises since the failure will not be raised due to pytest_check logic.
+
+    Projects: BI Internal SW Tools
+    """
+    tsv_path = Path(__file__).parent / "unit_test_data/pandas_data.tsv"
+    expected = helper.pandas_helper.return_as_dataframe(tsv_path)
+    actual = expected.copy()
+    actual.loc[0, 'call'] = 1
+    helper.pandas_helper.verify_tables_match(actual, expected, ['gene', 'position'])
+
+
+def test_NEW_verify_tables_match_differences(monkeypatch):
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    reported = []
+    monkeypatch.setattr(helper.check_helper, "no_differences", lambda differences, description='': reported.append(differences))
+    tsv_path = Path(__file__).parent / "unit_test_data/pandas_data.tsv"
+    expected = helper.pandas_helper.return_as_dataframe(tsv_path)
+    actual = expected.copy()
+    actual.loc[0, 'call'] = 1
+    diff = helper.pandas_helper.verify_tables_match(actual, expected, ['gene', 'position'])
+    assert len(diff['changed']) == 1
+    assert list(diff['changed']['column']) == ['call']
+    assert diff['missing'].empty and diff['extra'].empty
+    assert len(reported) == 1 and reported[0]
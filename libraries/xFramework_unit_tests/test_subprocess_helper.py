@@ -1,4 +1,6 @@
-from libraries.helper.subprocess_helper import run
+from libraries.helper.subprocess_helper import run, run_many, run_streaming, ShellSession, set_shell_session
+import pytest
+import time
 
 
 def test_gid_204938_run():
@@ -39,3 +41,153 @@ def test_gid_204939_run_negative():
     """
     run_response = run("cd nonexistent_folder")
     assert isinstance(run_response, int) and run_response != 0
+
+
+@pytest.mark.parametrize("backend", ['thread', 'asyncio'])
+def test_NEW_run_many(backend, tmp_path):
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    #each command waits up to 10s for the other three to start, so only commands that overlap all see 4 files
+    wait = "for i in $(seq 100); do [ $(ls {0} | wc -l) -ge 4 ] && break; sleep 0.1; done".format(tmp_path)
+    commands = ["touch {}/{}; {}; echo {} $(ls {} | wc -l)".format(tmp_path, number, wait, number, tmp_path)
+                for number in range(4)] + ["echo oops >&2; exit 3"]
+    results = run_many(commands, max_workers=4, backend=backend)
+    assert [result.args for result in results] == commands
+    assert [result.stdout.split() for result in results[:4]] == [[str(number), "4"] for number in range(4)]
+    assert results[4].returncode == 3 and results[4].stderr == "oops\n"
+
+
+@pytest.mark.parametrize("backend", ['thread', 'asyncio'])
+def test_NEW_run_many_timeout(backend):
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    start = time.perf_counter()
+    results = run_many(["sleep 60 | cat; echo late", "echo fast"], timeout=[0.3, None], backend=backend)
+    assert time.perf_counter() - start < 30 #sleep and cat are killed with the shell, else their pipe stays open for 60s
+    assert results[0].returncode == -9 and "timed out" in results[0].stderr and results[0].stdout == ""
+    assert results[1].returncode == 0 and results[1].stdout == "fast\n"
+
+
+def test_NEW_run_streaming(tmp_path, caplog):
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    tee_path = tmp_path / "output.log"
+    with caplog.at_level("INFO"):
+        run_response = run_streaming("seq 1 5000; echo warning >&2", tail_lines=3, tee=tee_path)
+    assert run_response == "4998\n4999\n5000"
+    assert "stdout: 2500" in caplog.text and "stderr: warning" in caplog.text
+    assert tee_path.read_text().count("\n") == 5001
+
+    start = time.perf_counter()
+    run_response = run_streaming("echo started; sleep 60 | cat", timeout=0.3)
+    assert run_response == -9 and time.perf_counter() - start < 30 #the readers would wait 60s for cat's pipe to close
+    assert run_streaming("exit 2") == 2
+
+
+def test_NEW_shell_session():
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    session = ShellSession()
+    try:
+        result = session.run("printf 'no newline'; echo oops >&2; exit 3")
+        assert (result.returncode, result.stdout, result.stderr) == (3, "no newline", "oops\n")
+        assert session.run("cd /; pwd").stdout == "/\n"
+        assert session.run("pwd").stdout != "/\n" #each command runs in its own subshell
+        assert session.run("echo 'unbalanced").returncode != 0
+
+        pid = session.process.pid
+        assert session.run("sleep 5 | cat", timeout=0.3).returncode == -9
+        assert session.run("echo restarted").stdout == "restarted\n"
+        assert session.process.pid != pid
+    finally:
+        session.close()
+
+    set_shell_session(True)
+    try:
+        assert run("echo '\ntesting\nhello world' | grep hello") == "hello world"
+        assert run("cd nonexistent_folder") == 2
+    finally:
+        set_shell_session(False)
+
+
+def test_NEW_shell_session_follows_cwd_and_env(tmp_path, monkeypatch):
+    """
+    Description:
+        Verify this unit test
+
+    Prerequisites: NA
+
+    Test Data: NA
+
+    Steps:
+        1) Run this unit test
+            ER: This unit test passes
+            Notes: NA
+
+    Projects: BI Internal SW Tools
+    """
+    session = ShellSession()
+    try:
+        assert session.run("echo started").returncode == 0
+        pid = session.process.pid
+        monkeypatch.chdir(tmp_path)
+        assert session.run("pwd").stdout == "{}\n".format(tmp_path.resolve())
+        assert session.process.pid == pid
+        monkeypatch.setenv("XFRAMEWORK_SESSION_TEST", "first")
+        assert session.run("echo $XFRAMEWORK_SESSION_TEST").stdout == "first\n"
+        monkeypatch.delenv("XFRAMEWORK_SESSION_TEST")
+        assert session.run("echo ${XFRAMEWORK_SESSION_TEST:-unset}").stdout == "unset\n"
+    finally:
+        session.close()
@@ -0,0 +1,60 @@
+"""
+json_helper.stream_json_values() against get_json_file() + get_json_value() on a synthetic output.json.
+Each measurement runs in its own process so peak memory (max RSS) is reported per mode.
+
+Run from the repository root, optionally with the document size in MB (default 500):
+    python -m scripts.benchmarks.bench_json_stream 500
+"""
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import libraries.helper as helper
+
+FIRST_FIELD = "meta.flowcell"
+LAST_MATCH = "results[?name=='gene last'].value"
+
+def write_synthetic_json(path, size_mb):
+    result = {"name": "gene 0", "value": "Not Detected", "call": 0, "variants": [{"mut_aa": "G12A", "percentage": 0.25}] * 4}
+    line = json.dumps(result)
+    count = size_mb * 1024 * 1024 // (len(line) + 2)
+    with open(path, 'w') as outfile:
+        outfile.write('{"meta": {"flowcell": "200817_NB551559_0156_AHN5WHBGXF"}, "results": [\n')
+        for i in range(count):
+            outfile.write(line.replace('gene 0', 'gene {}'.format(i)) + ',\n')
+        outfile.write(line.replace('gene 0', 'gene last') + ']}')
+
+def full_load(path, expression):
+    json_obj = helper.json_helper.get_json_file(path, verbose=False, cache=False)
+    return helper.json_helper.get_json_value(expression, json_obj, verbose=False)
+
+def stream(path, expression):
+    return helper.json_helper.stream_json_values(path, [expression], verbose=False)[expression]
+
+def measure(function, path, expression):
+    start = time.perf_counter()
+    function(path, expression)
+    seconds = time.perf_counter() - start
+    return seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    file_descriptor, path = tempfile.mkstemp(suffix='.json')
+    os.close(file_descriptor)
+    try:
+        write_synthetic_json(path, size_mb)
+        print("{} MB synthetic json".format(os.path.getsize(path) // (1024 * 1024)))
+        print("{:<12} {:<38} {:>9} {:>13}".format("mode", "expression", "seconds", "max RSS (MB)"))
+        for name, function in (("full load", full_load), ("streaming", stream)):
+            for expression in (FIRST_FIELD, LAST_MATCH):
+                with multiprocessing.get_context('fork').Pool(1, maxtasksperchild=1) as pool:
+                    seconds, max_rss = pool.apply(measure, (function, path, expression))
+                print("{:<12} {:<38} {:>9.2f} {:>13.0f}".format(name, expression, seconds, max_rss))
+    finally:
+        os.unlink(path)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+Per call cost of json_helper.get_json_value() logging with the logger at INFO and at WARNING.
+Compares the lazy log payloads against formatting the payload eagerly like the helpers used to.
+
+Run from the repository root:
+    python -m scripts.benchmarks.bench_log_payload
+"""
+import io
+import json
+import logging
+import timeit
+import libraries.helper as helper
+from libraries.helper.logging_helper import lazy_json
+
+RESULT_COUNT = 20000 #about 2 MB of json once indented
+CALLS = 20
+
+def synthetic_output_json():
+    return {"results": [{"name": "gene {}".format(i), "value": "Not Detected", "call": i % 3} for i in range(RESULT_COUNT)]}
+
+def eager(json_obj, query):
+    value = query.search(json_obj)
+    helper.json_helper.logger.info('Found {} using {} in {}'.format(value, query.expression, json.dumps(json_obj, indent=2)))
+
+def lazy(json_obj, query):
+    value = query.search(json_obj)
+    helper.json_helper.logger.info('Found %s using %s in %s', value, query.expression, lazy_json(json_obj))
+
+def main():
+    json_obj = synthetic_output_json()
+    query = helper.json_helper.compile_query("results[?name=='gene 7'].value")
+    logger = logging.getLogger()
+    logger.addHandler(logging.StreamHandler(io.StringIO()))
+
+    print("{:<8} {:<6} {:>12}".format("level", "mode", "ms per call"))
+    for level in (logging.INFO, logging.WARNING):
+        logger.setLevel(level)
+        for name, function in (("eager", eager), ("lazy", lazy)):
+            seconds = timeit.timeit(lambda: function(json_obj, query), number=CALLS)
+            print("{:<8} {:<6} {:>12.3f}".format(logging.getLevelName(level), name, seconds / CALLS * 1000))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""
+Cost of 1,000 short commands through subprocess_helper.run() starting a shell per call
+vs sending them to the long lived ShellSession.
+
+Run from the repository root:
+    python -m scripts.benchmarks.bench_shell_session
+    python -m scripts.benchmarks.bench_shell_session 5000   #number of commands
+"""
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+import libraries.helper as helper
+
+COMMANDS = 1000
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else COMMANDS
+    logging.getLogger().setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "file.tsv"
+        path.write_text("gene\tcall\nKRAS\t1\n")
+        workloads = (("true", "true"),
+                     ("echo", "echo hello world"),
+                     ("md5sum", "md5sum {} | cut -d ' ' -f1".format(path)))
+        print("{:<8} {:<12} {:>10} {:>12}".format("command", "backend", "seconds", "ms per call"))
+        for name, command in workloads:
+            for backend in ("fork", "session"):
+                helper.subprocess_helper.set_shell_session(backend == "session")
+                helper.subprocess_helper.run(command, verbose=False) #start the session outside the timing
+                start = time.perf_counter()
+                for _ in range(count):
+                    helper.subprocess_helper.run(command, verbose=False)
+                seconds = time.perf_counter() - start
+                print("{:<8} {:<12} {:>10.2f} {:>12.3f}".format(name, backend, seconds, seconds / count * 1000))
+        helper.subprocess_helper.set_shell_session(False)
+
+if __name__ == '__main__':
+    main()
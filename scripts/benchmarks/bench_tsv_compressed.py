@@ -0,0 +1,66 @@
+"""
+pandas_helper load time of a synthetic snv_call tsv stored plain, gzip, bgzip and zstd compressed.
+Point it at an NFS directory (e.g. under /ghds/) to see the effect of reading fewer bytes over the network.
+Each measurement runs in a fresh process with the dataframe cache off. The OS page cache is not dropped,
+so run it once to warm up or use a fresh directory for cold reads.
+
+Run from the repository root, optionally with the number of rows (default 1000000) and a directory:
+    python -m scripts.benchmarks.bench_tsv_compressed 1000000 /ghds/groups/bip_sqa/personal_spaces/$USER
+"""
+import gzip
+import importlib.util
+import multiprocessing
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+import libraries.helper as helper
+from scripts.benchmarks.bench_tsv_sidecar import write_synthetic_tsv
+
+def compressed_copies(path):
+    copies = {"plain": path}
+    copies["gzip"] = path.with_name(path.name + ".gz")
+    with open(path, 'rb') as input_file, gzip.open(copies["gzip"], 'wb', compresslevel=6) as output_file:
+        shutil.copyfileobj(input_file, output_file)
+    for name, command, suffix in (("bgzip", ["bgzip", "-c"], ".bgz"), ("zstd", ["zstd", "-q", "-c"], ".zst")):
+        if shutil.which(command[0]) is None or (name == "zstd" and importlib.util.find_spec("zstandard") is None):
+            print("skipping {}, {} is not installed".format(name, "zstandard" if shutil.which(command[0]) else command[0]))
+            continue
+        copies[name] = path.with_name(path.name + suffix)
+        with open(copies[name], 'wb') as output_file:
+            subprocess.run(command + [str(path)], stdout=output_file, check=True)
+    return copies
+
+def full_load(path):
+    return helper.pandas_helper.return_as_dataframe(path, cache=False)
+
+def column_scan(path):
+    return helper.pandas_helper.scan_tsv_file(path, {'gene': 'gene 7', 'call': 1}, columns=['mut_aa'])
+
+def measure(function, path):
+    start = time.perf_counter()
+    function(path)
+    return time.perf_counter() - start
+
+def main():
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    work_dir = Path(tempfile.mkdtemp(dir=sys.argv[2] if len(sys.argv) > 2 else None))
+    try:
+        path = work_dir / "A027954801.snv_call.hdr.tsv"
+        write_synthetic_tsv(path, row_count)
+        print("{} rows in {}".format(row_count, work_dir))
+        copies = compressed_copies(path)
+        print("{:<7} {:>9} {:>16} {:>16}".format("format", "MB", "full load (s)", "column scan (s)"))
+        for name, copy_path in copies.items():
+            seconds = []
+            for function in (full_load, column_scan):
+                with multiprocessing.get_context('fork').Pool(1, maxtasksperchild=1) as pool:
+                    seconds.append(pool.apply(measure, (function, copy_path)))
+            print("{:<7} {:>9.1f} {:>16.2f} {:>16.2f}".format(name, copy_path.stat().st_size / 2 ** 20, *seconds))
+    finally:
+        shutil.rmtree(work_dir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+pandas_helper.return_as_dataframe() parsing a synthetic snv_call tsv from text against loading its sidecar.
+Each measurement runs in a fresh process, like a new session or xdist worker, so nothing is cached in memory.
+
+Run from the repository root, optionally with the number of rows (default 1000000):
+    python -m scripts.benchmarks.bench_tsv_sidecar 1000000
+"""
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+import numpy
+import pandas
+import libraries.helper as helper
+
+def write_synthetic_tsv(path, row_count):
+    rng = numpy.random.default_rng(0)
+    pandas.DataFrame({
+        'run_sample_id': 'A027954801',
+        'gene': rng.choice(['gene {}'.format(i) for i in range(500)], row_count),
+        'chrom': rng.integers(1, 23, row_count),
+        'position': rng.integers(1, 10 ** 8, row_count),
+        'mut_aa': rng.choice(['M{}V'.format(i) for i in range(2000)], row_count),
+        'percentage': rng.random(row_count) * 100,
+        'call': rng.integers(0, 3, row_count),
+        'variant_comment': rng.choice(['ExAC common germline', 'not reportable; GH SNP common germline', ''], row_count),
+    }).to_csv(path, sep='\t', index=False)
+
+def measure(path, sidecar_dir):
+    helper.pandas_helper.set_sidecar_cache_dir(sidecar_dir)
+    start = time.perf_counter()
+    helper.pandas_helper.return_as_dataframe(path)
+    return time.perf_counter() - start, helper.pandas_helper.get_dataframe_cache_stats()
+
+def main():
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    work_dir = Path(tempfile.mkdtemp())
+    try:
+        path = work_dir / "A027954801.snv_call.hdr.tsv"
+        sidecar_dir = work_dir / "sidecars"
+        write_synthetic_tsv(path, row_count)
+        print("{} rows, {} MB tsv".format(row_count, path.stat().st_size // (1024 * 1024)))
+        print("{:<22} {:>9} {:>13} {:>14}".format("mode", "seconds", "sidecar hits", "sidecar writes"))
+        for name, directory in (("cold text load", None), ("text load + sidecar", sidecar_dir), ("warm sidecar load", sidecar_dir)):
+            with multiprocessing.get_context('fork').Pool(1, maxtasksperchild=1) as pool:
+                seconds, stats = pool.apply(measure, (path, directory))
+            print("{:<22} {:>9.2f} {:>13} {:>14}".format(name, seconds, stats['sidecar_hits'], stats['sidecar_writes']))
+    finally:
+        shutil.rmtree(work_dir)
+
+if __name__ == '__main__':
+    main()
@@ -24,6 +24,33 @@ def pytest_addoption(parser):
         default='INFO'
     )
 
+    parser.addoption(
+        "--cache-stats", 
+        action="store_true",
+        help="Print helper cache statistics at the end of the session",
+        default=False
+    )
+
+    parser.addoption(
+        "--tsv-sidecar-dir", 
+        action="store",
+        help="Directory of binary copies of parsed csv/tsv inputs, shared by sessions and xdist workers. Must be your own, it is set to 0700",
+        default=None
+    )
+
+def pytest_configure(config):
+    if config.getoption("--tsv-sidecar-dir"):
+        helper.pandas_helper.set_sidecar_cache_dir(config.getoption("--tsv-sidecar-dir"))
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    if not config.getoption("--cache-stats"):
+        return
+    terminalreporter.section("helper cache stats")
+    terminalreporter.write_line("jmespath queries: {}".format(helper.json_helper.get_query_cache_stats()))
+    terminalreporter.write_line("json files: {}".format(helper.json_helper.get_json_cache_stats()))
+    terminalreporter.write_line("csv/tsv files: {}".format(helper.pandas_helper.get_dataframe_cache_stats()))
+    terminalreporter.write_line("file digests: {}".format(framework.bip_files.get_hash_cache_stats()))
+
 @pytest.fixture(scope='session') 
 def test_version(request):
     return request.config.getoption("--test-version") 
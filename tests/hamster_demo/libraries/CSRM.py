@@ -1,6 +1,7 @@
 import logging
 import libraries.helper as helper
 import libraries.framework.bip_files as bip_files
+from libraries.framework.bip_dataset import BipDataset
 from pathlib import Path
 import numpy
 
@@ -21,6 +22,22 @@ class CSRM:
             raise NameError('Empty Test Case Directory')
         self.logger = logging.getLogger(__name__) 
         self.logger.info('Initializing CSRM class with test case directory {}'.format(test_case_directory))
+        self._dataset = None
+
+    @property
+    def dataset(self) -> BipDataset:
+        """
+        The call tsvs of the test case directory, loaded on first use and queried together.
+
+        :Usage:
+            rows = csrm.dataset.find('snv', {'gene': 'KRAS', 'call': 1}, ['mut_aa'])
+            genes = csrm.dataset.join({'snv': ['mut_aa'], 'bolts/csm/A027954801.cnv_call.hdr.tsv': ['copy_number']}, on='gene')
+        :Returns:
+            a libraries.framework.BipDataset, the same one for the life of this instance
+        """
+        if self._dataset is None:
+            self._dataset = BipDataset(self.test_case_directory)
+        return self._dataset
 
     def get_json(self, path_to_file: 'Path') -> 'json obj':
         """
@@ -48,6 +65,8 @@ class CSRM:
             'baz'
         :Returns:
             json element: this can either be a string or a list depending on the query
+        :Notes:
+            search_expression can be a str or a query from helper.json_helper.compile_query()
         """
         return helper.json_helper.get_json_value(search_expression, json_file)
 
@@ -80,8 +99,35 @@ class CSRM:
         json_file = helper.json_helper.get_json_file(self.test_case_directory / output_json)
         value = helper.json_helper.get_json_value(search_expression, json_file)
         assert value == expected_value, "{} was not found in output.json".format(value)
+
+    def verify_output_json_values(self, expected_values: dict):
+        """
+        Check many key,value pairs in output.json, parsing it once.
+        Checks are like an assert but it can continue on failure. All mismatches are reported together.
+
+        :Usage:
+            csrm.verify_output_json_values({'results[0].name': 'ESR1 Mutations', 'results[0].value': 'Detected'})
+        :Returns:
+            dict of mismatches: search expression -> (actual, expected)
+        """
+        output_json = "output.json"
+        return helper.json_helper.verify_json_values(self.test_case_directory / output_json, expected_values)
  
-    def verify_entry_in_tsv_file(self, file_name, pairs):
+    def verify_output_json_matches(self, expected_json, ignore_paths=None, tolerances=None, array_keys=None):
+        """
+        Compare output.json against an expected json in one structural diff.
+        Checks are like an assert but it can continue on failure. All differences are reported together.
+
+        :Usage:
+            csrm.verify_output_json_matches(expected_directory / "output.json", ignore_paths=['meta.run_date'], array_keys={'results': 'name'})
+        :Returns:
+            dict of 'added', 'removed' and 'changed' paths
+        """
+        output_json = "output.json"
+        return helper.json_helper.verify_json_matches(self.test_case_directory / output_json, expected_json,
+                                                      ignore_paths, tolerances, array_keys)
+
+    def verify_entry_in_tsv_file(self, file_name, pairs, streaming=False):
         """
         Assert a row entry is present in the tsv/csv. 
         Usually to check if a gene or mutation is present in the bip file
@@ -92,24 +138,58 @@ class CSRM:
             csrm.verify_entry_in_tsv_file(snv_tsv, key_value_list) 
         :Returns:
             bool: if an entry in the tsv/csv
+        :Notes:
+            streaming=True reads large call files in chunks and stops at the first match instead of loading them.
+        """
+        if streaming:
+            isFound = helper.pandas_helper.check_entry_in_file(self.test_case_directory / file_name, pairs)
+        else:
+            dataframe = helper.pandas_helper.return_as_dataframe(self.test_case_directory / file_name)
+            isFound = helper.pandas_helper.check_entry_in_dataframe(dataframe, pairs, indexed=True)
+        assert isFound == True, "{} was not found in t{}".format(pairs, file_name)
+
+    def verify_entries_in_tsv_file(self, file_name, entries):
+        """
+        Check many row entries are present in the tsv/csv. All missing entries are reported together.
+
+        :Usage:
+            snv_tsv = "A018661201.snv_call.hdr.tsv"
+            csrm.verify_entries_in_tsv_file(snv_tsv, [{'gene': 'ESR1', 'mut_aa': 'D313E', 'call': 0}, {'gene': 'ALK', 'mut_aa': 'I1461V', 'call': 0}])
+        :Returns:
+            list of bool: if each entry is in the tsv/csv
         """
         dataframe = helper.pandas_helper.return_as_dataframe(self.test_case_directory / file_name)
-        isFound = helper.pandas_helper.check_entry_in_dataframe(dataframe, pairs)
-        assert isFound == True, "{} was not found in t{}".format(pairs, file_name)
+        found = helper.pandas_helper.check_entries(dataframe, entries)
+        missing = ["{} was not found".format(entry) for entry, isFound in zip(entries, found) if not isFound]
+        helper.check_helper.no_differences(missing, file_name)
+        return found
+
+    def verify_tsv_file_matches(self, file_name, expected_file, key_columns, columns=None, tolerances=None):
+        """
+        Compare a tsv/csv against an expected table, matching rows on key columns. All differences are reported together.
+
+        :Usage:
+            snv_tsv = "A018661201.snv_call.hdr.tsv"
+            csrm.verify_tsv_file_matches(snv_tsv, expected_directory / snv_tsv, ['gene', 'position', 'mut_nt'], tolerances={'percentage': 0.01})
+        :Returns:
+            dict of 'missing', 'extra' and 'changed' rows
+        """
+        return helper.pandas_helper.verify_tables_match(self.test_case_directory / file_name, expected_file, key_columns, columns, tolerances)
 
     def return_row_entry_in_tsv_file(self, file_name, pairs):
 
         dataframe = helper.pandas_helper.return_as_dataframe(self.test_case_directory / file_name)
-        return helper.pandas_helper.get_entry_in_dataframe(dataframe, pairs)
+        return helper.pandas_helper.get_entry_in_dataframe(dataframe, pairs, indexed=True)
 
     def update_row_entry_in_tsv_file(self, target_file:'path', target_row:dict, replacement_row:dict):
-        helper.pandas_helper.update_row_entry_in_tsv_file(target_file, target_row, replacement_row)
+        changes = helper.pandas_helper.update_row_entry_in_tsv_file(target_file, target_row, replacement_row)
         
-        #verify precondition was updated
-        updated_param = replacement_row['gene']
-        bash_command = "grep {} {} | tail -n 1".format(updated_param, target_file)
-        output = helper.subprocess_helper.run(bash_command)
-        assert updated_param in output
+        #verify precondition was updated, from the file as it is on disk now
+        dataframe = helper.pandas_helper.return_as_dataframe(Path(target_file), cache=False)
+        row_number = changes[0]['row']
+        assert row_number in helper.pandas_helper.find_rows(dataframe, replacement_row), \
+            "row {} of {} not updated to {}: {}".format(row_number, target_file, replacement_row, dataframe.iloc[row_number].to_dict())
+        return changes
 
     def run(self, container):
         """
@@ -119,36 +119,26 @@ class Titanite_v1(CSRM, TitaniteConfig):
     def get_output_value(self, gene_name):
         output_file_path = self.output_json_path
         output_json = super().get_json(output_file_path)
-        jamespath_search_expression = "results[?name=='{}'].value".format(TitaniteConfig.GENE_NAME_MAPPING[gene_name])
         try:
             self.logger.info("returning json from {}".format(output_file_path))
-            actual_value = super().get_json_value(output_json, jamespath_search_expression)
+            #indexed results[?name=='...'].value
+            actual_value = helper.json_helper.lookup(output_json, 'results', 'name', TitaniteConfig.GENE_NAME_MAPPING[gene_name], 'value')
             return actual_value[0]
         except IndexError:
             return []
 
     def update_manifest_sha(self):
-        file_paths = [self.snv_path, self.cnv_path]
-
-        for path in file_paths:
-            md5 = bip_files.get_md5sum(path)
-            manifest_path = self.manifest_path
-            if "bolts" in str(path): #"bolts/csm/A027954801.cnv_call.hdr.tsv"
-                delimeter_to_get_filename = -3
-                file_name = str(path).split('/')[delimeter_to_get_filename:]
-            else:
-                delimeter_to_get_filename = -1
-                file_name = str(path).split('/')[delimeter_to_get_filename:]
-            file_name = "/".join(file_name)
-            bip_files.update_manifest_md5(manifest_path, file_name, md5, verbose=False)
+        bip_files.refresh_manifest(self.manifest_path, [self.snv_path, self.cnv_path])
 
     def update_bip_config(self, key, value):
         bip_config_path = self.bip_config_path
         helper.json_helper.update_json_file(bip_config_path, key, value, verbose=False)
 
         #verify updates were made
-        json_obj = helper.json_helper.get_json_file(manifest_path)
-        updated_value = helper.json_helper.get_json_value(jamespath_search_expression, json_obj)
+        json_obj = helper.json_helper.get_json_file(bip_config_path, verbose=False)
+        updated_value = helper.json_helper.get_json_value(key, json_obj, verbose=False)
+        if isinstance(updated_value, list): #filter expressions return a list of matches
+            updated_value = updated_value[0]
         assert updated_value == value
 
     def update_manifest_boltons(self, jamespath_search_expression, value):
@@ -158,6 +148,8 @@ class Titanite_v1(CSRM, TitaniteConfig):
         #verify updates were made
         json_obj = helper.json_helper.get_json_file(manifest_path)
         updated_value = helper.json_helper.get_json_value(jamespath_search_expression, json_obj)
+        if isinstance(updated_value, list): #filter expressions return a list of matches
+            updated_value = updated_value[0]
         assert updated_value == value
 
 
@@ -1,5 +1,7 @@
 import pytest
 import logging
+import functools
+import shlex
 from pathlib import Path
 import libraries.helper as helper
 import libraries.framework as framework
@@ -7,6 +9,7 @@ from .config import Config
 from tests.hamster_demo.libraries.titanite_bip352 import Titanite_v1
 from tests.hamster_demo.libraries.titanite_bip353 import Titanite_v2
 logger = logging.getLogger(__name__) 
+DATA_PATH = Path(__file__).parent.parent / "data"
 
 
 @pytest.fixture(scope="session")
@@ -14,9 +17,12 @@ def app_config(test_version): #Refer to top level conftest for test_version fixt
     cfg = Config(test_version)
     return cfg
 
-@pytest.fixture(scope="session")
-def Titanite(app_config):
-    return app_config.csrm_version
+@pytest.fixture(scope="function")
+def Titanite(app_config, general_dataset):
+    #the test case directory of the version, moved into this test's workspace
+    titanite = app_config.csrm_version
+    test_case_directory = general_dataset / Path(titanite.TEST_CASE_DIRECTORY).relative_to(DATA_PATH)
+    return functools.partial(titanite, test_case_directory)
 
 def verify_build_version(app_config, container):
     expected_build_version = app_config.build_version
@@ -26,9 +32,12 @@ def verify_build_version(app_config, container):
     assert expected_build_version in actual_version, "actual build {} did not match build version {}".format(actual_version, expected_build_version)
 
 @pytest.fixture(scope="session")
-def titanite_container(app_config):
+def titanite_container(app_config, tmp_path_factory):
     artifactory_url = app_config.artifactory_url
-    container = helper.docker_helper.get_new_container(artifactory_url=artifactory_url, volumes=app_config.docker_volumes)
+    #workspaces live under the worker's basetemp, mounted at the same path so --input_dir works inside the container
+    workspaces = str(tmp_path_factory.getbasetemp())
+    volumes = dict(app_config.docker_volumes, **{workspaces: {'bind': workspaces, 'mode': 'rw'}})
+    container = helper.docker_helper.get_new_container(artifactory_url=artifactory_url, volumes=volumes)
     verify_build_version(app_config, container)
     logger.info('returning container from {} with name {}'.format(artifactory_url, container.name))
     yield container
@@ -36,23 +45,26 @@ def titanite_container(app_config):
     container.stop()
     container.remove(force=True)
 
+@pytest.fixture(scope="session")
+def dataset_snapshot(tmp_path_factory):
+    #tests only write to their workspaces, so the data directory stays as git has it and no git checkout is needed.
+    #It must start that way too: every xdist worker snapshots it, none of them may reset it under the others
+    git_status = helper.subprocess_helper.run("git -C {} status --porcelain -- .".format(shlex.quote(str(DATA_PATH))), verbose=False)
+    if isinstance(git_status, str): #otherwise git's return code, the data isn't in a git checkout
+        assert not git_status, \
+            "{} differs from git, run 'git checkout -- {} && git clean -fdx -- {}' first:\n{}".format(DATA_PATH, DATA_PATH, DATA_PATH, git_status)
+    return framework.DatasetSnapshot(DATA_PATH, tmp_path_factory.mktemp("dataset_snapshot"))
+
 @pytest.fixture(scope="function")
-def general_dataset(request, save_run_data): #Refer to top level conftest for save_run_data
-    data_path = Path(__file__).parent.parent / "data"
-    bash_command = "git checkout {} ".format(data_path)
-    helper.subprocess_helper.run(bash_command)
-    bash_command = "git clean -xf {} ".format(data_path)
-    helper.subprocess_helper.run(bash_command)
+def general_dataset(request, save_run_data, dataset_snapshot, tmp_path): #Refer to top level conftest for save_run_data
+    data_path = dataset_snapshot.checkout(tmp_path / "data") #this test's own copy, safe with pytest -n
+    yield data_path
+    #hardlinked workspace files are read-only, but root (e.g. the titanite container) can still write through them
+    changed = dataset_snapshot.verify()
+    assert not changed, "{} wrote through hardlinks to the dataset snapshot, other workspaces see it: {}".format(request.node.nodeid, changed)
     """
-    yield
     test_case_name_parser = framework.Test_case_name_parser(request)
     destination = Path(__file__).parent.parent / "logs/TestCaseData" / test_case_name_parser.get_test_case_name()
     bash_command = "cp -r {} {}".format(data_path, destination)
     helper.subprocess_helper.run(bash_command)
     """
-    
-
-
-
-
-